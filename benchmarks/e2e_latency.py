@@ -0,0 +1,297 @@
+# benchmarks/e2e_latency.py
+#
+# End-to-end latency from a sensor edge to the dashboard SSE event.
+#
+#   python3 benchmarks/e2e_latency.py --sensor flame --trials 50
+#
+# The real EdgeInputs and scheduler, the peripheral's StateReporter, both
+# SerialLink ends, the master's state_sync and MqttGateway, and the Flask app
+# in web/server.py run in one process on top of the stand-ins in sim.py. Only
+# the wiring is done here; probes wrap the callbacks and the serial/broker
+# hooks without changing what the shipped code does.
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+from sim import SimEnvironment, decode_json_line
+from stats import print_table, summarize, write_json
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+STAGES = ["sensor", "state_tx", "uart_tx", "master_rx", "mqtt_publish", "web_rx", "sse"]
+
+PERIPHERAL_PORT = "sim-peripheral"
+MASTER_PORT = "sim-master"
+
+
+def _load(name: str, rel_path: str):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(_ROOT, rel_path))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+class Probe:
+    """First time each stage observes the value injected by the current trial."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._target: Optional[bool] = None
+        self._marks: Dict[str, float] = {}
+        self._done = threading.Event()
+
+    def begin(self, target: bool) -> float:
+        with self._lock:
+            self._target = target
+            self._marks = {}
+            self._done.clear()
+            t0 = time.perf_counter()
+            self._marks["edge"] = t0
+        return t0
+
+    def mark(self, stage: str, value) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            if self._target is None or bool(value) != self._target or stage in self._marks:
+                return
+            self._marks[stage] = now
+            if stage == STAGES[-1]:
+                self._done.set()
+
+    def wait(self, timeout: float) -> Optional[Dict[str, float]]:
+        if not self._done.wait(timeout):
+            return None
+        with self._lock:
+            self._target = None
+            return dict(self._marks)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sensor", choices=["pir", "hall", "flame"], default="flame")
+    parser.add_argument("--trials", type=int, default=40)
+    parser.add_argument("--gap-min", type=float, default=0.3, help="min idle seconds between edges")
+    parser.add_argument("--gap-max", type=float, default=1.2, help="max idle seconds between edges")
+    parser.add_argument("--timeout", type=float, default=5.0)
+    parser.add_argument("--poll", action="store_true", help="poll the input instead of using edge interrupts")
+    parser.add_argument(
+        "--metrics-sec", type=float, default=0.0, help="also send the peripheral's METRICS frames this often (0 = off)"
+    )
+    parser.add_argument("--json", dest="json_path", help="write the summary as JSON to this path")
+    args = parser.parse_args()
+
+    env = SimEnvironment()
+    env.install()
+
+    pcfg = _load("bench_peripheral_config", "peripheral_pi/config.py")
+    mcfg = _load("bench_master_config", "master_pi/config.py")
+    _load("adc", "peripheral_pi/adc.py")  # sensors.py imports it flat, as on the Pi
+    sensors = _load("bench_peripheral_sensors", "peripheral_pi/sensors.py")
+    sched_mod = _load("bench_peripheral_scheduler", "peripheral_pi/scheduler.py")
+    reporting = _load("bench_peripheral_reporting", "peripheral_pi/reporting.py")
+    p_uart = _load("bench_peripheral_uart_link", "peripheral_pi/uart_link.py")
+    m_uart = _load("bench_master_uart_link", "master_pi/uart_link.py")
+    m_mqtt = _load("bench_master_mqtt_gateway", "master_pi/mqtt_gateway.py")
+    state_sync = _load("bench_master_state_sync", "master_pi/state_sync.py")
+    p_state = _load("bench_peripheral_state", "peripheral_pi/system_state.py").state
+    m_state = _load("bench_master_state", "master_pi/system_state.py").state
+    web = _load("bench_web_server", "web/server.py")
+
+    probe = Probe()
+    gpio = env.gpio
+
+    sensor_specs = {
+        "pir": ("motion", pcfg.PIR_PIN, False),
+        "hall": ("door_closed", pcfg.HALL_PIN, bool(pcfg.HALL_ACTIVE_LOW)),
+        "flame": ("flame_detected", pcfg.FLAME_PIN, bool(pcfg.FLAME_ACTIVE_LOW)),
+    }
+    field, pin, active_low = sensor_specs[args.sensor]
+
+    def level_for(value: bool) -> int:
+        return int(not value) if active_low else int(value)
+
+    # --- wire probes -------------------------------------------------------
+    p_to_m, _m_to_p = env.serial_bus.connect(PERIPHERAL_PORT, MASTER_PORT, pcfg.SERIAL_BAUDRATE)
+
+    def frame_value(msg: Optional[dict]):
+        """Value of the benchmarked field carried by a STATE or EVENT frame, else None."""
+        if not msg:
+            return None
+        if msg.get("t") == "STATE":
+            return msg.get(field)
+        if msg.get("t") == "EVENT" and state_sync.PERIPHERAL_EVENTS.get(msg.get("name")) == field:
+            return msg.get("value")
+        return None
+
+    def on_uart_write(data: bytes) -> None:
+        value = frame_value(decode_json_line(data))
+        if value is not None:
+            probe.mark("uart_tx", value)
+
+    p_to_m.on_write = on_uart_write
+
+    state_topic = f"{mcfg.MQTT_BASE_TOPIC}/state"
+
+    def on_broker_publish(topic: str, payload: bytes) -> None:
+        if topic == state_topic:
+            probe.mark("mqtt_publish", json.loads(payload).get(field))
+
+    def on_broker_deliver(client_id: str, msg) -> None:
+        if client_id.endswith("-web") and msg.topic == state_topic:
+            probe.mark("web_rx", json.loads(msg.payload).get(field))
+
+    env.broker.on_publish = on_broker_publish
+    env.broker.on_deliver = on_broker_deliver
+
+    # --- peripheral (as wired in peripheral_pi/main.py) --------------------
+    p_link = p_uart.SerialLink(PERIPHERAL_PORT, pcfg.SERIAL_BAUDRATE, on_message=lambda _m: None, logger=lambda _s: None)
+
+    class ProbedLink:
+        """Marks state_tx as the reporter hands a frame to the link."""
+
+        def send(self, msg: dict) -> None:
+            value = frame_value(msg)
+            if value is not None:
+                probe.mark("state_tx", value)
+            p_link.send(msg)
+
+    state_rate = reporting.AdaptiveRate(
+        pcfg.STATE_HZ_ACTIVE,
+        pcfg.STATE_HZ_IDLE,
+        hold_sec=pcfg.STATE_ACTIVE_HOLD_SEC,
+        decay_sec=pcfg.STATE_DECAY_SEC,
+    )
+    reporter = reporting.StateReporter(p_state, ProbedLink(), state_rate)
+
+    def probed(on_change):
+        def handler(value: bool) -> None:
+            probe.mark("sensor", value)
+            on_change(value)
+
+        return handler
+
+    sched = sched_mod.Scheduler(logger=lambda _s: None)
+    inputs = sensors.make_inputs(
+        pcfg,
+        sched,
+        on_motion=probed(reporter.set_motion),
+        on_flame=probed(reporter.set_flame),
+        on_door_closed=probed(reporter.set_door_closed),
+        edge_detect=pcfg.GPIO_EDGE_DETECT and not args.poll,
+    )
+
+    # --- master (as wired in master_pi/main.py) ----------------------------
+    state_dirty = threading.Event()
+
+    def on_uart_message(msg: Dict) -> None:
+        value = frame_value(msg)
+        if value is not None:
+            probe.mark("master_rx", value)
+        if msg.get("t") == "STATE":
+            state_sync.apply_state(m_state, msg)
+        elif msg.get("t") == "EVENT" and state_sync.apply_event(m_state, msg) is not None:
+            state_dirty.set()
+
+    m_link = m_uart.SerialLink(MASTER_PORT, mcfg.SERIAL_BAUDRATE, on_message=on_uart_message, logger=lambda _s: None)
+    mqtt = m_mqtt.MqttGateway(
+        host=mcfg.MQTT_HOST,
+        port=mcfg.MQTT_PORT,
+        keepalive_sec=mcfg.MQTT_KEEPALIVE_SEC,
+        base_topic=mcfg.MQTT_BASE_TOPIC,
+        on_command=lambda _p, _v: None,
+        logger=lambda _s: None,
+    )
+
+    def mqtt_state_loop() -> None:
+        state_sync.publish_state_loop(
+            m_state,
+            mqtt.publish_state,
+            state_dirty,
+            publish_sec=mcfg.STATE_PUBLISH_SEC,
+            heartbeat_sec=mcfg.STATE_HEARTBEAT_SEC,
+        )
+
+    # --- web / SSE client --------------------------------------------------
+    def sse_reader() -> None:
+        client = web.app.test_client()
+        resp = client.get("/api/stream", buffered=False)
+        for chunk in resp.response:
+            text = chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+            for line in text.splitlines():
+                if line.startswith("data: "):
+                    probe.mark("sse", json.loads(line[6:]).get(field))
+
+    # --- run ---------------------------------------------------------------
+    gpio.setup(pin, gpio.IN, pull_up_down=gpio.PUD_UP if active_low else gpio.PUD_DOWN)
+    gpio.drive(pin, level_for(False))
+
+    p_link.start()
+    m_link.start()
+    mqtt.start()
+    web._ensure_mqtt_started()
+    inputs[args.sensor.upper()].start()
+    sched.every("STATE_TX", state_rate.active_sec, reporter.tick, priority=sched_mod.PRIO_REPORT)
+    if args.metrics_sec > 0:
+        # The whole process shares one registry, so this is a larger snapshot than the Pi's.
+        sched.every(
+            "METRICS_TX",
+            args.metrics_sec,
+            lambda: reporting.send_metrics(p_link, pcfg.METRICS_FRAME_BYTES),
+            priority=sched_mod.PRIO_REPORT,
+            lane="slow",
+        )
+    sched.start()
+    for target in (mqtt_state_loop, sse_reader):
+        threading.Thread(target=target, daemon=True).start()
+
+    # Let every loop settle on the idle value before the first edge.
+    time.sleep(2.0)
+
+    samples: Dict[str, list] = {s: [] for s in STAGES + ["total"]}
+    value = False
+    dropped = 0
+    for i in range(args.trials):
+        time.sleep(random.uniform(args.gap_min, args.gap_max))
+        value = not value
+        probe.begin(value)
+        gpio.drive(pin, level_for(value))
+        marks = probe.wait(args.timeout)
+        if marks is None:
+            dropped += 1
+            print(f"[BENCH] trial {i}: no SSE event within {args.timeout:.1f}s")
+            continue
+        prev = marks["edge"]
+        for stage in STAGES:
+            t = marks.get(stage, prev)
+            samples[stage].append(max(0.0, t - prev))
+            prev = max(prev, t)
+        samples["total"].append(marks["sse"] - marks["edge"])
+
+    rows = {name: summarize(vals) for name, vals in samples.items()}
+    print()
+    print_table(f"{args.sensor} edge -> SSE ({args.trials - dropped}/{args.trials} trials)", rows)
+
+    if args.json_path:
+        write_json(
+            args.json_path,
+            {
+                "sensor": args.sensor,
+                "trials": args.trials,
+                "dropped": dropped,
+                "stages": rows,
+            },
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+# benchmarks/face_pipeline.py
+#
+# Per-stage timing of the face unlock pipeline in master_pi/ai/face_engine.py.
+#
+#   python3 benchmarks/face_pipeline.py --images ~/faces --json run.json
+#   python3 benchmarks/face_pipeline.py --images master_pi/ai/dataset
+#   python3 benchmarks/face_pipeline.py --save-baseline benchmarks/face_baseline.json
+#   python3 benchmarks/face_pipeline.py --baseline benchmarks/face_baseline.json
+#
+# --images is searched recursively, so it can point at the enrolled dataset
+# (dataset/User_Name/*.jpg). Without it, synthetic 640x480 frames are generated. Without a trained
+# model next to face_engine.py (or with --synthetic-model), a random LBPH
+# model of --users x --samples is trained in a temp directory so the
+# recognition stages are timed at a realistic size. Frames with no detected
+# face are still pushed through ROI prep and matching with a centred box, so
+# every stage gets samples.
+#
+# Detection is timed through the engine's own prepare_detection and
+# run_detectors helpers, and the rest of the stage sequence mirrors
+# FaceEngine.verify_face_detailed. OpenCV is
+# pinned to one thread so throughput is per core. With --baseline, the run
+# exits non-zero if any stage's p50 regressed beyond --tolerance. With a
+# histogram store, the numpy query features of every benchmarked ROI are also
+# compared with OpenCV's own LBPH histograms; any difference fails the run.
+# Every benchmarked face is also prepared the way the engine used to (whole
+# frame enhanced, then cropped) and matched both ways; differing labels or
+# distances are reported and fail the run. The quality gate's measures
+# (master_pi/ai/quality.py) are summarised too, to calibrate its
+# SMARTHOME_FACE_* limits on photos taken at the door.
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from stats import print_table, summarize, write_json
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+from master_pi.ai import quality  # noqa: E402
+from master_pi.ai.detection import DetectionPlanner, postprocess  # noqa: E402
+from master_pi.ai.face_engine import FaceEngine  # noqa: E402
+from master_pi.ai.histogram_store import export_recognizer, lbp_histogram  # noqa: E402
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Stages shorter than this are not failed on relative slowdowns alone (timer noise).
+MIN_REGRESSION_SEC = 0.0005
+
+
+class TimedPlanner(DetectionPlanner):
+    """DetectionPlanner that also reports each cascade pass to the benchmark."""
+
+    def __init__(self, sink: Dict[str, List[float]]):
+        super().__init__()
+        self._sink = sink
+
+    def _record(self, name, seconds, hit):
+        super()._record(name, seconds, hit)
+        self._sink.setdefault(f"detect:{name}", []).append(seconds)
+
+
+def synthetic_frames(n: int, seed: int = 0) -> List[bytes]:
+    """Textured 640x480 JPEGs with a bright oval, sharp enough to pass the quality gate."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(n):
+        img = cv2.GaussianBlur(rng.integers(40, 200, (480, 640), dtype=np.uint8), (5, 5), 0)
+        cx, cy = 320 + int(rng.integers(-60, 60)), 240 + int(rng.integers(-40, 40))
+        cv2.ellipse(img, (cx, cy), (70, 95), 0, 0, 360, 190, -1)
+        cv2.circle(img, (cx - 25, cy - 20), 9, 40, -1)
+        cv2.circle(img, (cx + 25, cy - 20), 9, 40, -1)
+        cv2.ellipse(img, (cx, cy + 40), (30, 10), 0, 0, 180, 60, 3)
+        frames.append(cv2.imencode(".jpg", cv2.cvtColor(img, cv2.COLOR_GRAY2BGR))[1].tobytes())
+    return frames
+
+
+def load_frames(directory: str) -> List[bytes]:
+    frames = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(root, name), "rb") as f:
+                    frames.append(f.read())
+    return frames
+
+
+def synthetic_model(directory: str, users: int, samples: int, seed: int = 1) -> str:
+    """Train a random LBPH model + histogram store + labels in `directory`; returns model.yml path."""
+    rng = np.random.default_rng(seed)
+    images = [rng.integers(0, 255, (200, 200), dtype=np.uint8) for _ in range(users * samples)]
+    ids = np.repeat(np.arange(users, dtype=np.int32), samples)
+    recognizer = cv2.face.LBPHFaceRecognizer_create(radius=2, neighbors=8, grid_x=8, grid_y=8)
+    recognizer.train(images, ids)
+    model_path = os.path.join(directory, "model.yml")
+    recognizer.save(model_path)
+    export_recognizer(recognizer, os.path.splitext(model_path)[0])
+    with open(os.path.join(directory, "labels.json"), "w") as f:
+        json.dump({str(i): f"user{i}" for i in range(users)}, f)
+    return model_path
+
+
+def feature_parity(meta: Dict, rois: List[np.ndarray]) -> Dict[str, float]:
+    """Compare lbp_histogram() with the histograms OpenCV's LBPH computes for the same ROIs."""
+    reference = cv2.face.LBPHFaceRecognizer_create(
+        radius=meta["radius"], neighbors=meta["neighbors"], grid_x=meta["grid_x"], grid_y=meta["grid_y"]
+    )
+    reference.train(rois, np.zeros(len(rois), dtype=np.int32))
+    mismatched, max_diff = 0, 0.0
+    for roi, expected in zip(rois, reference.getHistograms()):
+        ours = lbp_histogram(roi, meta["radius"], meta["neighbors"], meta["grid_x"], meta["grid_y"])
+        expected = expected.reshape(-1)
+        if not np.array_equal(ours, expected):
+            mismatched += 1
+            max_diff = max(max_diff, float(np.abs(ours - expected).max()))
+    return {"rois": len(rois), "mismatched": mismatched, "max_abs_diff": max_diff}
+
+
+def preprocess_parity(engine: FaceEngine, crops: List[Tuple[np.ndarray, tuple, np.ndarray]]) -> Dict[str, float]:
+    """Match each (frame, face, ROI) against the ROI whole-frame preprocess_image() gives.
+
+    That was FaceEngine's recognition input before the enhancement moved to
+    the ROI, and is what the enrolled model was validated with.
+    """
+    model = engine.model
+    labels_differ, rois_differ, max_dist = 0, 0, 0.0
+    for gray, face, roi in crops:
+        x, y, w, h = (int(v) for v in face)
+        reference = cv2.equalizeHist(cv2.resize(engine.preprocess_image(gray)[y : y + h, x : x + w], (200, 200)))
+        if not np.array_equal(roi, reference):
+            rois_differ += 1
+        ids, ours = model.identity_distances(roi)
+        _, theirs = model.identity_distances(reference)
+        if int(ids[np.argmin(ours)]) != int(ids[np.argmin(theirs)]):
+            labels_differ += 1
+        max_dist = max(max_dist, float(np.abs(np.asarray(ours) - np.asarray(theirs)).max()))
+    return {"faces": len(crops), "rois_differ": rois_differ, "labels_differ": labels_differ, "max_distance_diff": max_dist}
+
+
+def quality_report(qualities: List[quality.FrameQuality]) -> Dict[str, object]:
+    """Spread of the quality measures, and what the gate rejects at its current limits."""
+    report: Dict[str, object] = {"frames": len(qualities), "rejected": {}}
+    for measure in ("brightness", "contrast", "sharpness"):
+        values = np.array([getattr(q, measure) for q in qualities])
+        report[measure] = {p: float(np.percentile(values, int(p[1:]))) for p in ("p5", "p50", "p95")}
+    for q in qualities:
+        if not q.ok:
+            report["rejected"][q.reason] = report["rejected"].get(q.reason, 0) + 1
+    return report
+
+
+def run_once(
+    engine: FaceEngine,
+    image_bytes: bytes,
+    samples: Dict[str, List[float]],
+    crops: Optional[List[Tuple[np.ndarray, tuple, np.ndarray]]] = None,
+    qualities: Optional[List[quality.FrameQuality]] = None,
+) -> None:
+    def timed(stage, fn, *args):
+        t0 = time.perf_counter()
+        out = fn(*args)
+        samples.setdefault(stage, []).append(time.perf_counter() - t0)
+        return out
+
+    t_start = time.perf_counter()
+    model = engine.model
+
+    gray = timed("decode", engine.decode_gray, image_bytes)
+    if gray is None:
+        return
+    q = timed("quality", quality.assess, gray)
+    if qualities is not None:
+        qualities.append(q)
+
+    # FaceEngine._detect, stage by stage
+    small, scale = timed("detect_prep", engine.prepare_detection, gray)
+    found = timed("detect", engine.run_detectors, small, scale)
+    faces, face = timed("postprocess", postprocess, [f for _, f in found], gray.shape, scale)
+    if face is None:
+        samples.setdefault("no_face", []).append(0.0)
+        h, w = gray.shape[:2]
+        side = min(h, w) // 2
+        face = ((w - side) // 2, (h - side) // 2, side, side)
+
+    roi = timed("roi", engine.extract_roi, gray, face)
+    if crops is not None:
+        crops.append((gray, face, roi))
+    if model.store is not None:
+        query = timed("features", model.store.features, roi)
+        dist = timed("distances", model.store.distances, query)
+        timed("rank", lambda: model.matcher.rank(dist))
+    else:
+        timed("predict", lambda: model.matcher.rank_identities(*model.identity_distances(roi)))
+
+    samples.setdefault("total", []).append(time.perf_counter() - t_start)
+
+
+def compare(rows: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    failures = []
+    for stage, base in baseline.items():
+        cur = rows.get(stage)
+        if not cur or not cur.get("n") or not base.get("n"):
+            continue
+        limit = base["p50"] * (1.0 + tolerance)
+        if cur["p50"] > limit and cur["p50"] - base["p50"] > MIN_REGRESSION_SEC:
+            failures.append(
+                f"{stage}: p50 {cur['p50'] * 1000:.2f}ms > baseline {base['p50'] * 1000:.2f}ms (+{tolerance:.0%})"
+            )
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", help="directory of JPEG/PNG frames (default: synthetic frames)")
+    parser.add_argument("--frames", type=int, default=30, help="synthetic frames to generate")
+    parser.add_argument("--rounds", type=int, default=3, help="passes over the frame set")
+    parser.add_argument("--synthetic-model", action="store_true", help="always use a random model")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=40, help="training samples per synthetic user")
+    parser.add_argument("--json", dest="json_path", help="write the summary as JSON to this path")
+    parser.add_argument("--save-baseline", help="write per-stage results as the new baseline")
+    parser.add_argument("--baseline", help="fail if any stage p50 regressed against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    cv2.setNumThreads(1)
+
+    frames = load_frames(args.images) if args.images else synthetic_frames(args.frames)
+    if not frames:
+        parser.error("no frames to run")
+
+    tmp = None
+    engine = FaceEngine()
+    if args.synthetic_model or not engine.model_loaded:
+        tmp = tempfile.TemporaryDirectory(prefix="face_bench_")
+        model_path = synthetic_model(tmp.name, args.users, args.samples)
+        engine = FaceEngine(model_path, os.path.join(tmp.name, "labels.json"), os.path.join(tmp.name, "thresholds.json"))
+        source = f"synthetic model {args.users}x{args.samples}"
+    else:
+        source = f"trained model ({len(engine.labels)} users)"
+
+    samples: Dict[str, List[float]] = {}
+    engine.planner = TimedPlanner(samples)
+
+    run_once(engine, frames[0], samples)  # warm caches and lazy allocations
+    samples.clear()
+    crops: List[Tuple[np.ndarray, tuple, np.ndarray]] = []
+    qualities: List[quality.FrameQuality] = []
+    for r in range(args.rounds):
+        for image_bytes in frames:
+            run_once(engine, image_bytes, samples, crops if r == 0 else None, qualities if r == 0 else None)
+
+    order = ["decode", "quality", "detect_prep", "detect"]
+    order += sorted(k for k in samples if k.startswith("detect:"))
+    order += ["postprocess", "roi", "features", "distances", "rank", "predict", "total"]
+    rows = {name: summarize(samples[name]) for name in order if name in samples}
+    total = rows["total"]
+    per_core = 1.0 / total["mean"] if total["n"] else 0.0
+    no_face = len(samples.get("no_face", []))
+
+    print()
+    print_table(f"face pipeline, {len(frames)} frame(s) x {args.rounds}, {source}", rows)
+    print(f"  throughput {per_core:.1f} frames/s per core; {no_face}/{total['n']} frame(s) without a detected face")
+
+    result = {"frames": len(frames), "rounds": args.rounds, "source": source, "per_core_fps": per_core, "stages": rows}
+    status = 0
+    qr = quality_report(qualities)
+    result["quality"] = qr
+    rejected = ", ".join(f"{reason} {n}" for reason, n in sorted(qr["rejected"].items())) or "none"
+    print(
+        "  quality p5/p50/p95: "
+        + "; ".join(
+            f"{m} {qr[m]['p5']:.0f}/{qr[m]['p50']:.0f}/{qr[m]['p95']:.0f}" for m in ("brightness", "contrast", "sharpness")
+        )
+        + f"; rejected at current limits: {rejected}"
+    )
+    prep = preprocess_parity(engine, crops)
+    result["preprocess_parity"] = prep
+    if prep["rois_differ"] or prep["labels_differ"]:
+        print(
+            f"  PREPROCESSING DRIFT: {prep['rois_differ']}/{prep['faces']} ROI(s) differ from whole-frame "
+            f"preprocessing, {prep['labels_differ']} label(s) changed, max distance diff {prep['max_distance_diff']:.3g}"
+        )
+        status = 1
+    else:
+        print(f"  ROIs, labels and distances identical to whole-frame preprocessing on {prep['faces']} face(s)")
+    if engine.model.store is not None and crops:
+        parity = feature_parity(engine.model.store.meta, [roi for _, _, roi in crops])
+        result["feature_parity"] = parity
+        if parity["mismatched"]:
+            print(
+                f"  FEATURE MISMATCH: {parity['mismatched']}/{parity['rois']} ROI(s) differ from OpenCV LBPH "
+                f"(max {parity['max_abs_diff']:.3g})"
+            )
+            status = 1
+        else:
+            print(f"  features bit-identical to OpenCV LBPH on {parity['rois']} ROI(s)")
+    if args.json_path:
+        write_json(args.json_path, result)
+    if args.save_baseline:
+        write_json(args.save_baseline, result)
+        print(f"  baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = compare(rows, baseline.get("stages", {}), args.tolerance)
+        if failures:
+            print("REGRESSION:")
+            for line in failures:
+                print(f"  {line}")
+            status = 1
+        else:
+            print(f"  no stage slower than baseline +{args.tolerance:.0%}")
+
+    if tmp is not None:
+        tmp.cleanup()
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
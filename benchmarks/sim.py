@@ -0,0 +1,391 @@
+# benchmarks/sim.py
+#
+# In-process stand-ins for the hardware and the broker so the real
+# peripheral / master / web modules can be driven on a development machine.
+# Install them with `install()` *before* loading any project module.
+
+import json
+import sys
+import threading
+import time
+import types
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+# ---------------------------------------------------------------------------
+# RPi.GPIO
+# ---------------------------------------------------------------------------
+
+
+class SimGpio(types.ModuleType):
+    """Subset of RPi.GPIO with levels that a benchmark can drive.
+
+    Edge callbacks run on a single dispatcher thread, like the real library.
+    """
+
+    BCM = 11
+    BOARD = 10
+    IN = 1
+    OUT = 0
+    HIGH = 1
+    LOW = 0
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        super().__init__("RPi.GPIO")
+        self._levels: Dict[int, int] = {}
+        self._edges: Dict[int, int] = {}
+        self._callbacks: Dict[int, List[Callable[[int], None]]] = {}
+        self._lock = threading.Lock()
+        self._pending: List[int] = []
+        self._wake = threading.Condition(self._lock)
+        threading.Thread(target=self._dispatch, name="SIM_GPIO", daemon=True).start()
+
+    def setwarnings(self, _flag: bool) -> None:
+        pass
+
+    def setmode(self, _mode: int) -> None:
+        pass
+
+    def setup(self, pin: int, mode: int, pull_up_down: int = PUD_OFF, initial: Optional[int] = None) -> None:
+        with self._lock:
+            if mode == self.OUT:
+                self._levels[pin] = initial if initial is not None else self.LOW
+            elif pin not in self._levels:
+                self._levels[pin] = self.HIGH if pull_up_down == self.PUD_UP else self.LOW
+
+    def input(self, pin: int) -> int:
+        return self._levels.get(pin, self.LOW)
+
+    def output(self, pin: int, value: int) -> None:
+        self._levels[pin] = self.HIGH if value else self.LOW
+
+    def add_event_detect(self, pin: int, edge: int, callback=None, bouncetime: Optional[int] = None) -> None:
+        with self._lock:
+            if pin in self._edges:
+                raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+            self._edges[pin] = edge
+            self._callbacks[pin] = [callback] if callback is not None else []
+
+    def add_event_callback(self, pin: int, callback) -> None:
+        with self._lock:
+            if pin not in self._edges:
+                raise RuntimeError("Add event detection using add_event_detect first before adding a callback")
+            self._callbacks[pin].append(callback)
+
+    def remove_event_detect(self, pin: int) -> None:
+        with self._lock:
+            self._edges.pop(pin, None)
+            self._callbacks.pop(pin, None)
+
+    def cleanup(self, pin: Optional[int] = None) -> None:
+        with self._lock:
+            if pin is None:
+                self._edges.clear()
+                self._callbacks.clear()
+            else:
+                self._edges.pop(pin, None)
+                self._callbacks.pop(pin, None)
+
+    # -- benchmark side -----------------------------------------------------
+
+    def drive(self, pin: int, level: int) -> None:
+        """Set an input level as the physical sensor would."""
+        with self._lock:
+            old = self._levels.get(pin, self.LOW)
+            self._levels[pin] = level
+            edge = self._edges.get(pin)
+            if edge is None or old == level:
+                return
+            rising = level == self.HIGH
+            if edge == self.BOTH or (edge == self.RISING and rising) or (edge == self.FALLING and not rising):
+                self._pending.append(pin)
+                self._wake.notify()
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._wake:
+                while not self._pending:
+                    self._wake.wait()
+                pin = self._pending.pop(0)
+                callbacks = list(self._callbacks.get(pin, ()))
+            for cb in callbacks:
+                try:
+                    cb(pin)
+                except Exception as e:
+                    print(f"[SIM] GPIO callback error on pin {pin}: {e}")
+
+
+# ---------------------------------------------------------------------------
+# pyserial
+# ---------------------------------------------------------------------------
+
+
+class SerialException(OSError):
+    pass
+
+
+class _Wire:
+    """One direction of a null-modem cable with 8N1 byte timing."""
+
+    def __init__(self, baudrate: int):
+        self._byte_sec = 10.0 / float(baudrate)
+        self._busy_until = 0.0
+        self._frames: List[Tuple[float, bytes]] = []
+        self._buf = b""
+        self._cond = threading.Condition()
+        self.on_write: Optional[Callable[[bytes], None]] = None
+
+    def write(self, data: bytes) -> None:
+        if self.on_write is not None:
+            self.on_write(data)
+        with self._cond:
+            start = max(time.perf_counter(), self._busy_until)
+            self._busy_until = start + len(data) * self._byte_sec
+            self._frames.append((self._busy_until, data))
+            self._cond.notify_all()
+
+    def drain(self) -> None:
+        """Block until everything written so far is on the wire (tcdrain)."""
+        with self._cond:
+            remaining = self._busy_until - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def readline(self, timeout: Optional[float]) -> bytes:
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self._cond:
+            while True:
+                now = time.perf_counter()
+                while self._frames and self._frames[0][0] <= now:
+                    self._buf += self._frames.pop(0)[1]
+                idx = self._buf.find(b"\n")
+                if idx >= 0:
+                    line, self._buf = self._buf[: idx + 1], self._buf[idx + 1 :]
+                    return line
+                wake = self._frames[0][0] if self._frames else None
+                if deadline is not None:
+                    if now >= deadline:
+                        return b""
+                    wake = deadline if wake is None else min(wake, deadline)
+                self._cond.wait(None if wake is None else max(0.0, wake - now))
+
+
+class SimSerialBus:
+    """Registry of virtual ports; `connect(a, b)` cross-wires two of them."""
+
+    def __init__(self):
+        self._rx: Dict[str, _Wire] = {}
+        self._tx: Dict[str, _Wire] = {}
+
+    def connect(self, port_a: str, port_b: str, baudrate: int) -> Tuple[_Wire, _Wire]:
+        a_to_b = _Wire(baudrate)
+        b_to_a = _Wire(baudrate)
+        self._tx[port_a], self._rx[port_b] = a_to_b, a_to_b
+        self._tx[port_b], self._rx[port_a] = b_to_a, b_to_a
+        return a_to_b, b_to_a
+
+    def open(self, port: str) -> Tuple[_Wire, _Wire]:
+        if port not in self._rx:
+            raise SerialException(f"could not open port {port}: no such sim port")
+        return self._rx[port], self._tx[port]
+
+
+class _SimSerial:
+    def __init__(self, bus: SimSerialBus, port: str, baudrate: int = 9600, timeout=None, write_timeout=None):
+        self._rx, self._tx = bus.open(port)
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+
+    def readline(self) -> bytes:
+        return self._rx.readline(self.timeout)
+
+    def write(self, data: bytes) -> int:
+        self._tx.write(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        self._tx.drain()
+
+    def close(self) -> None:
+        pass
+
+
+def _make_serial_module(bus: SimSerialBus) -> types.ModuleType:
+    mod = types.ModuleType("serial")
+    mod.SerialException = SerialException
+    mod.Serial = lambda port, baudrate=9600, **kw: _SimSerial(bus, port, baudrate, **kw)
+    return mod
+
+
+# ---------------------------------------------------------------------------
+# paho-mqtt + broker
+# ---------------------------------------------------------------------------
+
+
+class _Message:
+    def __init__(self, topic: str, payload: bytes, retain: bool):
+        self.topic = topic
+        self.payload = payload
+        self.retain = retain
+        self.qos = 0
+
+
+def _topic_matches(pattern: str, topic: str) -> bool:
+    p_parts = pattern.split("/")
+    t_parts = topic.split("/")
+    for i, p in enumerate(p_parts):
+        if p == "#":
+            return True
+        if i >= len(t_parts):
+            return False
+        if p != "+" and p != t_parts[i]:
+            return False
+    return len(p_parts) == len(t_parts)
+
+
+class SimBroker:
+    """Loss-free in-process broker with retained messages.
+
+    `on_publish(topic, payload)` and `on_deliver(client_id, msg)` hooks let the
+    benchmark timestamp the broker hop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[str, "_SimClient"] = {}
+        self._retained: Dict[str, _Message] = {}
+        self.on_publish: Optional[Callable[[str, bytes], None]] = None
+        self.on_deliver: Optional[Callable[[str, _Message], None]] = None
+
+    def attach(self, client: "_SimClient") -> None:
+        with self._lock:
+            self._clients[client.client_id] = client
+
+    def subscribe(self, client: "_SimClient", pattern: str) -> None:
+        with self._lock:
+            retained = [m for t, m in self._retained.items() if _topic_matches(pattern, t)]
+        for m in retained:
+            client._inbox_put(m)
+
+    def publish(self, topic: str, payload: bytes, retain: bool) -> None:
+        if self.on_publish is not None:
+            self.on_publish(topic, payload)
+        msg = _Message(topic, payload, retain)
+        with self._lock:
+            if retain:
+                self._retained[topic] = msg
+            targets = [c for c in self._clients.values() if any(_topic_matches(p, topic) for p in c.subscriptions)]
+        for c in targets:
+            c._inbox_put(msg)
+
+
+class _SimClient:
+    def __init__(self, broker: SimBroker, client_id: str = "", **_kw):
+        self._broker = broker
+        self.client_id = client_id or f"sim-{id(self)}"
+        self.subscriptions: List[str] = []
+        self.on_connect = None
+        self.on_message = None
+        self.on_disconnect = None
+        self._inbox: List[_Message] = []
+        self._cond = threading.Condition()
+        self._running = False
+
+    def enable_logger(self, *_a, **_kw) -> None:
+        pass
+
+    def will_set(self, *_a, **_kw) -> None:
+        pass
+
+    def reconnect_delay_set(self, *_a, **_kw) -> None:
+        pass
+
+    def connect(self, _host: str, _port: int = 1883, keepalive: int = 60) -> int:
+        self._broker.attach(self)
+        return 0
+
+    def loop_start(self) -> None:
+        self._running = True
+        threading.Thread(target=self._loop, name=f"SIM_MQTT_{self.client_id}", daemon=True).start()
+
+    def loop_stop(self) -> None:
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+
+    def disconnect(self) -> None:
+        pass
+
+    def subscribe(self, topic: str, qos: int = 0):
+        self.subscriptions.append(topic)
+        self._broker.subscribe(self, topic)
+        return 0, 1
+
+    def publish(self, topic: str, payload=None, qos: int = 0, retain: bool = False):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        self._broker.publish(topic, payload or b"", retain)
+
+    def _inbox_put(self, msg: _Message) -> None:
+        with self._cond:
+            self._inbox.append(msg)
+            self._cond.notify()
+
+    def _loop(self) -> None:
+        if self.on_connect is not None:
+            self.on_connect(self, None, {}, 0)
+        while self._running:
+            with self._cond:
+                while self._running and not self._inbox:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                msg = self._inbox.pop(0)
+            if self._broker.on_deliver is not None:
+                self._broker.on_deliver(self.client_id, msg)
+            if self.on_message is not None:
+                self.on_message(self, None, msg)
+
+
+def _make_paho_modules(broker: SimBroker) -> Dict[str, types.ModuleType]:
+    paho = types.ModuleType("paho")
+    paho_mqtt = types.ModuleType("paho.mqtt")
+    client_mod = types.ModuleType("paho.mqtt.client")
+    client_mod.Client = lambda client_id="", **kw: _SimClient(broker, client_id, **kw)
+    client_mod.MQTTMessage = _Message
+    paho.mqtt = paho_mqtt
+    paho_mqtt.client = client_mod
+    return {"paho": paho, "paho.mqtt": paho_mqtt, "paho.mqtt.client": client_mod}
+
+
+# ---------------------------------------------------------------------------
+
+
+class SimEnvironment:
+    def __init__(self):
+        self.gpio = SimGpio()
+        self.serial_bus = SimSerialBus()
+        self.broker = SimBroker()
+
+    def install(self) -> None:
+        rpi = types.ModuleType("RPi")
+        rpi.GPIO = self.gpio
+        sys.modules["RPi"] = rpi
+        sys.modules["RPi.GPIO"] = self.gpio
+        sys.modules["serial"] = _make_serial_module(self.serial_bus)
+        sys.modules.update(_make_paho_modules(self.broker))
+
+
+def decode_json_line(line: bytes) -> Optional[dict]:
+    try:
+        msg = json.loads(line.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return None
+    return msg if isinstance(msg, dict) else None
@@ -0,0 +1,47 @@
+# benchmarks/stats.py
+
+import json
+import math
+from typing import Dict, Iterable, List, Sequence
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Linear-interpolated percentile of an already sorted sequence."""
+    if not sorted_values:
+        return float("nan")
+    if len(sorted_values) == 1:
+        return float(sorted_values[0])
+    k = (len(sorted_values) - 1) * (pct / 100.0)
+    lo = math.floor(k)
+    hi = math.ceil(k)
+    if lo == hi:
+        return float(sorted_values[int(k)])
+    return float(sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo))
+
+
+def summarize(values: Iterable[float]) -> Dict[str, float]:
+    vals: List[float] = sorted(values)
+    if not vals:
+        return {"n": 0, "p50": float("nan"), "p99": float("nan"), "max": float("nan"), "mean": float("nan")}
+    return {
+        "n": len(vals),
+        "p50": percentile(vals, 50),
+        "p99": percentile(vals, 99),
+        "max": vals[-1],
+        "mean": sum(vals) / len(vals),
+    }
+
+
+def print_table(title: str, rows: Dict[str, Dict[str, float]], *, scale: float = 1000.0, unit: str = "ms") -> None:
+    print(title)
+    print(f"  {'stage':<22} {'n':>5} {'p50':>10} {'p99':>10} {'max':>10}")
+    for name, s in rows.items():
+        print(
+            f"  {name:<22} {int(s['n']):>5} "
+            f"{s['p50'] * scale:>8.1f}{unit} {s['p99'] * scale:>8.1f}{unit} {s['max'] * scale:>8.1f}{unit}"
+        )
+
+
+def write_json(path: str, obj: dict) -> None:
+    with open(path, "w") as f:
+        json.dump(obj, f, indent=2, sort_keys=True)
@@ -0,0 +1,126 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from utils.metrics import registry
+
+# Short-lived cache of face decisions.
+#
+# The unlock button gets pressed several times in a row, and each press sends
+# almost the same frames a few hundred milliseconds after the last. Each
+# submission is keyed by a 64-bit difference hash (dHash) of every frame,
+# taken from a 1/8-scale decode, which costs a fraction of a millisecond.
+# A later submission whose frames are all within MAX_DISTANCE bits of a
+# cached one, under the same model version and within the TTL, gets the
+# cached decision without running detection or matching.
+#
+# Only denials are shared between similar frames. A grant is reused only for
+# byte-identical frames (same SHA-256), so a grant can never carry over to a
+# different picture.
+
+_LOOKUPS = registry.counter("face_decision_cache_total", "Face decision cache lookups by result.", ["result"])
+
+HASH_SIZE = 8  # 8x8 gradient bits = 64-bit hash
+
+
+def frame_hash(image_bytes: bytes) -> Optional[int]:
+    """dHash of an encoded frame, or None if it cannot be decoded."""
+    buf = np.frombuffer(image_bytes, dtype=np.uint8)
+    gray = cv2.imdecode(buf, cv2.IMREAD_REDUCED_GRAYSCALE_8) if buf.size else None
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+@dataclass(frozen=True)
+class FrameKey:
+    hashes: Tuple[int, ...]
+    digest: bytes  # SHA-256 over every frame's bytes
+
+
+@dataclass
+class _Entry:
+    key: FrameKey
+    version: int
+    result: object
+    expires: float
+
+
+class DecisionCache:
+    MAX_DISTANCE = 6  # differing dHash bits still treated as the same scene
+
+    def __init__(self, ttl_sec=2.0, max_entries=16, max_distance=MAX_DISTANCE):
+        self.ttl_sec = float(ttl_sec)
+        self.max_entries = max(1, int(max_entries))
+        self.max_distance = int(max_distance)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[FrameKey, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(frames: Sequence[bytes]) -> Optional[FrameKey]:
+        """Cache key for a submission, or None if any frame does not decode (never cached)."""
+        hashes = []
+        digest = hashlib.sha256()
+        for data in frames:
+            h = frame_hash(data)
+            if h is None:
+                return None
+            hashes.append(h)
+            digest.update(len(data).to_bytes(8, "big"))
+            digest.update(data)
+        return FrameKey(tuple(hashes), digest.digest()) if hashes else None
+
+    def _similar(self, a: FrameKey, b: FrameKey) -> bool:
+        if len(a.hashes) != len(b.hashes):
+            return False
+        return all(bin(x ^ y).count("1") <= self.max_distance for x, y in zip(a.hashes, b.hashes))
+
+    def get(self, key: FrameKey, version: int):
+        """Cached decision for `key` under model `version`, or None."""
+        now = time.monotonic()
+        with self._lock:
+            found = None
+            for k, entry in list(self._entries.items()):
+                if entry.expires <= now or entry.version != version:
+                    del self._entries[k]
+                    continue
+                if found is not None or not self._similar(key, k):
+                    continue
+                if getattr(entry.result, "authorized", False) and k.digest != key.digest:
+                    continue
+                found = entry
+            if found is None:
+                self.misses += 1
+                _LOOKUPS.labels("miss").inc()
+                return None
+            self._entries.move_to_end(found.key)
+            self.hits += 1
+            _LOOKUPS.labels("hit").inc()
+            return found.result
+
+    def put(self, key: FrameKey, version: int, result) -> None:
+        with self._lock:
+            self._entries[key] = _Entry(key, version, result, time.monotonic() + self.ttl_sec)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
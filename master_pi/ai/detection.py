@@ -0,0 +1,245 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from utils.metrics import registry
+
+# Adaptive Haar cascade planner.
+#
+# Detection used to run every strategy on every frame. The planner runs them
+# one at a time, cheapest expected cost first, and stops as soon as a pass
+# returns a single face the cascade is confident about. Per-strategy hit rate
+# and run time are tracked so the order follows what works for this camera.
+
+_PASSES = registry.histogram(
+    "face_detect_passes", "Cascade passes run per detection.", buckets=(1, 2, 3, 4, 5, 6)
+)
+_HITS = registry.counter("face_detect_hits_total", "Confident single-face detections by strategy.", ["strategy"])
+
+
+def _scaled(size: Tuple[int, int], scale: float) -> Tuple[int, int]:
+    return max(1, int(round(size[0] * scale))), max(1, int(round(size[1] * scale)))
+
+
+def downscale(gray, max_width: int):
+    """Shrink `gray` to at most `max_width` pixels wide. Returns (image, scale)."""
+    h, w = gray.shape[:2]
+    if w <= max_width:
+        return gray, 1.0
+    scale = max_width / float(w)
+    small = cv2.resize(gray, (max_width, max(1, int(round(h * scale)))), interpolation=cv2.INTER_AREA)
+    return small, scale
+
+
+@dataclass(frozen=True)
+class Strategy:
+    name: str
+    cascade: str  # key into the cascades dict: "default" or "alt"
+    scale_factor: float
+    min_neighbors: int
+    min_size: Tuple[int, int]
+    max_size: Optional[Tuple[int, int]] = None
+
+
+# Declared roughly cheapest first; this is the order until every strategy has
+# been timed at least once.
+DEFAULT_STRATEGIES = (
+    # Coarse scale steps with a size cap, also catches distant faces
+    Strategy("wide_range", "default", 1.2, 3, (30, 30), (400, 400)),
+    # Standard detection (balanced)
+    Strategy("standard", "default", 1.1, 4, (50, 50)),
+    # Alternative cascade if available
+    Strategy("alternative", "alt", 1.1, 3, (50, 50)),
+    # More sensitive detection (smaller scale factor = more thorough)
+    Strategy("sensitive", "default", 1.05, 3, (40, 40)),
+)
+
+
+@dataclass
+class StrategyStats:
+    runs: int = 0
+    hits: int = 0
+    cost: float = 0.0  # EWMA of pass time in seconds
+
+    def expected_cost(self) -> float:
+        # Cost of one success: pass time over (smoothed) hit rate.
+        hit_rate = (self.hits + 1) / (self.runs + 2)
+        return self.cost / hit_rate
+
+
+class DetectionPlanner:
+    # detectMultiScale2 reports how many raw windows were grouped into each box;
+    # a real, frontal face typically collects well over this many.
+    CONFIDENT_NEIGHBORS = 8
+    COST_ALPHA = 0.2
+
+    def __init__(self, strategies=DEFAULT_STRATEGIES):
+        self.strategies = list(strategies)
+        self.stats: Dict[str, StrategyStats] = {s.name: StrategyStats() for s in self.strategies}
+        self._lock = threading.Lock()
+
+    def order(self, strategies: Optional[List[Strategy]] = None) -> List[Strategy]:
+        """`strategies` (default: all) in the order to try them.
+
+        Pass only the strategies that can run, so one whose cascade failed to
+        load doesn't keep the declared order in place forever.
+        """
+        strategies = self.strategies if strategies is None else strategies
+        with self._lock:
+            if any(self.stats[s.name].runs == 0 for s in strategies):
+                return list(strategies)
+            return sorted(strategies, key=lambda s: self.stats[s.name].expected_cost())
+
+    def _record(self, name: str, seconds: float, hit: bool) -> None:
+        with self._lock:
+            st = self.stats[name]
+            st.cost = seconds if st.runs == 0 else st.cost + self.COST_ALPHA * (seconds - st.cost)
+            st.runs += 1
+            if hit:
+                st.hits += 1
+
+    def run(self, gray, cascades, scale: float = 1.0) -> List[Tuple[str, object]]:
+        """Run strategies until one is confident. Returns [(name, faces)] for every pass that found something.
+
+        `scale` is the size of `gray` relative to the original frame; the
+        strategies' size limits are in original-frame pixels and are scaled to match.
+        """
+        found = []
+        passes = 0
+        usable = [s for s in self.strategies if cascades.get(s.cascade) is not None]
+        for strategy in self.order(usable):
+            cascade = cascades[strategy.cascade]
+            kwargs = {}
+            if strategy.max_size is not None:
+                kwargs["maxSize"] = _scaled(strategy.max_size, scale)
+            t0 = time.perf_counter()
+            faces, neighbors = cascade.detectMultiScale2(
+                gray,
+                scaleFactor=strategy.scale_factor,
+                minNeighbors=strategy.min_neighbors,
+                minSize=_scaled(strategy.min_size, scale),
+                flags=cv2.CASCADE_SCALE_IMAGE,
+                **kwargs,
+            )
+            passes += 1
+            confident = len(faces) == 1 and int(neighbors[0]) >= self.CONFIDENT_NEIGHBORS
+            self._record(strategy.name, time.perf_counter() - t0, confident)
+            if len(faces) > 0:
+                found.append((strategy.name, faces))
+            if confident:
+                _HITS.labels(strategy.name).inc()
+                logging.debug(f"Detection: confident face from '{strategy.name}' after {passes} pass(es)")
+                break
+        _PASSES.observe(passes)
+        return found
+
+
+class RoiTracker:
+    """Follows one face box across consecutive frames with template matching.
+
+    Much cheaper than re-running the cascades: the previous face patch is
+    searched for only in a window around its last position, on the same
+    reduced copy detection uses.
+    """
+
+    MIN_SCORE = 0.6  # TM_CCOEFF_NORMED below this counts as lost
+    SEARCH = 0.5  # search margin, as a fraction of the box size
+
+    def __init__(self, max_width: int):
+        self.max_width = max_width
+        self.active = False
+        self._template = None
+        self._box = None  # (x, y, w, h) in reduced coordinates
+
+    def start(self, gray, box) -> None:
+        small, scale = downscale(gray, self.max_width)
+        x, y, w, h = (int(round(v * scale)) for v in box)
+        w, h = max(1, w), max(1, h)
+        self._template = small[y : y + h, x : x + w].copy()
+        self._box = (x, y, w, h)
+        self.active = self._template.size > 0
+
+    def update(self, gray):
+        """Full-resolution box of the face in `gray`, or None when it was lost."""
+        small, scale = downscale(gray, self.max_width)
+        x, y, w, h = self._box
+        mx, my = int(w * self.SEARCH), int(h * self.SEARCH)
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1, y1 = min(small.shape[1], x + w + mx), min(small.shape[0], y + h + my)
+        window = small[y0:y1, x0:x1]
+        if window.shape[0] < h or window.shape[1] < w:
+            self.active = False
+            return None
+
+        scores = cv2.matchTemplate(window, self._template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (dx, dy) = cv2.minMaxLoc(scores)
+        if score < self.MIN_SCORE:
+            logging.debug(f"Tracker lost the face (score {score:.2f}); re-detecting.")
+            self.active = False
+            return None
+
+        nx, ny = x0 + dx, y0 + dy
+        self._template = small[ny : ny + h, nx : nx + w].copy()
+        self._box = (nx, ny, w, h)
+        inv = 1.0 / scale
+        return (int(round(nx * inv)), int(round(ny * inv)), int(round(w * inv)), int(round(h * inv)))
+
+
+# --- post-processing -----------------------------------------------------------
+#
+# All array operations: the sensitive strategies can return dozens of raw
+# boxes on a busy frame, and per-box Python loops cost more than the NMS itself.
+
+NMS_IOU = 0.5
+
+
+def merge_boxes(detection_lists, iou_threshold: float = NMS_IOU):
+    """Non-maximum suppression over every pass's (x, y, w, h) boxes, larger boxes winning.
+
+    Returns an (N, 4) int array, largest first.
+    """
+    lists = [np.asarray(d, dtype=np.int32).reshape(-1, 4) for d in detection_lists if len(d)]
+    if not lists:
+        return np.empty((0, 4), dtype=np.int32)
+    boxes = np.concatenate(lists)
+    # Larger faces = higher confidence
+    areas = (boxes[:, 2] * boxes[:, 3]).astype(np.float32)
+    keep = np.asarray(cv2.dnn.NMSBoxes(boxes, areas, 0.0, iou_threshold), dtype=np.int64).reshape(-1)
+    return boxes[keep]
+
+
+def face_scores(boxes, img_shape):
+    """Score (N, 4) boxes: centered, larger and closer to square is better."""
+    img_h, img_w = img_shape[:2]
+    x, y, w, h = (boxes[:, i].astype(np.int64) for i in range(4))
+    # Distance of the face center from the image center (normalized)
+    dist = np.hypot((x + w // 2 - img_w // 2) / img_w, (y + h // 2 - img_h // 2) / img_h)
+    size = (w * h) / float(img_w * img_h)
+    aspect = np.divide(w, h, out=np.zeros(len(boxes)), where=h > 0)
+    return (1.0 - dist) * 0.4 + size * 0.4 + (1.0 - np.abs(aspect - 1.0)) * 0.2
+
+
+def postprocess(detection_lists, img_shape, scale: float = 1.0):
+    """Merge, rescale and rank the boxes of all passes in one go.
+
+    `img_shape` is the full-resolution frame shape and `scale` the size of the
+    detection copy relative to it. Returns (faces, best): full-resolution
+    boxes and the best-scoring one (None when there are none).
+    """
+    faces = merge_boxes(detection_lists)
+    if not len(faces):
+        return faces, None
+    if scale != 1.0:
+        # Map boxes back to full-resolution coordinates
+        faces = np.round(faces / scale).astype(np.int32)
+    if len(faces) == 1:
+        return faces, faces[0]
+    scores = face_scores(faces, img_shape)
+    best = int(np.argmax(scores))
+    logging.debug(f"Selected face {best} from {len(faces)} candidates (score: {scores[best]:.3f})")
+    return faces, faces[best]
@@ -1,25 +1,154 @@
 import cv2
 import numpy as np
 import os
+import sys
 import json
 import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+if __package__ in (None, ""):
+    # Running as a script: make the repo root importable for utils.*
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from master_pi.ai.detection import DetectionPlanner, RoiTracker, downscale, face_scores, merge_boxes, postprocess
+from master_pi.ai.histogram_store import HistogramStore, store_exists
+from master_pi.ai.matcher import Candidate, IdentityMatcher
+from master_pi.ai import quality
+from utils.metrics import registry
+
+_VERIFY_SECONDS = registry.histogram("face_verify_seconds", "Wall time of FaceEngine.verify_face.")
+_VERIFY_RESULTS = registry.counter("face_verify_total", "Face verifications by outcome.", ["result"])
+_MODEL_VERSION = registry.gauge("face_model_version", "Generation of the loaded face model (bumped on reload).")
+_MODEL_LOAD_SECONDS = registry.gauge("face_model_load_seconds", "Time to load the current face model generation.")
+_MODEL_RELOADS = registry.counter("face_model_reloads_total", "Face model reloads by result.", ["result"])
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+
+@dataclass
+class FaceResult:
+    """Outcome of one verification, with the ranking behind it."""
+    authorized: bool
+    name: Optional[str] = None
+    reason: str = ""
+    distance: Optional[float] = None
+    margin: Optional[float] = None
+    ambiguous: bool = False
+    candidates: List[Candidate] = field(default_factory=list)
+    frames: int = 1  # frames that contributed to the decision
+    detail: Optional[str] = None  # e.g. the failing measure of a quality rejection
+
+
+def _jpeg_size(data):
+    """(width, height) from a JPEG's SOF header without decoding it, or None."""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    n = len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        seg_len = (data[i + 2] << 8) | data[i + 3]
+        # SOF0..SOF15, excluding DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + seg_len
+    return None
+
+
+class FaceModel:
+    """One generation of recognition data (labels, thresholds, histograms). Not modified once loaded."""
+
+    def __init__(self, version=0):
+        self.version = version
+        self.labels = {}
+        self.thresholds = {}
+        self.store = None  # HistogramStore when the binary export is present
+        self.recognizer = None  # LBPH model.yml fallback
+        self.matcher = None
+        self.load_seconds = 0.0
+
+    @property
+    def loaded(self):
+        return self.matcher is not None
+
+    def identity_distances(self, roi_gray):
+        if self.store is not None:
+            return self.matcher.reduce(self.store.distances(self.store.features(roi_gray)))
+        # model.yml path: collect every per-sample distance instead of only the best.
+        collector = cv2.face.StandardCollector_create()
+        self.recognizer.predict_collect(roi_gray, collector)
+        results = collector.getResults(sorted=False)
+        ids = np.fromiter((label for label, _ in results), dtype=np.int32, count=len(results))
+        dists = np.fromiter((d for _, d in results), dtype=np.float64, count=len(results))
+        return self.matcher.reduce(dists, ids)
+
+
 class FaceEngine:
-    def __init__(self, model_path='model.yml', labels_path='labels.json'):
+    # Default LBPH distance threshold; per-user overrides live in thresholds.json
+    # ({"alice": 95}). Lower = stricter (use 50-60 for high security),
+    # higher = more lenient (use 80-90 for convenience).
+    DEFAULT_THRESHOLD = 110.0
+    # Best and runner-up identities closer than this are logged as ambiguous.
+    AMBIGUITY_MARGIN = 5.0
+    TOP_K = 3
+    # Cascades run on a copy no wider than this; boxes are mapped back to the
+    # full frame, which is only used to cut out the face for recognition.
+    DETECT_MAX_WIDTH = 320
+    # Reduced JPEG decoding never goes below this width
+    DECODE_MIN_WIDTH = 640
+    # Context kept around the face for the bilateral filter (d=9 reaches 4px),
+    # so the ROI border sees real neighbours as in a whole-frame pass.
+    ROI_PAD = 8
+    # Burst checks: frames considered, and how many must agree before stopping early.
+    BURST_MAX_FRAMES = 5
+    BURST_MIN_VOTES = 2
+
+    def __init__(self, model_path='model.yml', labels_path='labels.json', thresholds_path='thresholds.json'):
         self.base_dir = os.path.dirname(os.path.abspath(__file__))
         self.model_full_path = os.path.join(self.base_dir, model_path)
         self.labels_full_path = os.path.join(self.base_dir, labels_path)
+        self.thresholds_full_path = os.path.join(self.base_dir, thresholds_path)
+        self.store_base_path = os.path.splitext(self.model_full_path)[0]
         
-        self.recognizer = cv2.face.LBPHFaceRecognizer_create()
         self.face_cascade = None
         self.face_cascade_alt = None  # Backup cascade
-        self.labels = {}
-        self.model_loaded = False
+        self.planner = DetectionPlanner()
+        # Current model generation; replaced as a whole by reload()
+        self.model = FaceModel()
+        self._reload_lock = threading.Lock()
 
+        t0 = time.perf_counter()
         self.load_resources()
+        self.load_seconds = time.perf_counter() - t0
+        logging.info(f"Face engine resources loaded in {self.load_seconds:.2f}s")
+
+    # Read-only views of the current model generation
+    @property
+    def labels(self):
+        return self.model.labels
+
+    @property
+    def model_loaded(self):
+        return self.model.loaded
+
+    @property
+    def matcher(self):
+        return self.model.matcher
+
+    @property
+    def version(self):
+        return self.model.version
 
     def load_resources(self):
         """Loads the trained model and labels with multiple cascade classifiers."""
@@ -37,33 +166,110 @@ class FaceEngine:
             logging.warning("Failed to load alternative Haar Cascade classifier.")
             self.face_cascade_alt = None
 
+        self.model = self.load_model(version=1)
+        _MODEL_VERSION.set(self.model.version)
+        _MODEL_LOAD_SECONDS.set(self.model.load_seconds)
+
+    def load_model(self, version):
+        """Read labels, thresholds and the trained model from disk into a new FaceModel."""
+        t0 = time.perf_counter()
+        model = FaceModel(version=version)
+
         # Load ID labels
         if os.path.exists(self.labels_full_path):
             try:
                 with open(self.labels_full_path, 'r') as f:
                     start_map = json.load(f)
-                    self.labels = {int(k): v for k, v in start_map.items()}
+                    model.labels = {int(k): v for k, v in start_map.items()}
             except Exception as e:
                 logging.error(f"Error loading labels: {e}")
-                return
+                return model
         else:
             logging.warning(f"Labels file not found at {self.labels_full_path}")
-            return
+            return model
 
-        # Load Model
-        if os.path.exists(self.model_full_path):
+        # Optional per-user thresholds (name -> max distance)
+        if os.path.exists(self.thresholds_full_path):
             try:
-                self.recognizer.read(self.model_full_path)
-                self.model_loaded = True
-                logging.info("Face recognition model loaded successfully.")
+                with open(self.thresholds_full_path, 'r') as f:
+                    model.thresholds = {str(k): float(v) for k, v in json.load(f).items()}
+                logging.info(f"Per-user thresholds loaded for {len(model.thresholds)} user(s).")
             except Exception as e:
-                logging.error(f"Error loading model: {e}")
-        else:
-            logging.warning(f"Model file not found at {self.model_full_path}")
+                logging.error(f"Error loading thresholds, using default {self.DEFAULT_THRESHOLD}: {e}")
+                model.thresholds = {}
+
+        # Prefer the memory-mapped histogram export written by train_faces.py
+        if store_exists(self.store_base_path):
+            try:
+                model.store = HistogramStore.load(self.store_base_path)
+                model.matcher = self._build_matcher(model, model.store.ids)
+                logging.info(f"Face histogram store mapped ({len(model.store)} samples).")
+            except Exception as e:
+                logging.error(f"Error loading histogram store, falling back to {self.model_full_path}: {e}")
+                model.store = None
+
+        # Load Model
+        if model.matcher is None:
+            if os.path.exists(self.model_full_path):
+                try:
+                    model.recognizer = cv2.face.LBPHFaceRecognizer_create()
+                    model.recognizer.read(self.model_full_path)
+                    model.matcher = self._build_matcher(model, None)
+                    logging.info("Face recognition model loaded successfully.")
+                except Exception as e:
+                    logging.error(f"Error loading model: {e}")
+            else:
+                logging.warning(f"Model file not found at {self.model_full_path}")
+
+        model.load_seconds = time.perf_counter() - t0
+        return model
+
+    def reload(self):
+        """
+        Load the model files again and swap them in if they load.
+        Verifications already running finish on the generation they started with.
+        Returns False if the load failed or another reload is in progress.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            model = self.load_model(version=self.model.version + 1)
+            if not model.loaded:
+                logging.error(f"Face model reload failed; keeping version {self.model.version}.")
+                _MODEL_RELOADS.labels("failed").inc()
+                return False
+            self.model = model  # single reference swap
+            _MODEL_VERSION.set(model.version)
+            _MODEL_LOAD_SECONDS.set(model.load_seconds)
+            _MODEL_RELOADS.labels("ok").inc()
+            logging.info(f"Face model version {model.version} loaded in {model.load_seconds:.2f}s "
+                         f"({len(model.labels)} user(s)).")
+            return True
+        finally:
+            self._reload_lock.release()
+
+    def _build_matcher(self, model, ids):
+        return IdentityMatcher(
+            model.labels,
+            ids=ids,
+            thresholds=model.thresholds,
+            default_threshold=self.DEFAULT_THRESHOLD,
+            ambiguity_margin=self.AMBIGUITY_MARGIN,
+            top_k=self.TOP_K,
+        )
+
+    def match(self, roi_gray, model=None):
+        """Rank identities for a preprocessed 200x200 ROI."""
+        model = model or self.model
+        return model.matcher.rank_identities(*model.identity_distances(roi_gray))
+
+    def identity_distances(self, roi_gray, model=None):
+        """(label ids, closest-sample distance per identity) for a preprocessed ROI."""
+        return (model or self.model).identity_distances(roi_gray)
 
     def preprocess_image(self, img):
-        """Enhanced image preprocessing for better face detection."""
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        """Enhanced preprocessing for a face region (BGR or grayscale)."""
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
         
         # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
         # This works better than simple histogram equalization for varying lighting
@@ -75,138 +281,67 @@ class FaceEngine:
         
         return denoised
 
-    def detect_faces_multi_scale(self, gray):
-        """
-        Try multiple detection strategies to improve reliability.
-        Returns the best set of detected faces.
+    def extract_roi(self, gray, face):
+        """Cut a detected face out of the full-resolution frame, ready for recognition.
+
+        Produces exactly what preprocess_image() on the whole frame followed by
+        a crop did: CLAHE still sees the whole frame (its tiles scale with the
+        image, so it is not local), but the bilateral filter only reaches 4px
+        and runs on the face plus ROI_PAD of context.
         """
-        all_detections = []
+        x, y, w, h = (int(v) for v in face)
+        img_h, img_w = gray.shape[:2]
+        x0, y0 = max(0, x - self.ROI_PAD), max(0, y - self.ROI_PAD)
+        x1, y1 = min(img_w, x + w + self.ROI_PAD), min(img_h, y + h + self.ROI_PAD)
         
-        # Strategy 1: Standard detection (balanced)
-        faces1 = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=4,  # Reduced from 5 for better sensitivity
-            minSize=(50, 50),
-            flags=cv2.CASCADE_SCALE_IMAGE
-        )
-        if len(faces1) > 0:
-            all_detections.append(('standard', faces1))
+        enhanced = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+        denoised = cv2.bilateralFilter(enhanced[y0:y1, x0:x1], 9, 75, 75)
+        roi_gray = denoised[y - y0:y - y0 + h, x - x0:x - x0 + w]
         
-        # Strategy 2: More sensitive detection (lower minNeighbors)
-        faces2 = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.05,  # Smaller scale factor = more thorough
-            minNeighbors=3,
-            minSize=(40, 40),
-            flags=cv2.CASCADE_SCALE_IMAGE
-        )
-        if len(faces2) > 0:
-            all_detections.append(('sensitive', faces2))
-        
-        # Strategy 3: Alternative cascade if available
-        if self.face_cascade_alt is not None:
-            faces3 = self.face_cascade_alt.detectMultiScale(
-                gray,
-                scaleFactor=1.1,
-                minNeighbors=3,
-                minSize=(50, 50),
-                flags=cv2.CASCADE_SCALE_IMAGE
-            )
-            if len(faces3) > 0:
-                all_detections.append(('alternative', faces3))
+        # Resize for consistency with training (same default interpolation)
+        roi_gray = cv2.resize(roi_gray, (200, 200))
         
-        # Strategy 4: Try with smaller minimum size for distant faces
-        faces4 = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.2,
-            minNeighbors=3,
-            minSize=(30, 30),
-            maxSize=(400, 400),
-            flags=cv2.CASCADE_SCALE_IMAGE
+        # Additional preprocessing for recognition
+        return cv2.equalizeHist(roi_gray)
+
+    def prepare_detection(self, gray):
+        """(small, scale): the reduced, contrast-normalised copy the cascades run on."""
+        # Detect on a reduced copy; contrast-normalise it so dim frames still trigger
+        small, scale = downscale(gray, self.DETECT_MAX_WIDTH)
+        return cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(small), scale
+
+    def run_detectors(self, small, scale):
+        """[(strategy name, boxes)] on the prepared copy, in its coordinates."""
+        # Strategies run cheapest-first and stop at the first confident face
+        return self.planner.run(
+            small, {"default": self.face_cascade, "alt": self.face_cascade_alt}, scale=scale
         )
-        if len(faces4) > 0:
-            all_detections.append(('wide_range', faces4))
-        
-        if not all_detections:
-            return np.array([])
-        
-        # Merge overlapping detections using NMS (Non-Maximum Suppression)
-        merged_faces = self.merge_detections([faces for _, faces in all_detections])
-        
-        logging.info(f"Detection strategies found: {[(name, len(faces)) for name, faces in all_detections]}")
-        logging.info(f"After merging: {len(merged_faces)} unique face(s)")
-        
-        return merged_faces
+
+    def _detect(self, gray):
+        """(faces, best) in full-resolution coordinates; best is None when nothing was found."""
+        small, scale = self.prepare_detection(gray)
+        all_detections = self.run_detectors(small, scale)
+
+        # Merge overlapping detections (NMS), map them back and rank them in one pass
+        faces, best = postprocess([boxes for _, boxes in all_detections], gray.shape, scale)
+        if all_detections:
+            logging.debug(f"Detection strategies found: {[(name, len(f)) for name, f in all_detections]}")
+            logging.debug(f"After merging: {len(faces)} unique face(s)")
+        return faces, best
+
+    def detect_faces_multi_scale(self, gray):
+        """
+        Try multiple detection strategies to improve reliability, escalating
+        only while no confident single face has been found.
+        Returns the merged set of detected faces.
+        """
+        return self._detect(gray)[0]
 
     def merge_detections(self, detection_lists):
         """
         Merge overlapping face detections using Non-Maximum Suppression.
         """
-        if not detection_lists:
-            return np.array([])
-        
-        # Combine all detections
-        all_boxes = np.vstack(detection_lists)
-        
-        if len(all_boxes) == 0:
-            return np.array([])
-        
-        # Apply NMS
-        boxes = []
-        scores = []
-        for i, (x, y, w, h) in enumerate(all_boxes):
-            boxes.append([x, y, x + w, y + h])
-            # Assign score based on box size (larger faces = higher confidence)
-            scores.append(w * h)
-        
-        boxes = np.array(boxes)
-        scores = np.array(scores)
-        
-        # Simple NMS implementation
-        picked = []
-        indices = np.argsort(scores)[::-1]
-        
-        while len(indices) > 0:
-            current = indices[0]
-            picked.append(current)
-            
-            if len(indices) == 1:
-                break
-            
-            # Calculate IoU with remaining boxes
-            current_box = boxes[current]
-            remaining_boxes = boxes[indices[1:]]
-            
-            # Calculate intersection
-            xx1 = np.maximum(current_box[0], remaining_boxes[:, 0])
-            yy1 = np.maximum(current_box[1], remaining_boxes[:, 1])
-            xx2 = np.minimum(current_box[2], remaining_boxes[:, 2])
-            yy2 = np.minimum(current_box[3], remaining_boxes[:, 3])
-            
-            w = np.maximum(0, xx2 - xx1)
-            h = np.maximum(0, yy2 - yy1)
-            intersection = w * h
-            
-            # Calculate union
-            current_area = (current_box[2] - current_box[0]) * (current_box[3] - current_box[1])
-            remaining_areas = (remaining_boxes[:, 2] - remaining_boxes[:, 0]) * \
-                            (remaining_boxes[:, 3] - remaining_boxes[:, 1])
-            union = current_area + remaining_areas - intersection
-            
-            # IoU
-            iou = intersection / union
-            
-            # Keep boxes with IoU < 0.5
-            indices = indices[1:][iou < 0.5]
-        
-        # Convert back to (x, y, w, h) format
-        result = []
-        for idx in picked:
-            x1, y1, x2, y2 = boxes[idx]
-            result.append([int(x1), int(y1), int(x2 - x1), int(y2 - y1)])
-        
-        return np.array(result)
+        return merge_boxes(detection_lists)
 
     def select_best_face(self, faces, img_shape):
         """
@@ -219,34 +354,10 @@ class FaceEngine:
         if len(faces) == 1:
             return faces[0]
         
-        img_height, img_width = img_shape[:2]
-        img_center_x, img_center_y = img_width // 2, img_height // 2
-        
-        scores = []
-        for (x, y, w, h) in faces:
-            # Calculate face center
-            face_center_x = x + w // 2
-            face_center_y = y + h // 2
-            
-            # Distance from image center (normalized)
-            dist_from_center = np.sqrt(
-                ((face_center_x - img_center_x) / img_width) ** 2 +
-                ((face_center_y - img_center_y) / img_height) ** 2
-            )
-            
-            # Size score (larger is better, normalized)
-            size_score = (w * h) / (img_width * img_height)
-            
-            # Aspect ratio score (closer to 1.0 is better for faces)
-            aspect_ratio = w / h if h > 0 else 0
-            aspect_score = 1.0 - abs(aspect_ratio - 1.0)
-            
-            # Combined score (lower is better for distance, higher for others)
-            score = (1.0 - dist_from_center) * 0.4 + size_score * 0.4 + aspect_score * 0.2
-            scores.append(score)
-        
-        best_idx = np.argmax(scores)
-        logging.info(f"Selected face {best_idx} from {len(faces)} candidates (score: {scores[best_idx]:.3f})")
+        faces = np.asarray(faces)
+        scores = face_scores(faces, img_shape)
+        best_idx = int(np.argmax(scores))
+        logging.debug(f"Selected face {best_idx} from {len(faces)} candidates (score: {scores[best_idx]:.3f})")
         return faces[best_idx]
 
     def verify_face(self, image_bytes) -> tuple[bool, str | None]:
@@ -254,76 +365,208 @@ class FaceEngine:
         Enhanced face verification with improved detection and preprocessing.
         Returns (True, name) if authorized, else (False, None).
         """
-        if not self.model_loaded:
+        result = self.verify_face_detailed(image_bytes)
+        return result.authorized, result.name
+
+    def decode_gray(self, image_bytes):
+        """Decode an encoded frame straight to grayscale, or None."""
+        nparr = np.frombuffer(image_bytes, np.uint8)
+        # Large JPEGs are decoded at 1/2, 1/4 or 1/8 size by libjpeg itself,
+        # never below DECODE_MIN_WIDTH so the face ROI keeps enough detail.
+        flag = cv2.IMREAD_GRAYSCALE
+        size = _jpeg_size(image_bytes)
+        if size is not None:
+            for factor, reduced in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                                    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                                    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)):
+                if size[0] // factor >= self.DECODE_MIN_WIDTH:
+                    flag = reduced
+                    break
+        return cv2.imdecode(nparr, flag)
+
+    def locate_face(self, gray):
+        """Full-resolution (x, y, w, h) of the face to recognise, or None."""
+        # Multi-strategy face detection; the best candidate is picked in the same pass
+        faces, best = self._detect(gray)
+
+        if best is None:
+            logging.info("No face detected after trying multiple strategies.")
+            return None
+        if len(faces) > 1:
+            logging.warning(f"Multiple faces detected ({len(faces)}). Selected best candidate.")
+        return best
+
+    def _decide(self, match, frames=1) -> FaceResult:
+        best = match.best
+        if best is None:
+            logging.error("Model has no training samples. Access denied.")
+            _VERIFY_RESULTS.labels("denied").inc()
+            return FaceResult(False, reason="denied", frames=frames)
+
+        ranking = ", ".join(f"{c.name}={c.distance:.2f}" for c in match.candidates)
+        logging.info(
+            f"Face ranking: {ranking} (margin {match.margin:.2f}{', AMBIGUOUS' if match.ambiguous else ''})"
+        )
+
+        result = FaceResult(
+            False,
+            distance=best.distance,
+            margin=match.margin,
+            ambiguous=match.ambiguous,
+            candidates=match.candidates,
+            frames=frames,
+        )
+        if best.accepted:
+            logging.info(f"Access GRANTED for {best.name} (confidence: {best.distance:.2f})")
+            _VERIFY_RESULTS.labels("granted").inc()
+            result.authorized, result.name, result.reason = True, best.name, "granted"
+        else:
+            logging.info(f"Access DENIED. Confidence {best.distance:.2f} above threshold {best.threshold}")
+            _VERIFY_RESULTS.labels("denied").inc()
+            result.reason = "denied"
+        return result
+
+    def verify_face_detailed(self, image_bytes) -> FaceResult:
+        """Like verify_face, but returns the reason and the identity ranking."""
+        model = self.model  # one generation for the whole check, even across a reload
+        if not model.loaded:
             logging.error("Model not loaded. Access denied.")
-            return False, None
+            _VERIFY_RESULTS.labels("model_not_loaded").inc()
+            return FaceResult(False, reason="model_not_loaded")
 
+        t0 = time.perf_counter()
         try:
-            # Decode image
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if img is None:
+            gray = self.decode_gray(image_bytes)
+            if gray is None:
                 logging.error("Failed to decode image.")
-                return False, None
+                _VERIFY_RESULTS.labels("decode_error").inc()
+                return FaceResult(False, reason="decode_error")
 
-            # Enhanced preprocessing
-            gray = self.preprocess_image(img)
-            
-            # Multi-strategy face detection
-            faces = self.detect_faces_multi_scale(gray)
+            # Reject dark, flat or blurred frames before paying for detection
+            q = quality.assess(gray)
+            if not q.ok:
+                logging.info(
+                    f"Frame rejected: {q.reason}, {q.detail} (brightness {q.brightness:.0f}, "
+                    f"contrast {q.contrast:.0f}, sharpness {q.sharpness:.0f})"
+                )
+                _VERIFY_RESULTS.labels(q.reason).inc()
+                return FaceResult(False, reason=q.reason, detail=q.detail)
 
-            face_count = len(faces)
-            if face_count == 0:
-                logging.info("No face detected after trying multiple strategies.")
-                return False, None
-            
-            # Select best face if multiple detected
-            if face_count > 1:
-                logging.warning(f"Multiple faces detected ({face_count}). Selecting best candidate.")
-                face = self.select_best_face(faces, img.shape)
-                if face is None:
-                    return False, None
-                x, y, w, h = face
-            else:
-                x, y, w, h = faces[0]
+            face = self.locate_face(gray)
+            if face is None:
+                _VERIFY_RESULTS.labels("no_face").inc()
+                return FaceResult(False, reason="no_face")
             
             # Extract and prepare ROI
-            roi_gray = gray[y:y+h, x:x+w]
-            
-            # Resize for consistency with training
-            roi_gray = cv2.resize(roi_gray, (200, 200))
-            
-            # Additional preprocessing for recognition
-            roi_gray = cv2.equalizeHist(roi_gray)
+            roi_gray = self.extract_roi(gray, face)
 
-            # Predict
-            label_id, confidence = self.recognizer.predict(roi_gray)
+            # Rank identities
+            return self._decide(self.match(roi_gray, model))
 
-            # Adjusted threshold for better accuracy
-            # Lower = stricter (use 50-60 for high security)
-            # Higher = more lenient (use 80-90 for convenience)
-            STRICT_THRESHOLD = 110
+        except Exception as e:
+            logging.error(f"Exception during verification: {e}", exc_info=True)
+            _VERIFY_RESULTS.labels("error").inc()
+            return FaceResult(False, reason="error")
+        finally:
+            _VERIFY_SECONDS.observe(time.perf_counter() - t0)
 
-            logging.info(f"Face predicted: ID={label_id}, Confidence={confidence:.2f}, Threshold={STRICT_THRESHOLD}")
+    def verify_burst(self, frames) -> FaceResult:
+        """
+        Verify a short burst of frames of the same person.
+        The face is detected once and tracked through the following frames;
+        per-identity distances are averaged and the burst stops early once
+        enough frames agree on an unambiguous leader.
+        """
+        model = self.model  # one generation for the whole check, even across a reload
+        if not model.loaded:
+            logging.error("Model not loaded. Access denied.")
+            _VERIFY_RESULTS.labels("model_not_loaded").inc()
+            return FaceResult(False, reason="model_not_loaded")
 
-            if confidence < STRICT_THRESHOLD:
-                name = self.labels.get(label_id, "Unknown")
-                logging.info(f"Access GRANTED for {name} (confidence: {confidence:.2f})")
-                return True, name
-            else:
-                logging.info(f"Access DENIED. Confidence {confidence:.2f} above threshold {STRICT_THRESHOLD}")
-                return False, None
+        t0 = time.perf_counter()
+        try:
+            tracker = RoiTracker(self.DETECT_MAX_WIDTH)
+            uniq, total = None, None
+            votes = {}
+            decoded = used = 0
+            rejected = None  # FrameQuality of the last unusable frame
+            match = None
+            for image_bytes in frames[: self.BURST_MAX_FRAMES]:
+                gray = self.decode_gray(image_bytes)
+                if gray is None:
+                    logging.warning("Failed to decode a burst frame; skipping it.")
+                    continue
+                decoded += 1
+
+                q = quality.assess(gray)
+                if not q.ok:
+                    rejected = q
+                    continue
+
+                face = tracker.update(gray) if tracker.active else None
+                if face is None:
+                    face = self.locate_face(gray)
+                    if face is None:
+                        continue
+                    tracker.start(gray, face)
+
+                ids, dist = model.identity_distances(self.extract_roi(gray, face))
+                if total is None:
+                    uniq, total = ids, dist.copy()
+                else:
+                    total += dist
+                used += 1
+                leader = int(ids[np.argmin(dist)]) if dist.size else -1
+                votes[leader] = votes.get(leader, 0) + 1
+
+                match = model.matcher.rank_identities(uniq, total / used)
+                best = match.best
+                if (
+                    used >= self.BURST_MIN_VOTES
+                    and best is not None
+                    and votes.get(best.label_id, 0) == used
+                    and not match.ambiguous
+                ):
+                    break
+
+            if match is None:
+                reason = "decode_error" if not decoded else (rejected.reason if rejected else "no_face")
+                _VERIFY_RESULTS.labels(reason).inc()
+                return FaceResult(False, reason=reason, detail=rejected.detail if rejected else None)
+            logging.info(f"Burst: {used} of {len(frames)} frame(s) used, votes {votes}")
+            return self._decide(match, frames=used)
 
         except Exception as e:
-            logging.error(f"Exception during verification: {e}", exc_info=True)
-            return False, None
+            logging.error(f"Exception during burst verification: {e}", exc_info=True)
+            _VERIFY_RESULTS.labels("error").inc()
+            return FaceResult(False, reason="error")
+        finally:
+            _VERIFY_SECONDS.observe(time.perf_counter() - t0)
+
+# Process-wide instance, built on first use: loading the cascades and the
+# LBPH model takes seconds and must not happen at import time.
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> FaceEngine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = FaceEngine()
+    return _engine
+
+
+def __getattr__(name):
+    # Backwards compatibility for `from master_pi.ai.face_engine import engine`.
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Singleton instance
-engine = FaceEngine()
 
 if __name__ == "__main__":
-    import sys
+    engine = get_engine()
     print("--- Enhanced Face Engine Standalone Test ---")
     if engine.model_loaded:
         print(f"Model loaded successfully. Labels: {engine.labels}")
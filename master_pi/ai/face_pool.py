@@ -0,0 +1,270 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.metrics import registry
+
+# Face verification in worker processes.
+#
+# OpenCV releases the GIL, but detection merging, scoring and JPEG handling
+# around it do not, so running verify_face on a Flask thread stalls every
+# other request (including the SSE state stream). Each worker process loads
+# its own FaceEngine once, in the pool initializer. Admission is bounded:
+# at most `workers + max_queue` frames are in flight and anything beyond that
+# is rejected immediately with a retry hint instead of piling up.
+
+_INFLIGHT = registry.gauge("face_pool_inflight", "Frames queued or being verified by face workers.")
+_REJECTED = registry.counter("face_pool_rejected_total", "Face frames rejected by the worker pool.", ["reason"])
+_WAIT_SECONDS = registry.histogram("face_pool_seconds", "Submit-to-result time of face worker requests.")
+# Same families as FaceEngine registers in-process; here they describe the workers.
+_MODEL_VERSION = registry.gauge("face_model_version", "Generation of the loaded face model (bumped on reload).")
+_MODEL_LOAD_SECONDS = registry.gauge("face_model_load_seconds", "Time to load the current face model generation.")
+_MODEL_RELOADS = registry.counter("face_model_reloads_total", "Face model reloads by result.", ["result"])
+
+
+class FacePoolBusy(Exception):
+    """The pool cannot take (or finish) this frame in time; retry after `retry_after` seconds."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FaceDeadlineExceeded(FacePoolBusy):
+    pass
+
+
+# --- worker side -------------------------------------------------------------
+
+_worker_engine = None
+
+
+def _worker_init():
+    global _worker_engine
+    from master_pi.ai.face_engine import get_engine
+
+    _worker_engine = get_engine()
+
+
+def _worker_ping(hold_sec):
+    # Held briefly so the next ping goes to a different (still loading) worker.
+    time.sleep(hold_sec)
+    return os.getpid(), _worker_engine is not None and _worker_engine.model_loaded
+
+
+def _worker_call(method, payload, deadline):
+    # Frames that waited in the queue past their deadline are not worth the CPU:
+    # the HTTP request has already been answered.
+    if time.time() > deadline:
+        return None
+    return getattr(_worker_engine, method)(payload)
+
+
+# --- server side -------------------------------------------------------------
+
+
+class FacePool:
+    # How long a warm-up ping keeps its worker busy, and the most start()/reload() wait for every worker.
+    PING_HOLD_SEC = 0.05
+    WARM_TIMEOUT_SEC = 120.0
+
+    def __init__(self, workers=2, max_queue=2, timeout_sec=5.0, retry_after=1):
+        self.workers = max(1, int(workers))
+        self.timeout_sec = float(timeout_sec)
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(self.workers + max(0, int(max_queue)))
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._executor = None
+        self._closed = False
+        # Model generation served by the current workers
+        self.version = 0
+        self.load_seconds = 0.0
+
+    def _new_executor(self):
+        # spawn: never fork a process that is running Flask and MQTT threads.
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_worker_init,
+        )
+
+    def _warm(self, executor):
+        """Start every worker of `executor` and wait until each has loaded its engine.
+
+        A worker only takes a ping once its initializer has run, but one that
+        finished early can answer several pings while the others are still
+        loading. So pings are sent until `workers` distinct processes have
+        answered. Returns each worker's model_loaded; raises TimeoutError
+        after WARM_TIMEOUT_SEC.
+        """
+        deadline = time.monotonic() + self.WARM_TIMEOUT_SEC
+        ready = {}
+        pending = set()
+        try:
+            while len(ready) < self.workers:
+                # Each submit spawns a worker while none is idle.
+                while len(pending) + len(ready) < self.workers:
+                    pending.add(executor.submit(_worker_ping, self.PING_HOLD_SEC))
+                done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise TimeoutError(f"{len(ready)} of {self.workers} face workers ready after {self.WARM_TIMEOUT_SEC:.0f}s")
+                for f in done:
+                    pid, loaded = f.result()
+                    ready[pid] = loaded
+        finally:
+            for f in pending:
+                f.cancel()
+        return list(ready.values())
+
+    def start(self):
+        """Start every worker and wait until each has loaded its engine."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._new_executor()
+            executor = self._executor
+        t0 = time.perf_counter()
+        results = self._warm(executor)
+        if not all(results):
+            logging.warning("Face workers started without a trained model; every check will be denied.")
+        self.version = 1
+        self.load_seconds = time.perf_counter() - t0
+        _MODEL_VERSION.set(self.version)
+        _MODEL_LOAD_SECONDS.set(self.load_seconds)
+        logging.info(f"Face worker pool ready ({self.workers} process(es)).")
+
+    def reload(self):
+        """
+        Start a fresh set of workers (which load the model files as they are
+        now), then swap them in. Frames already handed to the old workers
+        finish there. Returns False if the new workers have no model or
+        another reload is in progress.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            t0 = time.perf_counter()
+            executor = self._new_executor()
+            try:
+                ready = self._warm(executor)
+            except Exception as e:
+                logging.error(f"Face worker reload failed: {e}")
+                ready = [False]
+            if not all(ready):
+                executor.shutdown(wait=False, cancel_futures=True)
+                _MODEL_RELOADS.labels("failed").inc()
+                logging.error(f"Face model reload failed; keeping version {self.version}.")
+                return False
+
+            with self._lock:
+                old, self._executor = self._executor, executor
+                self.version += 1
+                self.load_seconds = time.perf_counter() - t0
+            if old is not None:
+                old.shutdown(wait=False)
+            _MODEL_VERSION.set(self.version)
+            _MODEL_LOAD_SECONDS.set(self.load_seconds)
+            _MODEL_RELOADS.labels("ok").inc()
+            logging.info(f"Face model version {self.version} loaded by new workers in {self.load_seconds:.2f}s.")
+            return True
+        finally:
+            self._reload_lock.release()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._closed = True
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _reset_broken(self, executor):
+        # A worker died (e.g. OOM); rebuild the pool on the next request. Only
+        # the pool that failed is dropped: another request may already have
+        # replaced it. Its surviving workers are stopped rather than leaked.
+        _REJECTED.labels("broken").inc()
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        logging.error("Face worker pool broken; restarting workers.")
+        executor.shutdown(wait=False, cancel_futures=True)
+        threading.Thread(target=self._rebuild, name="FACE_POOL", daemon=True).start()
+
+    def _rebuild(self):
+        # Requests are turned away (FacePoolBusy) until the new workers have
+        # loaded, rather than one of them paying for the load.
+        executor = self._new_executor()
+        try:
+            self._warm(executor)
+        except Exception as e:
+            # Installed anyway: a broken pool is noticed and rebuilt on the next request.
+            logging.error(f"Face worker restart: {e}")
+        with self._lock:
+            if self._executor is None and not self._closed:
+                self._executor, executor = executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        else:
+            logging.info("Face workers restarted.")
+
+    def _release(self, _future=None):
+        self._slots.release()
+        _INFLIGHT.dec()
+
+    def verify_face_detailed(self, image_bytes, timeout_sec=None):
+        """Verify in a worker. Raises FacePoolBusy when overloaded or past the deadline."""
+        return self._call("verify_face_detailed", image_bytes, timeout_sec)
+
+    def verify_burst(self, frames, timeout_sec=None):
+        return self._call("verify_burst", list(frames), timeout_sec)
+
+    def _call(self, method, payload, timeout_sec):
+        if not self._slots.acquire(blocking=False):
+            _REJECTED.labels("busy").inc()
+            raise FacePoolBusy("Face workers busy", self.retry_after)
+        _INFLIGHT.inc()
+
+        timeout = self.timeout_sec if timeout_sec is None else float(timeout_sec)
+        t0 = time.perf_counter()
+        executor = None
+        try:
+            with self._lock:
+                executor = self._executor
+                if executor is None:
+                    _REJECTED.labels("restarting").inc()
+                    raise FacePoolBusy("Face workers restarting", self.retry_after)
+                future = executor.submit(_worker_call, method, payload, time.time() + timeout)
+        except BrokenProcessPool:
+            self._release()
+            self._reset_broken(executor)
+            raise FacePoolBusy("Face workers restarting", self.retry_after)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is held until the worker is actually done with the frame,
+        # even if this request gives up on it earlier.
+        future.add_done_callback(self._release)
+
+        try:
+            result = future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()
+            _REJECTED.labels("deadline").inc()
+            raise FaceDeadlineExceeded(f"Face verification exceeded {timeout:.1f}s", self.retry_after)
+        except BrokenProcessPool:
+            self._reset_broken(executor)
+            raise FacePoolBusy("Face workers restarting", self.retry_after)
+        if result is None:
+            _REJECTED.labels("deadline").inc()
+            raise FaceDeadlineExceeded("Face verification expired in the queue", self.retry_after)
+        _WAIT_SECONDS.observe(time.perf_counter() - t0)
+        return result
+
+    def verify_face(self, image_bytes):
+        result = self.verify_face_detailed(image_bytes)
+        return result.authorized, result.name
@@ -0,0 +1,116 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Identity ranking on top of per-sample LBPH distances.
+#
+# LBPH predict() only reports the single closest training photo. Reducing the
+# full distance vector per identity instead gives the top-k users, the margin
+# between the best two, and lets every user carry their own threshold.
+
+
+@dataclass
+class Candidate:
+    label_id: int
+    name: str
+    distance: float
+    threshold: float
+
+    @property
+    def accepted(self) -> bool:
+        return self.distance < self.threshold
+
+
+@dataclass
+class MatchResult:
+    """Identities ranked by their closest training sample (lower distance is better)."""
+
+    candidates: List[Candidate] = field(default_factory=list)
+    # Distance gap between the best and second-best identity; inf with one identity.
+    margin: float = float("inf")
+    ambiguous: bool = False
+
+    @property
+    def best(self) -> Optional[Candidate]:
+        return self.candidates[0] if self.candidates else None
+
+    @property
+    def accepted(self) -> bool:
+        return self.best is not None and self.best.accepted
+
+
+def _group(ids):
+    """Precompute a by-identity ordering so per-identity minima are one reduceat."""
+    ids = np.asarray(ids).ravel()
+    order = np.argsort(ids, kind="stable")
+    sorted_ids = ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    return order, starts, sorted_ids[starts]
+
+
+class IdentityMatcher:
+    """Turns per-sample distances into a top-k identity ranking.
+
+    Every identity gets its own acceptance threshold (falling back to the
+    default), and the margin to the runner-up is reported so thresholds can be
+    tuned against real ambiguity rather than a single best score.
+    """
+
+    def __init__(
+        self,
+        labels: Dict[int, str],
+        ids=None,
+        thresholds: Optional[Dict[str, float]] = None,
+        default_threshold: float = 110.0,
+        ambiguity_margin: float = 5.0,
+        top_k: int = 3,
+    ):
+        self.labels = labels
+        self.thresholds = dict(thresholds or {})
+        self.default_threshold = float(default_threshold)
+        self.ambiguity_margin = float(ambiguity_margin)
+        self.top_k = max(1, int(top_k))
+        self._grouping = _group(ids) if ids is not None and len(ids) else None
+
+    def threshold_for(self, label_id: int) -> float:
+        return float(self.thresholds.get(self.labels.get(label_id, ""), self.default_threshold))
+
+    def reduce(self, distances, ids=None):
+        """Closest-sample distance per identity. Returns (label ids, distances), both sorted by label id."""
+        distances = np.asarray(distances, dtype=np.float64).ravel()
+        if distances.size == 0:
+            return np.empty(0, dtype=np.int32), distances
+        grouping = self._grouping if ids is None else _group(ids)
+        if grouping is None:
+            raise ValueError("No label ids given for these distances.")
+        order, starts, uniq = grouping
+        return uniq, np.minimum.reduceat(distances[order], starts)
+
+    def rank(self, distances, ids=None) -> MatchResult:
+        return self.rank_identities(*self.reduce(distances, ids))
+
+    def rank_identities(self, uniq, best) -> MatchResult:
+        """Top-k ranking from one distance per identity (e.g. averaged over frames)."""
+        best = np.asarray(best, dtype=np.float64)
+        if best.size == 0:
+            return MatchResult()
+
+        k = min(self.top_k, best.size)
+        top = np.argpartition(best, k - 1)[:k] if k < best.size else np.arange(best.size)
+        top = top[np.argsort(best[top], kind="stable")]
+
+        candidates = []
+        for i in top:
+            label_id = int(uniq[i])
+            candidates.append(
+                Candidate(
+                    label_id=label_id,
+                    name=self.labels.get(label_id, "Unknown"),
+                    distance=float(best[i]),
+                    threshold=self.threshold_for(label_id),
+                )
+            )
+
+        margin = candidates[1].distance - candidates[0].distance if len(candidates) > 1 else float("inf")
+        return MatchResult(candidates=candidates, margin=margin, ambiguous=margin < self.ambiguity_margin)
@@ -0,0 +1,73 @@
+import logging
+import os
+import threading
+from typing import Callable, Iterable, Tuple
+
+# Polls the files train_faces.py writes (model.yml, the histogram store,
+# labels.json, thresholds.json) and calls `on_change` once they have changed
+# and then stayed the same for one more poll, so a half-finished training run
+# is never loaded. Only stat() is used; nothing is read here.
+
+AI_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _signature(base_dir: str, prefixes: Tuple[str, ...]) -> Tuple:
+    entries = []
+    try:
+        names = sorted(os.listdir(base_dir))
+    except OSError:
+        return ()
+    for name in names:
+        if not name.startswith(prefixes) or ".tmp" in name:
+            continue
+        try:
+            st = os.stat(os.path.join(base_dir, name))
+        except OSError:
+            continue
+        entries.append((name, st.st_mtime_ns, st.st_size))
+    return tuple(entries)
+
+
+class ModelWatcher:
+    def __init__(
+        self,
+        on_change: Callable[[], object],
+        base_dir: str = AI_DIR,
+        prefixes: Iterable[str] = ("model.", "labels.json", "thresholds.json"),
+        poll_sec: float = 5.0,
+    ):
+        self._on_change = on_change
+        self._base_dir = base_dir
+        self._prefixes = tuple(prefixes)
+        self._poll_sec = float(poll_sec)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="FACE_MODEL_WATCH", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        loaded = _signature(self._base_dir, self._prefixes)
+        pending = None
+        while not self._stop.wait(self._poll_sec):
+            current = _signature(self._base_dir, self._prefixes)
+            if current == loaded:
+                pending = None
+                continue
+            if current != pending:
+                # Changed since the last poll: wait until the writer is done.
+                pending = current
+                continue
+            logging.info("Face model files changed; reloading.")
+            try:
+                self._on_change()
+            except Exception as e:
+                logging.error(f"Face model reload failed: {e}")
+            loaded, pending = current, None
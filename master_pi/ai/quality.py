@@ -0,0 +1,60 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import cv2
+
+# Cheap frame quality gate, run before any cascade pass.
+#
+# Dark, washed-out and motion-blurred frames cost as much to search for a face
+# as good ones and almost never match. All measures are taken on a small
+# thumbnail, so the whole check is well under a millisecond on the Pi.
+#
+# The limits depend on the camera and the lighting at the door; override them
+# with the SMARTHOME_FACE_* variables below (see readme.md). A minimum of 0 or a
+# MAX_BRIGHTNESS of 255 turns that check off. benchmarks/face_pipeline.py
+# --images prints these measures for a set of photos.
+
+THUMB_WIDTH = 160
+
+MIN_BRIGHTNESS = float(os.getenv("SMARTHOME_FACE_MIN_BRIGHTNESS", "40"))  # mean gray level
+MAX_BRIGHTNESS = float(os.getenv("SMARTHOME_FACE_MAX_BRIGHTNESS", "220"))
+MIN_CONTRAST = float(os.getenv("SMARTHOME_FACE_MIN_CONTRAST", "18"))  # gray level standard deviation
+# Variance of the Laplacian on the thumbnail; motion blur drops it sharply.
+MIN_SHARPNESS = float(os.getenv("SMARTHOME_FACE_MIN_SHARPNESS", "50"))
+
+
+@dataclass
+class FrameQuality:
+    brightness: float
+    contrast: float
+    sharpness: float
+    reason: Optional[str] = None  # too_dark | too_bright | low_contrast | blurry
+    detail: Optional[str] = None  # the failing measure against its limit, e.g. "brightness 31 < 40"
+
+    @property
+    def ok(self) -> bool:
+        return self.reason is None
+
+
+def assess(gray) -> FrameQuality:
+    """Measure a grayscale frame and say why it is unusable, if it is."""
+    h, w = gray.shape[:2]
+    if w > THUMB_WIDTH:
+        thumb = cv2.resize(gray, (THUMB_WIDTH, max(1, h * THUMB_WIDTH // w)), interpolation=cv2.INTER_AREA)
+    else:
+        thumb = gray
+
+    mean, std = cv2.meanStdDev(thumb)
+    _, lap_std = cv2.meanStdDev(cv2.Laplacian(thumb, cv2.CV_16S))
+    q = FrameQuality(float(mean[0][0]), float(std[0][0]), float(lap_std[0][0]) ** 2)
+
+    if q.brightness < MIN_BRIGHTNESS:
+        q.reason, q.detail = "too_dark", f"brightness {q.brightness:.0f} < {MIN_BRIGHTNESS:g}"
+    elif q.brightness > MAX_BRIGHTNESS:
+        q.reason, q.detail = "too_bright", f"brightness {q.brightness:.0f} > {MAX_BRIGHTNESS:g}"
+    elif q.contrast < MIN_CONTRAST:
+        q.reason, q.detail = "low_contrast", f"contrast {q.contrast:.0f} < {MIN_CONTRAST:g}"
+    elif q.sharpness < MIN_SHARPNESS:
+        q.reason, q.detail = "blurry", f"sharpness {q.sharpness:.0f} < {MIN_SHARPNESS:g}"
+    return q
@@ -1,43 +1,337 @@
 import cv2
 import numpy as np
 import os
+import sys
 import json
 import logging
+import argparse
+import hashlib
+import shutil
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+if __package__ in (None, ""):
+    # Running as a script: make the repo root importable.
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from master_pi.ai.histogram_store import (
+    append_histograms,
+    compute_histograms,
+    export_recognizer,
+    read_meta,
+    store_exists,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def train_model(dataset_path='dataset', model_path='model.yml', labels_path='labels.json'):
-    """
-    Enhanced training with better preprocessing and data augmentation.
-    Structure: dataset_path/User_Name/1.jpg, 2.jpg, ...
-    """
-    
-    if not os.path.exists(dataset_path):
-        logging.error(f"Dataset directory '{dataset_path}' not found.")
-        return
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Bump when extract_samples() output changes, so cached samples are rebuilt.
+SAMPLE_CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'samples')
+
 
-    # Load cascades
+def label_for(name):
+    """Label used in labels.json for a user or dataset directory name."""
+    return name.replace(" ", "_").lower()
+
+
+def load_cascades():
     cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
     face_cascade = cv2.CascadeClassifier(cascade_path)
-    
     if face_cascade.empty():
         logging.error("Failed to load Haar Cascade classifier.")
-        return
-    
+        return None, None
+
     # Alternative cascade for better detection
     cascade_alt_path = cv2.data.haarcascades + 'haarcascade_frontalface_alt2.xml'
     face_cascade_alt = cv2.CascadeClassifier(cascade_alt_path)
+    return face_cascade, face_cascade_alt
 
-    # Initialize LBPH Face Recognizer with optimized parameters
+
+def create_recognizer():
     # radius=2, neighbors=8, grid_x=8, grid_y=8 are good defaults
-    recognizer = cv2.face.LBPHFaceRecognizer_create(
+    return cv2.face.LBPHFaceRecognizer_create(
         radius=2,
         neighbors=8,
         grid_x=8,
         grid_y=8
     )
 
+
+def extract_samples(path, face_cascade, face_cascade_alt, clahe=None):
+    """
+    Detect the face in one training photo and return its preprocessed
+    200x200 ROI plus augmentations, or [] if no face was found.
+    """
+    samples = []
+    try:
+        # Read image in color first
+        img_color = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img_color is None:
+            logging.warning(f"Could not read image: {path}")
+            return samples
+        
+        # Convert to grayscale
+        img = cv2.cvtColor(img_color, cv2.COLOR_BGR2GRAY)
+        
+        # Apply CLAHE for better contrast
+        if clahe is None:
+            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        img = clahe.apply(img)
+        
+        # Try multiple detection strategies
+        detected_faces = face_cascade.detectMultiScale(
+            img, 
+            scaleFactor=1.1, 
+            minNeighbors=4,
+            minSize=(30, 30)
+        )
+        
+        # If no face found, try alternative cascade
+        if len(detected_faces) == 0 and not face_cascade_alt.empty():
+            detected_faces = face_cascade_alt.detectMultiScale(
+                img,
+                scaleFactor=1.1,
+                minNeighbors=3,
+                minSize=(30, 30)
+            )
+        
+        if len(detected_faces) == 0:
+            logging.warning(f"No face detected in: {path}")
+            return samples
+        
+        # Only use first face if multiple detected in training image
+        x, y, w, h = detected_faces[0]
+
+        # Extract face ROI
+        roi = img[y:y+h, x:x+w]
+        
+        # Resize to uniform size
+        roi_resized = cv2.resize(roi, (200, 200))
+        
+        # Apply histogram equalization
+        roi_equalized = cv2.equalizeHist(roi_resized)
+        
+        # Add original processed face
+        samples.append(roi_equalized)
+        
+        # Data augmentation: slight brightness variations
+        # This helps the model generalize better to different lighting
+        for brightness_delta in [-30, 30]:
+            roi_bright = cv2.convertScaleAbs(roi_resized, alpha=1.0, beta=brightness_delta)
+            roi_bright = cv2.equalizeHist(roi_bright)
+            samples.append(roi_bright)
+        
+        # Data augmentation: horizontal flip
+        # Helps with slight angle variations
+        roi_flip = cv2.flip(roi_equalized, 1)
+        samples.append(roi_flip)
+            
+    except Exception as e:
+        logging.error(f"Error processing {path}: {e}")
+    return samples
+
+
+class SampleCache:
+    """
+    Extracted samples per photo on disk, keyed by the photo's content hash.
+    Photos without a face are cached too (as zero samples).
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def digest(path):
+        h = hashlib.sha256(f"v{SAMPLE_CACHE_VERSION}:".encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _path(self, digest):
+        return os.path.join(self.cache_dir, digest + '.npy')
+
+    def get(self, digest):
+        if not self.cache_dir:
+            return None
+        try:
+            return list(np.load(self._path(digest)))
+        except (OSError, ValueError):
+            return None
+
+    def put(self, digest, samples):
+        if not self.cache_dir:
+            return
+        stacked = np.stack(samples) if samples else np.empty((0, 200, 200), dtype=np.uint8)
+        tmp = self._path(digest) + '.tmp.npy'
+        np.save(tmp, stacked)
+        os.replace(tmp, self._path(digest))
+
+
+def _detector_state():
+    face_cascade, face_cascade_alt = load_cascades()
+    return face_cascade, face_cascade_alt, cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+
+
+def _extract_timed(path, state):
+    t0 = time.perf_counter()
+    samples = extract_samples(path, *state)
+    return samples, time.perf_counter() - t0
+
+
+# Per-process detector state for the training pool (built once per worker).
+_worker_state = None
+
+
+def _init_worker():
+    global _worker_state
+    # Only in pool workers: the pool provides the parallelism.
+    cv2.setNumThreads(1)
+    _worker_state = _detector_state()
+
+
+def _extract_in_worker(path):
+    return _extract_timed(path, _worker_state)
+
+
+def collect_samples(paths, cache_dir=DEFAULT_CACHE_DIR, workers=None, timings=None):
+    """
+    Samples for every photo in `paths` ({path: [samples]}). Photos already in
+    the cache are not decoded at all; the rest are processed by a process pool.
+    """
+    timings = {} if timings is None else timings
+    cache = SampleCache(cache_dir)
+    results = {}
+
+    t0 = time.perf_counter()
+    digests = {path: SampleCache.digest(path) for path in paths}
+    timings['hash'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    misses = []
+    for path, digest in digests.items():
+        cached = cache.get(digest)
+        if cached is None:
+            misses.append(path)
+        else:
+            results[path] = cached
+    timings['cache'] = time.perf_counter() - t0
+    timings['cached_photos'] = len(results)
+    timings['new_photos'] = len(misses)
+
+    t0 = time.perf_counter()
+    cpu = 0.0
+    workers = workers or os.cpu_count() or 1
+    if len(misses) > 1 and workers > 1:
+        chunksize = max(1, len(misses) // (workers * 4))
+        # spawn: forking a process whose OpenCV thread pool is live can hang or kill the child.
+        with ProcessPoolExecutor(max_workers=min(workers, len(misses)),
+                                 mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker) as pool:
+            for path, (samples, seconds) in zip(misses, pool.map(_extract_in_worker, misses, chunksize=chunksize)):
+                results[path] = samples
+                cpu += seconds
+    elif misses:
+        # In this process, which keeps its OpenCV thread count (enroll() may run in a server).
+        state = _detector_state()
+        for path in misses:
+            samples, seconds = _extract_timed(path, state)
+            results[path] = samples
+            cpu += seconds
+    for path in misses:
+        cache.put(digests[path], results[path])
+    timings['detect'] = time.perf_counter() - t0
+    timings['detect_cpu'] = cpu
+    timings['workers'] = workers if len(misses) > 1 else 1
+    return results
+
+
+def log_timings(timings):
+    logging.info(
+        "Stage timings: "
+        f"hash {timings.get('hash', 0):.2f}s | "
+        f"cache {timings.get('cache', 0):.2f}s ({timings.get('cached_photos', 0)} photo(s) reused) | "
+        f"detect {timings.get('detect', 0):.2f}s ({timings.get('new_photos', 0)} new photo(s), "
+        f"{timings.get('detect_cpu', 0):.2f}s CPU on {timings.get('workers', 1)} worker(s)) | "
+        f"train {timings.get('train', 0):.2f}s | save {timings.get('save', 0):.2f}s | "
+        f"total {timings.get('total', 0):.2f}s"
+    )
+
+
+def photo_digest(path):
+    """SHA-256 of a photo's bytes; how the enrolled manifest recognises a photo."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dataset_photos(user_dir):
+    if not os.path.isdir(user_dir):
+        return []
+    return sorted(os.path.join(user_dir, f) for f in os.listdir(user_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def _enrolled_path(model_path):
+    return os.path.splitext(model_path)[0] + '.enrolled.json'
+
+
+def load_enrolled(model_path):
+    """{label: [photo digest]} of the photos in the model, or {} for models trained without a manifest."""
+    try:
+        with open(_enrolled_path(model_path), 'r') as f:
+            return {label: list(digests) for label, digests in json.load(f).items()}
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def save_enrolled(enrolled, model_path):
+    tmp = _enrolled_path(model_path) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({label: sorted(set(d)) for label, d in sorted(enrolled.items())}, f, indent=2)
+    os.replace(tmp, _enrolled_path(model_path))
+
+
+def load_labels(labels_path):
+    if not os.path.exists(labels_path):
+        return {}
+    with open(labels_path, 'r') as f:
+        return {int(k): v for k, v in json.load(f).items()}
+
+
+def save_labels(id_to_name, labels_path):
+    # Written last and atomically: the web server reloads once labels.json changes.
+    tmp = labels_path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({str(k): v for k, v in sorted(id_to_name.items())}, f, indent=2)
+    os.replace(tmp, labels_path)
+    logging.info(f"Labels saved to {labels_path}")
+
+
+def train_model(dataset_path='dataset', model_path='model.yml', labels_path='labels.json',
+                cache_dir=DEFAULT_CACHE_DIR, workers=None):
+    """
+    Enhanced training with better preprocessing and data augmentation.
+    Structure: dataset_path/User_Name/1.jpg, 2.jpg, ...
+    """
+    
+    if not os.path.exists(dataset_path):
+        logging.error(f"Dataset directory '{dataset_path}' not found.")
+        return
+
+    t_start = time.perf_counter()
+    timings = {}
+
+    # Initialize LBPH Face Recognizer with optimized parameters
+    recognizer = create_recognizer()
+
     faces = []
     ids = []
     label_map = {}
@@ -45,14 +339,16 @@ def train_model(dataset_path='dataset', model_path='model.yml', labels_path='lab
 
     logging.info("Starting enhanced training process...")
 
-    # Iterate through all user directories
+    # Collect photos per user directory; sorted so IDs are stable between runs
+    user_photos = []
     for root, dirs, files in os.walk(dataset_path):
-        image_files = [f for f in files if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+        dirs.sort()
+        image_files = sorted(f for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
         
         if not image_files:
             continue
         
-        label = os.path.basename(root).replace(" ", "_").lower()
+        label = label_for(os.path.basename(root))
         
         # Skip if it's the root dataset directory
         if root == dataset_path:
@@ -64,84 +360,23 @@ def train_model(dataset_path='dataset', model_path='model.yml', labels_path='lab
             logging.info(f"Assigned ID {current_id} to label '{label}'")
             current_id += 1
         
+        user_photos.append((label, [os.path.join(root, f) for f in image_files]))
+
+    # Detection and augmentation, cached per photo and spread over all cores
+    all_paths = [path for _, paths in user_photos for path in paths]
+    samples_by_path = collect_samples(all_paths, cache_dir=cache_dir, workers=workers, timings=timings)
+
+    enrolled = {}
+    for label, paths in user_photos:
         label_id = label_map[label]
         user_face_count = 0
-
-        for file in image_files:
-            path = os.path.join(root, file)
-            
-            try:
-                # Read image in color first
-                img_color = cv2.imread(path, cv2.IMREAD_COLOR)
-                if img_color is None:
-                    logging.warning(f"Could not read image: {path}")
-                    continue
-                
-                # Convert to grayscale
-                img = cv2.cvtColor(img_color, cv2.COLOR_BGR2GRAY)
-                
-                # Apply CLAHE for better contrast
-                clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-                img = clahe.apply(img)
-                
-                # Try multiple detection strategies
-                detected_faces = face_cascade.detectMultiScale(
-                    img, 
-                    scaleFactor=1.1, 
-                    minNeighbors=4,
-                    minSize=(30, 30)
-                )
-                
-                # If no face found, try alternative cascade
-                if len(detected_faces) == 0 and not face_cascade_alt.empty():
-                    detected_faces = face_cascade_alt.detectMultiScale(
-                        img,
-                        scaleFactor=1.1,
-                        minNeighbors=3,
-                        minSize=(30, 30)
-                    )
-                
-                if len(detected_faces) == 0:
-                    logging.warning(f"No face detected in: {path}")
-                    continue
-                
-                # Process each detected face
-                for (x, y, w, h) in detected_faces:
-                    # Extract face ROI
-                    roi = img[y:y+h, x:x+w]
-                    
-                    # Resize to uniform size
-                    roi_resized = cv2.resize(roi, (200, 200))
-                    
-                    # Apply histogram equalization
-                    roi_equalized = cv2.equalizeHist(roi_resized)
-                    
-                    # Add original processed face
-                    faces.append(roi_equalized)
-                    ids.append(label_id)
-                    user_face_count += 1
-                    
-                    # Data augmentation: slight brightness variations
-                    # This helps the model generalize better to different lighting
-                    for brightness_delta in [-30, 30]:
-                        roi_bright = cv2.convertScaleAbs(roi_resized, alpha=1.0, beta=brightness_delta)
-                        roi_bright = cv2.equalizeHist(roi_bright)
-                        faces.append(roi_bright)
-                        ids.append(label_id)
-                        user_face_count += 1
-                    
-                    # Data augmentation: horizontal flip
-                    # Helps with slight angle variations
-                    roi_flip = cv2.flip(roi_equalized, 1)
-                    faces.append(roi_flip)
-                    ids.append(label_id)
-                    user_face_count += 1
-                    
-                    # Only use first face if multiple detected in training image
-                    break
-                    
-            except Exception as e:
-                logging.error(f"Error processing {path}: {e}")
+        for path in paths:
+            samples = samples_by_path.get(path, [])
+            faces.extend(samples)
+            ids.extend([label_id] * len(samples))
+            user_face_count += len(samples)
+            if samples:
+                enrolled.setdefault(label, []).append(photo_digest(path))
 
         if user_face_count > 0:
             logging.info(f"Collected {user_face_count} training samples for '{label}' (ID: {label_id})")
@@ -152,17 +387,24 @@ def train_model(dataset_path='dataset', model_path='model.yml', labels_path='lab
 
     # Train the model
     logging.info(f"Training on {len(faces)} face samples (including augmented data) for {len(label_map)} subjects...")
+    t0 = time.perf_counter()
     recognizer.train(faces, np.array(ids))
+    timings['train'] = time.perf_counter() - t0
 
     # Save the model
+    t0 = time.perf_counter()
     recognizer.save(model_path)
     logging.info(f"Model saved to {model_path}")
 
+    # Binary copy of the histograms; FaceEngine memory-maps this instead of parsing the YAML
+    export_recognizer(recognizer, os.path.splitext(model_path)[0])
+    # Which photos are in the model, so enroll() never adds one twice
+    save_enrolled(enrolled, model_path)
+    timings['save'] = time.perf_counter() - t0
+
     # Save the label mapping (ID -> Name)
     id_to_name = {v: k for k, v in label_map.items()}
-    with open(labels_path, 'w') as f:
-        json.dump(id_to_name, f, indent=2)
-    logging.info(f"Labels saved to {labels_path}")
+    save_labels(id_to_name, labels_path)
     
     # Print training summary
     logging.info("=" * 60)
@@ -175,12 +417,131 @@ def train_model(dataset_path='dataset', model_path='model.yml', labels_path='lab
     for label_id, name in sorted(id_to_name.items()):
         count = ids.count(label_id)
         logging.info(f"  ID {label_id}: {name} ({count} samples)")
+    timings['total'] = time.perf_counter() - t_start
+    log_timings(timings)
     logging.info("=" * 60)
 
+def enroll(name, image_paths, dataset_path='dataset', model_path='model.yml', labels_path='labels.json',
+           cache_dir=DEFAULT_CACHE_DIR, workers=None):
+    """
+    Add photos of one (new or existing) user to the trained model without
+    retraining everyone: only the new photos are detected and histogrammed,
+    then appended with LBPH update() and to the histogram store.
+
+    Photos already in the model (by content, see load_enrolled()) are
+    skipped; returns False if that leaves nothing to enroll.
+    """
+    if not os.path.exists(model_path):
+        logging.error(f"No trained model at {model_path}; run a full training first.")
+        return False
+
+    t0 = time.perf_counter()
+    id_to_name = load_labels(labels_path)
+    label = label_for(name)
+    name_to_id = {v: k for k, v in id_to_name.items()}
+    if label in name_to_id:
+        label_id = name_to_id[label]
+        logging.info(f"Adding photos to existing user '{label}' (ID: {label_id})")
+    else:
+        label_id = max(id_to_name, default=-1) + 1
+        logging.info(f"Assigned ID {label_id} to new user '{label}'")
+
+    user_dir = os.path.join(dataset_path, label)
+    enrolled = load_enrolled(model_path)
+    if label in enrolled:
+        known = set(enrolled[label])
+    elif label in name_to_id:
+        # Trained before the manifest existed: training used everything in dataset/<label>.
+        known = {photo_digest(path) for path in dataset_photos(user_dir)}
+    else:
+        known = set()
+    new_digests = {}
+    for path in image_paths:
+        digest = photo_digest(path)
+        if digest not in known and digest not in new_digests.values():
+            new_digests[path] = digest
+    new_paths = list(new_digests)
+    if not new_paths:
+        logging.warning(f"All {len(image_paths)} photo(s) are already enrolled for '{label}'. Nothing enrolled.")
+        return False
+    if len(new_paths) < len(image_paths):
+        logging.info(f"Skipping {len(image_paths) - len(new_paths)} photo(s) already enrolled for '{label}'")
+    image_paths = new_paths
+
+    # Keep the dataset complete so a later full training includes these photos
+    os.makedirs(user_dir, exist_ok=True)
+    faces = []
+    samples_by_path = collect_samples(image_paths, cache_dir=cache_dir, workers=workers)
+    for path in image_paths:
+        samples = samples_by_path.get(path, [])
+        if not samples:
+            continue
+        faces.extend(samples)
+        if os.path.abspath(os.path.dirname(path)) != os.path.abspath(user_dir):
+            dest = os.path.join(user_dir, os.path.basename(path))
+            if not os.path.exists(dest):
+                shutil.copy2(path, dest)
+    t_detect = time.perf_counter() - t0
+
+    if not faces:
+        logging.warning(f"No faces found in the {len(image_paths)} photo(s). Nothing enrolled.")
+        return False
+    ids = np.full(len(faces), label_id, dtype=np.int32)
+
+    # model.yml: LBPH update() appends the new samples' histograms
+    t1 = time.perf_counter()
+    recognizer = create_recognizer()
+    recognizer.read(model_path)
+    recognizer.update(faces, ids)
+    recognizer.save(model_path)
+    t_model = time.perf_counter() - t1
+
+    # Histogram store: append only the new rows
+    t2 = time.perf_counter()
+    base_path = os.path.splitext(model_path)[0]
+    if store_exists(base_path):
+        append_histograms(base_path, compute_histograms(read_meta(base_path), faces), ids)
+    else:
+        export_recognizer(recognizer, base_path)
+    t_store = time.perf_counter() - t2
+
+    # Photos without a face stay out of the manifest, like in train_model()
+    enrolled[label] = sorted(known | {new_digests[path] for path in image_paths if samples_by_path.get(path)})
+    save_enrolled(enrolled, model_path)
+    id_to_name[label_id] = label
+    save_labels(id_to_name, labels_path)
+
+    logging.info(
+        f"Enrolled {len(faces)} sample(s) for '{label}' (ID: {label_id}) in {time.perf_counter() - t0:.2f}s "
+        f"(detect {t_detect:.2f}s, model.yml {t_model:.2f}s, store {t_store:.2f}s)"
+    )
+    return True
+
+
 if __name__ == "__main__":
     base_dir = os.path.dirname(os.path.abspath(__file__))
     dataset_dir = os.path.join(base_dir, 'dataset')
     model_file = os.path.join(base_dir, 'model.yml')
     labels_file = os.path.join(base_dir, 'labels.json')
 
-    train_model(dataset_dir, model_file, labels_file)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the face model, or enroll one user incrementally.")
+    parser.add_argument("--enroll", metavar="NAME", help="add photos for NAME without retraining everyone")
+    parser.add_argument(
+        "images", nargs="*",
+        help="photos to enroll (default: every image in dataset/NAME not yet in the model)",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="detection processes (default: CPU count)")
+    parser.add_argument("--no-cache", action="store_true", help="ignore and do not write the sample cache")
+    args = parser.parse_args()
+    cache_dir = None if args.no_cache else DEFAULT_CACHE_DIR
+
+    if args.enroll:
+        images = args.images
+        if not images:
+            images = dataset_photos(os.path.join(dataset_dir, label_for(args.enroll)))
+        if not images:
+            parser.error(f"no photos given and none found for '{args.enroll}'")
+        ok = enroll(args.enroll, images, dataset_dir, model_file, labels_file, cache_dir=cache_dir, workers=args.workers)
+        sys.exit(0 if ok else 1)
+
+    train_model(dataset_dir, model_file, labels_file, cache_dir=cache_dir, workers=args.workers)
\ No newline at end of file
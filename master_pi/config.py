@@ -12,9 +12,22 @@ SOUND_PIN = 6
 
 # Automation
 TEMP_HIGH_C = 30.0
+# The temperature alarm ignores readings older than this (DHT failing or the
+# peripheral gone quiet). Must exceed the peripheral's idle STATE interval.
+TEMP_MAX_AGE_SEC = 30.0
 ALARM_BEEP_SECONDS = 30.0
 
 MQTT_HOST = "localhost"
 MQTT_PORT = 1883
 MQTT_KEEPALIVE_SEC = 30
 MQTT_BASE_TOPIC = "smarthome"
+# State is published when it changes (checked every STATE_PUBLISH_SEC, or at
+# once on a peripheral EVENT), and re-sent unchanged every STATE_HEARTBEAT_SEC.
+STATE_PUBLISH_SEC = 0.5
+STATE_HEARTBEAT_SEC = 10.0
+
+# Metrics bridged to the web server's /metrics
+METRICS_PUBLISH_SEC = 10.0
+
+# Profiling (--profile / SMARTHOME_PROFILE=1)
+PROFILE_REPORT_SEC = 30.0
@@ -1,18 +1,31 @@
 # master_pi/main.py
 
 import argparse
+import os
+import sys
 import threading
 import time
 from typing import Dict, Optional
 
 import RPi.GPIO as GPIO
 
+# Shared helpers live in <repo>/utils. Appended (not prepended) so this
+# directory's config.py still wins over the top-level one.
+_PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.append(_PROJECT_ROOT)
+
 import config
 from gpio_devices import Buzzer, Led
 from mqtt_gateway import MqttGateway
 from sound_sensor import DoubleClapDetector
+from state_sync import apply_event, apply_state, publish_state_loop
 from system_state import state
 from uart_link import SerialLink
+from utils.metrics import LoopTimer, expand_snapshot, registry
+from utils.profiler import Profiler, profiling_requested
+
+_ALARM_TRIGGERS = registry.counter("alarm_triggers_total", "Alarms started by automation.", ["reason"])
 
 
 def now_ms() -> int:
@@ -22,8 +35,15 @@ def now_ms() -> int:
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--mode", choices=["normal", "ping"], default="normal")
+    parser.add_argument("--profile", action="store_true", help="per-thread CPU and loop-lag reports (or SMARTHOME_PROFILE=1)")
+    parser.add_argument("--profile-stacks", metavar="PATH", help="also write collapsed stack samples for flamegraph.pl")
     args = parser.parse_args()
 
+    profiler: Optional[Profiler] = None
+    if profiling_requested(args.profile) or args.profile_stacks:
+        profiler = Profiler(report_sec=config.PROFILE_REPORT_SEC, stacks_path=args.profile_stacks)
+        profiler.start()
+
     GPIO.setwarnings(False)
     GPIO.setmode(GPIO.BCM)
 
@@ -33,6 +53,10 @@ def main() -> None:
     buzzer.setup()
 
     ping_wait: Dict[str, float] = {}
+    peripheral_metrics: Dict[str, dict] = {}
+    # Set on every peripheral EVENT: wakes the MQTT publisher (and the flame alarm) at once.
+    state_dirty = threading.Event()
+    flame_changed = threading.Event()
 
     def on_uart_message(msg: Dict) -> None:
         t = msg.get("t")
@@ -49,22 +73,23 @@ def main() -> None:
             return
 
         if t == "STATE":
-            with state.lock:
-                state.temperature_c = msg.get("temperature_c")
-                state.humidity_pct = msg.get("humidity_pct")
-                state.motion = bool(msg.get("motion", False))
-                state.flame_detected = bool(msg.get("flame_detected", False))
-                state.laser_beam_ok = bool(msg.get("laser_beam_ok", False))
-                state.crossing_detected = bool(msg.get("crossing_detected", False))
-                state.door_closed = bool(msg.get("door_closed", False))
-                state.door_locked = bool(msg.get("door_locked", False))
-                state.laser_on = bool(msg.get("laser_on", False))
-                state.safety_laser_enabled = bool(msg.get("safety_laser_enabled", False))
-                state.peripheral_alarm = bool(msg.get("alarm", False))
+            apply_state(state, msg)
             return
 
         if t == "EVENT":
-            # Reserved for phase-1 event streaming; keep for extensibility.
+            field = apply_event(state, msg)
+            if field is None:
+                return
+            state_dirty.set()
+            if field == "flame_detected":
+                flame_changed.set()
+            return
+
+        if t == "METRICS":
+            # One part of the peripheral's compact snapshot; families are replaced as they arrive.
+            data = msg.get("m")
+            if isinstance(data, dict):
+                peripheral_metrics.update(expand_snapshot(data))
             return
 
     link = SerialLink(
@@ -115,7 +140,7 @@ def main() -> None:
                 state.led_on = False
             send_master_led_state(False)
 
-        threading.Thread(target=worker, daemon=True).start()
+        threading.Thread(target=worker, name="TIMED_LED", daemon=True).start()
 
     def set_modes(*, clap: Optional[bool] = None, sound: Optional[bool] = None, motion: Optional[bool] = None) -> None:
         # Clap toggle and Sound LED mode are mutually exclusive.
@@ -196,6 +221,13 @@ def main() -> None:
                 link.send({"t": "CMD", "name": "SAFETY_LASER", "value": on})
             return
 
+        if path == "peripheral/state_boost":
+            # Web server asks for fast STATE updates while the dashboard is open.
+            seconds = obj.get("seconds")
+            if isinstance(seconds, (int, float)) and not isinstance(seconds, bool) and seconds > 0:
+                link.send({"t": "CMD", "name": "STATE_BOOST", "value": float(seconds)})
+            return
+
         if path == "peripheral/alarm":
             on = obj.get("on")
             if isinstance(on, bool):
@@ -211,14 +243,24 @@ def main() -> None:
     )
     mqtt.start()
 
-    def mqtt_state_loop() -> None:
+    threading.Thread(
+        target=publish_state_loop,
+        args=(state, mqtt.publish_state, state_dirty),
+        kwargs={"publish_sec": config.STATE_PUBLISH_SEC, "heartbeat_sec": config.STATE_HEARTBEAT_SEC},
+        name="MQTT_STATE",
+        daemon=True,
+    ).start()
+
+    def metrics_loop() -> None:
+        # Bridge this process' metrics (and the peripheral's, relayed over UART)
+        # to the web server, which serves them on /metrics.
         while True:
-            with state.lock:
-                snapshot = state.to_dict()
-            mqtt.publish_state(snapshot)
-            time.sleep(0.5)
+            time.sleep(config.METRICS_PUBLISH_SEC)
+            mqtt.publish_metrics("master", registry.snapshot())
+            if peripheral_metrics:
+                mqtt.publish_metrics("peripheral", dict(peripheral_metrics))
 
-    threading.Thread(target=mqtt_state_loop, name="MQTT_STATE", daemon=True).start()
+    threading.Thread(target=metrics_loop, name="METRICS", daemon=True).start()
 
     def set_sound_flag(on: bool) -> None:
         with state.lock:
@@ -260,6 +302,7 @@ def main() -> None:
 
     def motion_led_loop() -> None:
         nonlocal last_motion
+        timer = LoopTimer("MOTION_LED", 0.05)
         while True:
             with state.lock:
                 enabled = state.motion_led_mode_enabled
@@ -269,7 +312,7 @@ def main() -> None:
                 start_timed_led(10.0)
 
             last_motion = motion
-            time.sleep(0.05)
+            timer.sleep()
 
     threading.Thread(target=motion_led_loop, name="MOTION_LED", daemon=True).start()
 
@@ -299,23 +342,26 @@ def main() -> None:
             state.alarm_active = True
 
         link.send({"t": "CMD", "name": "ALARM", "value": True})
-        threading.Thread(target=alarm_worker, daemon=True).start()
+        threading.Thread(target=alarm_worker, name="ALARM", daemon=True).start()
 
     last_flame = False
 
     def flame_alarm_loop() -> None:
         nonlocal last_flame
         while True:
+            # Woken at once by a FLAME event; the timeout covers STATE-only updates.
+            flame_changed.wait(0.05)
+            flame_changed.clear()
             with state.lock:
                 flame = bool(state.flame_detected)
 
             if flame and not last_flame:
                 print("[AUTO] Flame detected -> alarm")
+                _ALARM_TRIGGERS.labels("flame").inc()
                 ensure_alarm_started()
                 mqtt.publish_event("flame_detected", {"on": True})
 
             last_flame = flame
-            time.sleep(0.05)
 
     threading.Thread(target=flame_alarm_loop, name="FLAME_ALARM", daemon=True).start()
 
@@ -334,20 +380,27 @@ def main() -> None:
                 time.sleep(1.0)
 
         # normal mode
+        timer = LoopTimer("TEMP_ALARM", 0.05)
         while True:
             with state.lock:
                 temp = state.temperature_c
+                read_at = state.temperature_read_at
                 alarm_active = state.alarm_active
 
-            if temp is not None and temp >= config.TEMP_HIGH_C and not alarm_active:
+            # The peripheral already median-filters; only act on a fresh value.
+            fresh = read_at is not None and time.monotonic() - read_at <= config.TEMP_MAX_AGE_SEC
+            if fresh and temp is not None and temp >= config.TEMP_HIGH_C and not alarm_active:
                 print(f"[AUTO] High temp {temp:.1f}C >= {config.TEMP_HIGH_C:.1f}C -> alarm")
+                _ALARM_TRIGGERS.labels("temperature").inc()
                 ensure_alarm_started()
 
-            time.sleep(0.05)
+            timer.sleep()
 
     except KeyboardInterrupt:
         pass
     finally:
+        if profiler is not None:
+            profiler.stop()
         if sound is not None:
             sound.stop()
         mqtt.stop()
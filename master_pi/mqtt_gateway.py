@@ -5,6 +5,14 @@ from typing import Callable, Optional
 
 import paho.mqtt.client as mqtt
 
+from utils.metrics import registry
+
+_PUBLISHED = registry.counter("mqtt_published_total", "Messages handed to the MQTT client.", ["kind"])
+_PUBLISH_ERRORS = registry.counter("mqtt_publish_errors_total", "Publishes that raised.", ["kind"])
+_COMMANDS = registry.counter("mqtt_commands_total", "Commands received on cmd/#.")
+_COMMAND_ERRORS = registry.counter("mqtt_command_errors_total", "Commands whose handler raised.")
+_CONNECTED = registry.gauge("mqtt_connected", "1 while connected to the broker.")
+
 
 def _topic(base: str, suffix: str) -> str:
     base = base.rstrip("/")
@@ -72,25 +80,36 @@ class MqttGateway:
     def publish_state(self, state_obj: dict) -> None:
         try:
             self._client.publish(_topic(self._base, "state"), json.dumps(state_obj), qos=0, retain=True)
+            _PUBLISHED.labels("state").inc()
         except Exception:
-            pass
+            _PUBLISH_ERRORS.labels("state").inc()
 
     def publish_event(self, name: str, value: object) -> None:
         msg = {"ts": int(time.time() * 1000), "name": name, "value": value}
         try:
             self._client.publish(_topic(self._base, "events"), json.dumps(msg), qos=0, retain=False)
+            _PUBLISHED.labels("event").inc()
         except Exception:
-            pass
+            _PUBLISH_ERRORS.labels("event").inc()
+
+    def publish_metrics(self, process: str, snapshot: dict) -> None:
+        try:
+            self._client.publish(_topic(self._base, f"metrics/{process}"), json.dumps(snapshot), qos=0, retain=False)
+            _PUBLISHED.labels("metrics").inc()
+        except Exception:
+            _PUBLISH_ERRORS.labels("metrics").inc()
 
     def _on_connect(self, _client, _userdata, _flags, rc, _properties=None):
         if rc == 0:
             self._log("[MQTT] Connected")
+            _CONNECTED.set(1)
             self._client.publish(_topic(self._base, "master/status"), payload="online", retain=True)
             self._client.subscribe(_topic(self._base, "cmd/#"))
         else:
             self._log(f"[MQTT] Connect failed rc={rc}")
 
     def _on_disconnect(self, _client, _userdata, rc, _properties=None):
+        _CONNECTED.set(0)
         if rc != 0:
             self._log(f"[MQTT] Disconnected rc={rc} (will retry)")
 
@@ -118,7 +137,9 @@ class MqttGateway:
             if b is not None:
                 parsed = {"on": b}
 
+        _COMMANDS.inc()
         try:
             self._on_command(cmd_path, parsed)
         except Exception as e:
             self._log(f"[MQTT] Command handler error: {e}")
+            _COMMAND_ERRORS.inc()
@@ -0,0 +1,82 @@
+# master_pi/state_sync.py
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# Peripheral -> master -> MQTT state path, kept out of main() so that
+# benchmarks/e2e_latency.py drives the same code the gateway runs.
+#
+# The peripheral reports safety-relevant changes as EVENTs the moment they
+# happen; STATE snapshots only follow as a slow heartbeat. Whatever arrives is
+# applied to SystemState here, and publish_state_loop() forwards the result to
+# MQTT when it changed (or as a heartbeat).
+
+# Peripheral EVENT name -> SystemState field
+PERIPHERAL_EVENTS = {
+    "MOTION": "motion",
+    "FLAME": "flame_detected",
+    "CROSSING": "crossing_detected",
+    "DOOR_CLOSED": "door_closed",
+    "DOOR_LOCKED": "door_locked",
+}
+
+
+def apply_state(state, msg: Dict) -> None:
+    """Copy a peripheral STATE snapshot into `state`."""
+    with state.lock:
+        state.temperature_c = msg.get("temperature_c")
+        state.humidity_pct = msg.get("humidity_pct")
+        age = msg.get("dht_age_sec")
+        if isinstance(age, (int, float)) and not isinstance(age, bool):
+            state.temperature_read_at = time.monotonic() - max(0.0, float(age))
+        else:
+            # Peripherals that predate dht_age_sec: the snapshot time is the best we know.
+            state.temperature_read_at = time.monotonic() if state.temperature_c is not None else None
+        state.motion = bool(msg.get("motion", False))
+        state.flame_detected = bool(msg.get("flame_detected", False))
+        state.laser_beam_ok = bool(msg.get("laser_beam_ok", False))
+        state.crossing_detected = bool(msg.get("crossing_detected", False))
+        state.door_closed = bool(msg.get("door_closed", False))
+        state.door_locked = bool(msg.get("door_locked", False))
+        state.laser_on = bool(msg.get("laser_on", False))
+        state.safety_laser_enabled = bool(msg.get("safety_laser_enabled", False))
+        state.peripheral_alarm = bool(msg.get("alarm", False))
+
+
+def apply_event(state, msg: Dict) -> Optional[str]:
+    """Apply a peripheral EVENT to `state`; returns the field it set, or None if it isn't one of ours."""
+    field = PERIPHERAL_EVENTS.get(msg.get("name"))
+    if field is None:
+        return None
+    with state.lock:
+        setattr(state, field, bool(msg.get("value", False)))
+        if "laser_beam_ok" in msg:
+            state.laser_beam_ok = bool(msg["laser_beam_ok"])
+    return field
+
+
+def publish_state_loop(
+    state,
+    publish: Callable[[dict], None],
+    dirty: threading.Event,
+    *,
+    publish_sec: float,
+    heartbeat_sec: float,
+) -> None:
+    """Publish `state` whenever it changed, or unchanged every `heartbeat_sec`. Never returns.
+
+    Checks as soon as `dirty` is set (a peripheral EVENT landed), else every `publish_sec`.
+    """
+    last: Optional[dict] = None
+    last_at = 0.0
+    while True:
+        dirty.wait(publish_sec)
+        dirty.clear()
+        with state.lock:
+            snapshot = state.to_dict()
+        now = time.monotonic()
+        if snapshot == last and now - last_at < heartbeat_sec:
+            continue
+        publish(snapshot)
+        last, last_at = snapshot, now
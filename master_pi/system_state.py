@@ -20,6 +20,7 @@ class SystemState:
     # Remote (Peripheral Pi)
     temperature_c: Optional[float] = None
     humidity_pct: Optional[float] = None
+    temperature_read_at: Optional[float] = None  # time.monotonic() of the peripheral's DHT read
     motion: bool = False
     flame_detected: bool = False
     laser_beam_ok: bool = False
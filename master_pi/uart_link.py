@@ -1,14 +1,28 @@
 # master_pi/uart_link.py
 
+import itertools
 import json
 import queue
 import threading
 import time
-from typing import Callable, Dict, Optional
+from typing import Callable, Dict, Optional, Tuple
 
 import serial
 from serial import SerialException
 
+from utils.metrics import registry
+
+_MSG_TYPES = {"STATE", "EVENT", "CMD", "PING", "PONG", "METRICS"}
+
+_PRIO_NORMAL = 0
+_PRIO_BULK = 1
+
+_TX_FRAMES = registry.counter("uart_tx_frames_total", "Frames written to the UART.")
+_TX_QUEUE = registry.gauge("uart_tx_queue_depth", "Frames waiting in the UART TX queue.")
+_RX_FRAMES = registry.counter("uart_rx_frames_total", "JSON frames received from the UART.", ["type"])
+_RX_DROPPED = registry.counter("uart_rx_dropped_total", "Received lines that were dropped.", ["reason"])
+_DISCONNECTS = registry.counter("uart_disconnects_total", "Serial port disconnects.")
+
 
 class SerialLink:
     """Newline-delimited JSON link with auto-reconnect.
@@ -30,9 +44,17 @@ class SerialLink:
         self._reconnect_delay_sec = reconnect_delay_sec
         self._log = logger
 
-        self._tx: "queue.Queue[Dict]" = queue.Queue()
+        # (priority, seq, frame): bulk frames (METRICS) only go out when nothing else
+        # is waiting, and each is drained before the next pick, so a STATE/EVENT
+        # never queues behind more than one of them.
+        self._tx: "queue.PriorityQueue[Tuple[int, int, Dict]]" = queue.PriorityQueue()
+        self._tx_seq = itertools.count()
         self._stop = threading.Event()
         self._thread: Optional[threading.Thread] = None
+        self._tx_thread: Optional[threading.Thread] = None
+        # Open port shared by the RX and TX threads (None while disconnected)
+        self._ser = None
+        self._ser_cond = threading.Condition()
 
     def start(self) -> None:
         if self._thread and self._thread.is_alive():
@@ -40,16 +62,22 @@ class SerialLink:
         self._stop.clear()
         self._thread = threading.Thread(target=self._run, name="UART", daemon=True)
         self._thread.start()
+        # Writes get their own thread so a frame never waits for readline() to time out.
+        self._tx_thread = threading.Thread(target=self._tx_run, name="UART_TX", daemon=True)
+        self._tx_thread.start()
 
     def stop(self) -> None:
         self._stop.set()
+        with self._ser_cond:
+            self._ser_cond.notify_all()
 
-    def send(self, msg: Dict) -> None:
+    def send(self, msg: Dict, bulk: bool = False) -> None:
         # Best-effort; drop if extremely overloaded.
         try:
-            self._tx.put_nowait(msg)
+            self._tx.put_nowait((_PRIO_BULK if bulk else _PRIO_NORMAL, next(self._tx_seq), msg))
         except queue.Full:
             pass
+        _TX_QUEUE.set(self._tx.qsize())
 
     def _run(self) -> None:
         while not self._stop.is_set():
@@ -62,22 +90,11 @@ class SerialLink:
                     write_timeout=0.5,
                 )
                 self._log(f"[UART] Connected: {self._port} @ {self._baudrate}")
+                with self._ser_cond:
+                    self._ser = ser
+                    self._ser_cond.notify_all()
 
                 while not self._stop.is_set():
-                    # Drain TX queue first
-                    while True:
-                        try:
-                            msg = self._tx.get_nowait()
-                        except queue.Empty:
-                            break
-
-                        try:
-                            line = json.dumps(msg, separators=(",", ":"), ensure_ascii=False) + "\n"
-                            ser.write(line.encode("utf-8"))
-                        except Exception as e:
-                            self._log(f"[UART] TX error: {e}")
-                            break
-
                     # RX
                     raw = ser.readline()
                     if not raw:
@@ -86,6 +103,7 @@ class SerialLink:
                     try:
                         text = raw.decode("utf-8").strip()
                     except UnicodeDecodeError:
+                        _RX_DROPPED.labels("decode").inc()
                         continue
 
                     if not text:
@@ -95,20 +113,29 @@ class SerialLink:
                         msg = json.loads(text)
                     except json.JSONDecodeError:
                         self._log(f"[UART] Malformed JSON: {text[:200]}")
+                        _RX_DROPPED.labels("malformed").inc()
                         continue
 
                     if not isinstance(msg, dict):
+                        _RX_DROPPED.labels("not_object").inc()
                         continue
 
+                    t = msg.get("t")
+                    _RX_FRAMES.labels(t if t in _MSG_TYPES else "other").inc()
+
                     try:
                         self._on_message(msg)
                     except Exception as e:
                         # Never let a callback crash the UART thread.
                         self._log(f"[UART] on_message error: {e}")
+                        _RX_DROPPED.labels("callback").inc()
 
             except (OSError, SerialException) as e:
                 self._log(f"[UART] Disconnected: {e}")
+                _DISCONNECTS.inc()
             finally:
+                with self._ser_cond:
+                    self._ser = None
                 try:
                     if ser is not None:
                         ser.close()
@@ -117,3 +144,31 @@ class SerialLink:
 
             # Backoff
             time.sleep(self._reconnect_delay_sec)
+
+    def _tx_run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                prio, _seq, msg = self._tx.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            _TX_QUEUE.set(self._tx.qsize())
+
+            # Frames queued while disconnected go out once the port is back.
+            with self._ser_cond:
+                while self._ser is None and not self._stop.is_set():
+                    self._ser_cond.wait(0.5)
+                ser = self._ser
+            if ser is None:
+                return
+
+            try:
+                line = json.dumps(msg, separators=(",", ":"), ensure_ascii=False) + "\n"
+                ser.write(line.encode("utf-8"))
+                if prio == _PRIO_BULK:
+                    # Wait for it to leave the UART, or later frames would queue
+                    # behind it in the driver's buffer instead of here.
+                    ser.flush()
+                _TX_FRAMES.inc()
+            except Exception as e:
+                # The RX thread notices a dead port and reconnects.
+                self._log(f"[UART] TX error: {e}")
@@ -0,0 +1,288 @@
+# peripheral_pi/adc.py
+
+import ctypes
+import fcntl
+import threading
+import time
+from array import array
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+from utils.metrics import registry
+
+# Batched MCP3008 sampling.
+#
+# A plain spidev xfer2() is one syscall (and, with a GPIO chip select, two more
+# GPIO writes) per conversion, so Python tops out at a few hundred samples a
+# second. SpiBurst instead hands the kernel a whole list of 3-byte conversions
+# in one SPI_IOC_MESSAGE ioctl: chip select is released between them
+# (cs_change) and delay_usecs spaces them evenly, so one call returns e.g. 50
+# samples taken 1 ms apart and the GIL is free while the kernel clocks them.
+#
+# AdcSampler runs those bursts on its own thread and stores the results, with
+# timestamps, in a SampleRing of preallocated arrays (no numpy on this Pi).
+
+_RATE = registry.gauge("adc_sample_rate_hz", "Effective ADC sample sets per second, by sampler.", ["sampler"])
+_SAMPLES = registry.counter("sensor_samples_total", "Sensor reads, by sensor.", ["sensor"])
+_BURST_SECONDS = registry.histogram(
+    "adc_burst_seconds",
+    "Wall time of one ADC sampling block.",
+    ["sampler"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+# linux/spi/spidev.h
+_SPI_IOC_MAGIC = ord("k")
+_IOC_WRITE = 1
+
+
+class _SpiIocTransfer(ctypes.Structure):
+    _fields_ = [
+        ("tx_buf", ctypes.c_uint64),
+        ("rx_buf", ctypes.c_uint64),
+        ("len", ctypes.c_uint32),
+        ("speed_hz", ctypes.c_uint32),
+        ("delay_usecs", ctypes.c_uint16),
+        ("bits_per_word", ctypes.c_uint8),
+        ("cs_change", ctypes.c_uint8),
+        ("tx_nbits", ctypes.c_uint8),
+        ("rx_nbits", ctypes.c_uint8),
+        ("word_delay_usecs", ctypes.c_uint8),
+        ("pad", ctypes.c_uint8),
+    ]
+
+
+def _spi_ioc_message(n: int) -> int:
+    size = n * ctypes.sizeof(_SpiIocTransfer)
+    return (_IOC_WRITE << 30) | (size << 16) | (_SPI_IOC_MAGIC << 8)
+
+
+class SpiBurst:
+    """A fixed list of MCP3008 conversions issued as one SPI_IOC_MESSAGE ioctl."""
+
+    MAX_TRANSFERS = 256
+
+    def __init__(self, channels: Sequence[int], speed_hz: int, spacing_us: int = 0):
+        n = len(channels)
+        if n < 1 or n > self.MAX_TRANSFERS:
+            raise ValueError(f"burst must have 1..{self.MAX_TRANSFERS} conversions")
+        self.channels = tuple(channels)
+        tx = bytearray()
+        for ch in self.channels:
+            tx += bytes((1, (8 + ch) << 4, 0))
+        self._tx = ctypes.create_string_buffer(bytes(tx), len(tx))
+        self._rx = ctypes.create_string_buffer(len(tx))
+        self._xfers = (_SpiIocTransfer * n)()
+        delay = max(0, min(0xFFFF, int(spacing_us)))
+        for i, xfer in enumerate(self._xfers):
+            xfer.tx_buf = ctypes.addressof(self._tx) + 3 * i
+            xfer.rx_buf = ctypes.addressof(self._rx) + 3 * i
+            xfer.len = 3
+            xfer.speed_hz = int(speed_hz)
+            xfer.delay_usecs = delay
+            # Release CS after every conversion but the last; the MCP3008 starts
+            # a new conversion on each falling edge.
+            xfer.cs_change = 1 if i < n - 1 else 0
+        self._request = _spi_ioc_message(n)
+
+    def run(self, fd: int) -> List[int]:
+        fcntl.ioctl(fd, self._request, self._xfers)
+        raw = self._rx.raw
+        return [((raw[i + 1] & 3) << 8) | raw[i + 2] for i in range(0, len(raw), 3)]
+
+
+class Block(NamedTuple):
+    """One sampling block: `values` are interleaved in `channels` order, one set per timestamp."""
+
+    timestamps: List[float]
+    channels: Tuple[int, ...]
+    values: List[int]
+
+    def series(self, channel: int) -> List[int]:
+        idx = self.channels.index(channel)
+        return self.values[idx :: len(self.channels)]
+
+
+class SampleRing:
+    """Last `capacity` sample sets of a fixed channel list, with monotonic timestamps.
+
+    Backed by preallocated arrays that are overwritten in place, so a long
+    running sampler never allocates per sample.
+    """
+
+    def __init__(self, channels: Sequence[int], capacity: int = 4096):
+        self.channels = tuple(channels)
+        self.capacity = max(2, int(capacity))
+        self._n = len(self.channels)
+        self._t = array("d", bytes(8 * self.capacity))
+        self._v = array("H", bytes(2 * self.capacity * self._n))
+        self._lock = threading.Lock()
+        self._head = 0  # next slot to write
+        self.written = 0  # sets ever written
+
+    def extend(self, timestamps: Sequence[float], values: Sequence[int]) -> None:
+        n = self._n
+        frames = len(timestamps)
+        if frames == 0:
+            return
+        if frames > self.capacity:
+            timestamps = timestamps[-self.capacity :]
+            values = values[-self.capacity * n :]
+            frames = self.capacity
+        with self._lock:
+            start = self._head
+            first = min(frames, self.capacity - start)
+            self._t[start : start + first] = array("d", timestamps[:first])
+            self._v[start * n : (start + first) * n] = array("H", values[: first * n])
+            rest = frames - first
+            if rest:
+                self._t[0:rest] = array("d", timestamps[first:])
+                self._v[0 : rest * n] = array("H", values[first * n :])
+            self._head = (start + frames) % self.capacity
+            self.written += frames
+
+    def _slots(self, count: int) -> List[int]:
+        count = min(count, self.written, self.capacity)
+        return [(self._head - count + i) % self.capacity for i in range(count)]
+
+    def latest(self, channel: int, count: int = 1) -> List[Tuple[float, int]]:
+        """Up to `count` most recent (timestamp, value) pairs of `channel`, oldest first."""
+        idx = self.channels.index(channel)
+        with self._lock:
+            return [(self._t[s], self._v[s * self._n + idx]) for s in self._slots(count)]
+
+    def window(self, channel: int, seconds: float) -> List[int]:
+        """Values of `channel` sampled in the last `seconds`, oldest first."""
+        idx = self.channels.index(channel)
+        out: List[int] = []
+        with self._lock:
+            count = min(self.written, self.capacity)
+            if not count:
+                return out
+            last = (self._head - 1) % self.capacity
+            since = self._t[last] - seconds
+            for i in range(count):
+                s = (last - i) % self.capacity
+                if self._t[s] <= since:
+                    break
+                out.append(self._v[s * self._n + idx])
+        out.reverse()
+        return out
+
+    def rate_hz(self) -> float:
+        """Sample sets per second over what the ring currently holds."""
+        with self._lock:
+            count = min(self.written, self.capacity)
+            if count < 2:
+                return 0.0
+            span = self._t[(self._head - 1) % self.capacity] - self._t[(self._head - count) % self.capacity]
+        return (count - 1) / span if span > 0 else 0.0
+
+
+class AdcSampler:
+    """Samples `channels` of an Mcp3008 at `rate_hz` sets/s into a SampleRing.
+
+    Each block of `block` sets is one SPI burst, so the thread wakes up
+    rate_hz/block times a second. Listeners get every Block as it completes,
+    on the sampler thread. When the ADC cannot burst (GPIO chip select) the
+    sets are read one by one, paced at no more than `fallback_rate_hz`.
+    """
+
+    def __init__(
+        self,
+        adc,
+        channels: Sequence[int],
+        *,
+        rate_hz: float = 1000.0,
+        block: int = 50,
+        capacity: int = 4096,
+        fallback_rate_hz: float = 100.0,
+        name: str = "ADC",
+    ):
+        self.name = name
+        self.channels = tuple(channels)
+        self.ring = SampleRing(self.channels, capacity)
+        self._adc = adc
+        self._rate_hz = max(1.0, float(rate_hz))
+        self._block = max(1, min(int(block), SpiBurst.MAX_TRANSFERS // len(self.channels)))
+        self._fallback_rate_hz = max(1.0, float(fallback_rate_hz))
+        self._listeners: List[Callable[[Block], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._due = 0.0
+        self._rate = _RATE.labels(name.lower())
+        self._samples = _SAMPLES.labels(name.lower())
+        self._burst_seconds = _BURST_SECONDS.labels(name.lower())
+
+    @property
+    def rate_hz(self) -> float:
+        """Target sets per second in the current mode."""
+        if self._adc.burst_supported:
+            return self._rate_hz
+        return min(self._rate_hz, self._fallback_rate_hz)
+
+    def add_listener(self, fn: Callable[[Block], None]) -> None:
+        self._listeners.append(fn)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        mode = "burst" if self._adc.burst_supported else "per-sample (GPIO chip select)"
+        print(f"[SENSORS] {self.name}: channels {list(self.channels)} at {self.rate_hz:.0f} Hz, {mode}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+    def _read_burst(self) -> Block:
+        period = 1.0 / self._rate_hz
+        # Each conversion is 24 clocks; delay_usecs pads it out to the slot.
+        xfer_us = 24e6 / self._adc.speed_hz
+        spacing_us = int(period * 1e6 / len(self.channels) - xfer_us)
+        t0 = time.monotonic()
+        values = self._adc.read_many(self.channels * self._block, spacing_us=spacing_us)
+        t1 = time.monotonic()
+        # Conversions are evenly spread over the ioctl; stamp each set at its end.
+        step = (t1 - t0) / self._block
+        return Block([t0 + step * (i + 1) for i in range(self._block)], self.channels, values)
+
+    def _read_paced(self) -> Block:
+        period = 1.0 / self.rate_hz
+        frames = max(1, int(round(self._block * self.rate_hz / self._rate_hz)))
+        timestamps: List[float] = []
+        values: List[int] = []
+        for _ in range(frames):
+            now = time.monotonic()
+            if self._due < now - period:
+                self._due = now  # fell behind; don't burst to catch up
+            delay = self._due - now
+            if delay > 0 and self._stop.wait(delay):
+                break
+            values.extend(self._adc.read_many(self.channels))
+            timestamps.append(time.monotonic())
+            self._due += period
+        return Block(timestamps, self.channels, values)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                block = self._read_burst() if self._adc.burst_supported else self._read_paced()
+            except Exception as e:
+                print(f"[SENSORS] {self.name}: read failed: {e}")
+                self._stop.wait(1.0)
+                continue
+            self._burst_seconds.observe(time.monotonic() - started)
+            if not block.timestamps:
+                continue
+            self.ring.extend(block.timestamps, block.values)
+            self._samples.inc(len(block.values))
+            self._rate.set(self.ring.rate_hz())
+            for fn in self._listeners:
+                try:
+                    fn(block)
+                except Exception as e:
+                    print(f"[SENSORS] {self.name}: listener failed: {e}")
@@ -0,0 +1,174 @@
+# peripheral_pi/beam.py
+
+import math
+import threading
+import time
+from typing import Callable, Optional
+
+from adc import Block
+from utils.metrics import registry
+
+# Safety laser beam-break detection on the high-rate LDR samples from
+# AdcSampler (peripheral_pi/adc.py).
+#
+# Once armed, the detector waits `settle_sec` for the LDR to respond to the
+# emitter, learns the intact-beam level over `calib_sec`, and from then on
+# follows slow ambient drift with an EWMA of the reading. The noise floor is
+# an EWMA of half the squared sample-to-sample difference, which unlike the
+# deviation from the lagging baseline does not grow with drift. Both are
+# frozen while the beam looks interrupted, so someone standing in the beam is
+# never learned as the new baseline. A crossing is reported only after the reading has stayed past the
+# threshold for `min_break_sec`, and cleared after `min_clear_sec` back on the
+# right side of it: single-sample spikes are ignored, while even a fast
+# walk-through spans dozens of samples at 1 kHz.
+
+_LATENCY = registry.histogram(
+    "beam_detection_latency_seconds",
+    "From the first interrupted LDR sample to the crossing being reported.",
+    buckets=(0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0),
+)
+_BASELINE = registry.gauge("beam_baseline", "Tracked intact-beam LDR level (ADC counts).")
+_NOISE = registry.gauge("beam_noise_floor", "Standard deviation of the intact-beam LDR level (ADC counts).")
+_GLITCHES = registry.counter("beam_glitches_total", "Beam interruptions shorter than the minimum duration.")
+
+
+class BeamDetector:
+    """Calls `on_change(beam_ok)` when the beam on `channel` breaks or is restored.
+
+    Feed it with on_block() as an AdcSampler listener. arm() (re)starts
+    calibration, e.g. when the safety laser is enabled; disarm() stops
+    reporting. The first report after arming is on_change(True) once
+    calibration is done.
+    """
+
+    def __init__(
+        self,
+        channel: int,
+        on_change: Callable[[bool], None],
+        *,
+        beam_high: bool = True,
+        threshold_ratio: float = 0.95,
+        hysteresis: float = 0.05,
+        min_break_sec: float = 0.02,
+        min_clear_sec: float = 0.05,
+        calib_sec: float = 1.0,
+        settle_sec: float = 0.2,
+        baseline_tau_sec: float = 30.0,
+    ):
+        self.channel = channel
+        self._on_change = on_change
+        self._beam_high = beam_high
+        self._ratio = float(threshold_ratio)
+        self._hysteresis = float(hysteresis)
+        self._min_break_sec = float(min_break_sec)
+        self._min_clear_sec = float(min_clear_sec)
+        self._calib_sec = float(calib_sec)
+        self._settle_sec = float(settle_sec)
+        self._tau_sec = max(0.001, float(baseline_tau_sec))
+
+        self._lock = threading.Lock()
+        self.armed = False
+        self.beam_ok: Optional[bool] = None  # None until calibrated
+        self.baseline: Optional[float] = None
+        self._var = 0.0
+        self._armed_at = 0.0
+        self._calib_n = 0
+        self._calib_sum = 0.0
+        self._calib_sq = 0.0
+        self._pending_since: Optional[float] = None  # first sample of an unconfirmed change
+        self._last_t: Optional[float] = None
+        self._last_v = 0
+
+    @property
+    def noise_floor(self) -> float:
+        return math.sqrt(self._var)
+
+    def arm(self) -> None:
+        with self._lock:
+            self._reset()
+            self.armed = True
+            self._armed_at = time.monotonic()
+
+    def disarm(self) -> None:
+        with self._lock:
+            self._reset()
+            self.armed = False
+
+    def _reset(self) -> None:
+        self.beam_ok = None
+        self.baseline = None
+        self._var = 0.0
+        self._calib_n = 0
+        self._calib_sum = 0.0
+        self._calib_sq = 0.0
+        self._pending_since = None
+        self._last_t = None
+
+    def on_block(self, block: Block) -> None:
+        with self._lock:
+            if not self.armed:
+                return
+            for t, v in zip(block.timestamps, block.series(self.channel)):
+                self._sample(t, v)
+            if self.baseline is not None:
+                _BASELINE.set(self.baseline)
+                _NOISE.set(self.noise_floor)
+
+    def _intact(self, v: int) -> bool:
+        # Hysteresis: once the beam is ok it takes a deeper dip to call it broken.
+        ratio = self._ratio - self._hysteresis if self.beam_ok else self._ratio
+        if self._beam_high:
+            return v >= self.baseline * ratio
+        return v <= self.baseline / max(0.01, ratio)
+
+    def _calibrate(self, t: float, v: int) -> None:
+        if t < self._armed_at + self._settle_sec:
+            return
+        self._calib_n += 1
+        self._calib_sum += v
+        self._calib_sq += v * v
+        if t < self._armed_at + self._settle_sec + self._calib_sec:
+            return
+        mean = self._calib_sum / self._calib_n
+        self.baseline = mean
+        self._var = max(0.0, self._calib_sq / self._calib_n - mean * mean)
+        self._last_t = t
+        self._last_v = v
+        self.beam_ok = True
+        print(f"[SECURITY] Beam calibrated: baseline {mean:.0f}, noise {self.noise_floor:.1f} ({self._calib_n} samples)")
+        self._on_change(True)
+
+    def _sample(self, t: float, v: int) -> None:
+        if self.baseline is None:
+            self._calibrate(t, v)
+            return
+
+        dt = t - self._last_t if self._last_t is not None else 0.0
+        step = v - self._last_v
+        self._last_t = t
+        self._last_v = v
+        intact = self._intact(v)
+
+        if intact == self.beam_ok:
+            if self._pending_since is not None:
+                if self.beam_ok:
+                    _GLITCHES.inc()
+                # The step back from a glitch is not noise.
+                self._pending_since = None
+            elif intact and dt > 0:
+                # Only learn while the beam is intact.
+                alpha = 1.0 - math.exp(-dt / self._tau_sec)
+                self.baseline += alpha * (v - self.baseline)
+                self._var += alpha * (0.5 * step * step - self._var)
+            return
+
+        if self._pending_since is None:
+            self._pending_since = t
+        hold = self._min_break_sec if self.beam_ok else self._min_clear_sec
+        if t - self._pending_since < hold:
+            return
+        if not intact:
+            _LATENCY.observe(max(0.0, time.monotonic() - self._pending_since))
+        self.beam_ok = intact
+        self._pending_since = None
+        self._on_change(intact)
@@ -7,12 +7,20 @@ SERIAL_RECONNECT_DELAY_SEC = 2.0
 
 # GPIO (BCM numbering)
 PIR_PIN = 5
+PIR_POLL_SEC = 0.1  # polling fallback only
+PIR_DEBOUNCE_SEC = 0.05
 LASER_PIN = 12
 LASER_ACTIVE_LOW = False
 
+# PIR, hall and flame inputs use edge interrupts (both edges) with a software
+# debounce; set False to poll them at their *_POLL_SEC instead.
+GPIO_EDGE_DETECT = True
+GPIO_RESYNC_SEC = 1.0  # level re-read while on interrupts, in case an edge is lost
+
 HALL_PIN = 6
 HALL_ACTIVE_LOW = True
-HALL_POLL_SEC = 0.05
+HALL_POLL_SEC = 0.05  # polling fallback only
+HALL_DEBOUNCE_SEC = 0.02
 
 DOOR_LOCK_INVERT = False
 
@@ -20,6 +28,12 @@ DOOR_LOCK_INVERT = False
 DHT_MODEL = "DHT11"
 DHT_BOARD_PIN = "D4"  # GPIO4
 DHT_SAMPLE_SEC = 2.0
+# Failed reads are retried after DHT_RETRY_SEC, doubling per consecutive
+# failure up to DHT_MAX_BACKOFF_SEC. Reported values are the median of the
+# last DHT_MEDIAN_WINDOW good reads.
+DHT_RETRY_SEC = 1.0
+DHT_MAX_BACKOFF_SEC = 30.0
+DHT_MEDIAN_WINDOW = 5
 
 # Stepper (28BYJ-48 + ULN2003)
 STEPPER_PINS = [17, 18, 27, 22]
@@ -32,17 +46,53 @@ LCD_WIDTH = 16
 LCD_UPDATE_SEC = 1.0
 
 # Reporting
-STATE_HZ = 2.0  # 2-5 Hz
+# Full STATE snapshots. Door, flame, motion, beam and lock changes are sent at
+# once as EVENTs, so STATE is a consistency heartbeat: STATE_HZ_ACTIVE while
+# there is motion or a beam crossing and for STATE_ACTIVE_HOLD_SEC after any
+# event, then the rate halves every STATE_DECAY_SEC down to STATE_HZ_IDLE.
+STATE_HZ_ACTIVE = 2.0
+STATE_HZ_IDLE = 0.1
+STATE_ACTIVE_HOLD_SEC = 10.0
+STATE_DECAY_SEC = 10.0
+STATE_BOOST_MAX_SEC = 120.0  # cap on a master STATE_BOOST request
+METRICS_TX_SEC = 30.0  # metrics snapshot relayed via the master to /metrics
+# Size of one METRICS frame; a STATE/EVENT may wait for one (~22 ms at 115200).
+METRICS_FRAME_BYTES = 256
 
 FLAME_PIN = 16
 FLAME_ACTIVE_LOW = True
-FLAME_POLL_SEC = 0.1
+FLAME_POLL_SEC = 0.1  # polling fallback only
+FLAME_DEBOUNCE_SEC = 0.01
 
 SPI_BUS = 0
 SPI_DEVICE = 0
 LDR_CS_PIN = 20
 LDR_CHANNEL = 0
-LDR_POLL_SEC = 0.05
-LDR_CALIB_SAMPLES = 60
-LDR_THRESHOLD_RATIO = 0.95
+LDR_POLL_SEC = 0.05  # safety laser enable/disable check; the beam itself is checked every ADC block
 LDR_BEAM_HIGH = True
+# Beam detector (peripheral_pi/beam.py). After the laser comes on the LDR gets
+# LDR_SETTLE_SEC to respond, then the intact level is learned over
+# LDR_CALIB_SEC and tracked with an EWMA (time constant LDR_BASELINE_TAU_SEC)
+# that is frozen while the beam is interrupted. A break must last
+# LDR_MIN_BREAK_SEC to count as a crossing, a restore LDR_MIN_CLEAR_SEC.
+LDR_THRESHOLD_RATIO = 0.95
+LDR_HYSTERESIS = 0.05
+LDR_MIN_BREAK_SEC = 0.02
+LDR_MIN_CLEAR_SEC = 0.05
+LDR_CALIB_SEC = 1.0
+LDR_SETTLE_SEC = 0.2
+LDR_BASELINE_TAU_SEC = 30.0
+
+# MCP3008 sampling. LDR_CHANNEL and ADC_EXTRA_CHANNELS are read together in
+# blocks of ADC_BLOCK sets at ADC_SAMPLE_HZ, each block one kernel SPI burst,
+# into a ring of the last ADC_RING_SIZE sets. Bursts need the kernel chip
+# select (wire CS to CE0/CE1 and set LDR_CS_PIN = None); with a GPIO chip
+# select the sets are read one at a time at ADC_FALLBACK_HZ.
+ADC_EXTRA_CHANNELS = []  # free channels for more analog sensors, e.g. [1, 2]
+ADC_SAMPLE_HZ = 1000.0
+ADC_BLOCK = 20  # sets per burst; also the beam detector's reporting granularity
+ADC_RING_SIZE = 4096
+ADC_FALLBACK_HZ = 100.0
+
+# Profiling (--profile / SMARTHOME_PROFILE=1)
+PROFILE_REPORT_SEC = 30.0
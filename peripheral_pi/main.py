@@ -1,29 +1,48 @@
 # peripheral_pi/main.py
 
 import argparse
+import os
+import sys
 import threading
 import time
-from typing import Dict
+from typing import Dict, Optional
 
 import RPi.GPIO as GPIO
 
+# Shared helpers live in <repo>/utils. Appended (not prepended) so this
+# directory's config.py still wins over the top-level one.
+_PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.append(_PROJECT_ROOT)
+
 import config
 from devices import DoorLock, Laser
+from adc import AdcSampler
+from beam import BeamDetector
 from lcd import I2cLcd
-from sensors import Mcp3008, dht_loop, flame_loop, hall_loop, make_dht_reader, pir_loop
+from reporting import AdaptiveRate, StateReporter, now_ms, send_metrics
+from scheduler import PRIO_DISPLAY, PRIO_REPORT, PRIO_SAFETY, Scheduler
+from sensors import DhtSampler, Mcp3008, make_dht_reader, make_inputs
 from system_state import state
 from uart_link import SerialLink
+from utils.metrics import registry
+from utils.profiler import Profiler, profiling_requested
 
-
-def now_ms() -> int:
-    return int(time.time() * 1000)
+_CROSSINGS = registry.counter("beam_crossings_total", "Safety laser beam interruptions.")
 
 
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--mode", choices=["normal", "quiet"], default="normal")
+    parser.add_argument("--profile", action="store_true", help="per-thread CPU and loop-lag reports (or SMARTHOME_PROFILE=1)")
+    parser.add_argument("--profile-stacks", metavar="PATH", help="also write collapsed stack samples for flamegraph.pl")
     args = parser.parse_args()
 
+    profiler: Optional[Profiler] = None
+    if profiling_requested(args.profile) or args.profile_stacks:
+        profiler = Profiler(report_sec=config.PROFILE_REPORT_SEC, stacks_path=args.profile_stacks)
+        profiler.start()
+
     GPIO.setwarnings(False)
     GPIO.setmode(GPIO.BCM)
 
@@ -35,6 +54,13 @@ def main() -> None:
     lcd = I2cLcd(config.I2C_ADDR, width=config.LCD_WIDTH)
     lcd.init()
 
+    state_rate = AdaptiveRate(
+        config.STATE_HZ_ACTIVE,
+        config.STATE_HZ_IDLE,
+        hold_sec=config.STATE_ACTIVE_HOLD_SEC,
+        decay_sec=config.STATE_DECAY_SEC,
+    )
+
     def on_uart_message(msg: Dict) -> None:
         t = msg.get("t")
 
@@ -81,9 +107,9 @@ def main() -> None:
 
         if name == "DOOR_LOCK":
             if val == "LOCK":
-                threading.Thread(target=_lock_door, daemon=True).start()
+                threading.Thread(target=_lock_door, name="DOOR_LOCK", daemon=True).start()
             elif val == "UNLOCK":
-                threading.Thread(target=_unlock_door, daemon=True).start()
+                threading.Thread(target=_unlock_door, name="DOOR_UNLOCK", daemon=True).start()
             return
 
         if name == "ALARM":
@@ -91,6 +117,12 @@ def main() -> None:
                 state.alarm = bool(val)
             return
 
+        if name == "STATE_BOOST":
+            # Master asks for the active STATE rate, e.g. while the dashboard is open.
+            if isinstance(val, (int, float)) and not isinstance(val, bool) and val > 0:
+                state_rate.boost(min(float(val), config.STATE_BOOST_MAX_SEC))
+            return
+
     link = SerialLink(
         port=config.SERIAL_PORT,
         baudrate=config.SERIAL_BAUDRATE,
@@ -99,6 +131,9 @@ def main() -> None:
     )
     link.start()
 
+    reporter = StateReporter(state, link, state_rate)
+    send_event = reporter.send_event
+
     def _lock_door() -> None:
         with state.lock:
             closed = bool(state.door_closed)
@@ -111,6 +146,7 @@ def main() -> None:
             door_lock.lock()
         with state.lock:
             state.door_locked = True
+            send_event("DOOR_LOCKED", True)
 
     def _unlock_door() -> None:
         if getattr(config, "DOOR_LOCK_INVERT", False):
@@ -119,177 +155,143 @@ def main() -> None:
             door_lock.unlock()
         with state.lock:
             state.door_locked = False
+            send_event("DOOR_LOCKED", False)
 
-    def set_motion(motion: bool) -> None:
-        changed = False
+    def set_dht(t_c: float, h_pct: float, read_at: float) -> None:
         with state.lock:
-            if state.motion != motion:
-                state.motion = motion
-                changed = True
-        if changed:
-            link.send({"t": "EVENT", "name": "MOTION", "value": motion, "ts": now_ms()})
+            state.temperature_c = t_c
+            state.humidity_pct = h_pct
+            state.dht_read_at = read_at
+
+    dht = DhtSampler(
+        make_dht_reader(config.DHT_MODEL, config.DHT_BOARD_PIN),
+        set_dht,
+        period_sec=config.DHT_SAMPLE_SEC,
+        retry_sec=config.DHT_RETRY_SEC,
+        max_backoff_sec=config.DHT_MAX_BACKOFF_SEC,
+        window=config.DHT_MEDIAN_WINDOW,
+    )
 
-    def set_flame(flame: bool) -> None:
-        with state.lock:
-            state.flame_detected = bool(flame)
+    adc = Mcp3008(config.SPI_BUS, config.SPI_DEVICE, cs_pin=config.LDR_CS_PIN)
+    adc_channels = [config.LDR_CHANNEL] + [ch for ch in config.ADC_EXTRA_CHANNELS if ch != config.LDR_CHANNEL]
+    adc_sampler = AdcSampler(
+        adc,
+        adc_channels,
+        rate_hz=config.ADC_SAMPLE_HZ,
+        block=config.ADC_BLOCK,
+        capacity=config.ADC_RING_SIZE,
+        fallback_rate_hz=config.ADC_FALLBACK_HZ,
+    )
 
-    def set_door_closed(closed: bool) -> None:
+    def on_beam_change(beam_ok: bool) -> None:
+        # Called on the ADC thread once a break or restore has lasted long enough.
+        crossing = not beam_ok
         with state.lock:
-            state.door_closed = bool(closed)
-            if not state.door_closed:
-                state.door_locked = False
+            state.laser_beam_ok = beam_ok
+            changed = state.crossing_detected != crossing
+            state.crossing_detected = crossing
+            if changed:
+                send_event("CROSSING", crossing, laser_beam_ok=beam_ok)
+        if changed:
+            if crossing:
+                print("[SECURITY] Someone is crossing (laser beam interrupted)")
+                _CROSSINGS.inc()
+            else:
+                print("[SECURITY] Beam restored")
+
+    beam = BeamDetector(
+        config.LDR_CHANNEL,
+        on_beam_change,
+        beam_high=config.LDR_BEAM_HIGH,
+        threshold_ratio=config.LDR_THRESHOLD_RATIO,
+        hysteresis=config.LDR_HYSTERESIS,
+        min_break_sec=config.LDR_MIN_BREAK_SEC,
+        min_clear_sec=config.LDR_MIN_CLEAR_SEC,
+        calib_sec=config.LDR_CALIB_SEC,
+        settle_sec=config.LDR_SETTLE_SEC,
+        baseline_tau_sec=config.LDR_BASELINE_TAU_SEC,
+    )
+    adc_sampler.add_listener(beam.on_block)
+    beam_armed = False
 
-    def set_dht(t_c, h_pct) -> None:
+    def safety_laser_tick() -> None:
+        # Only arms and disarms the detector; the beam itself is checked on
+        # every ADC block by BeamDetector.
+        nonlocal beam_armed
         with state.lock:
-            if t_c is not None:
-                state.temperature_c = t_c
-            if h_pct is not None:
-                state.humidity_pct = h_pct
+            enabled = bool(state.safety_laser_enabled)
 
-    dht_read_once = make_dht_reader(config.DHT_MODEL, config.DHT_BOARD_PIN)
-
-    adc = Mcp3008(config.SPI_BUS, config.SPI_DEVICE, cs_pin=config.LDR_CS_PIN)
-
-    threading.Thread(target=pir_loop, args=(config.PIR_PIN, set_motion), daemon=True).start()
-    threading.Thread(
-        target=hall_loop,
-        args=(config.HALL_PIN, set_door_closed),
-        kwargs={"active_low": config.HALL_ACTIVE_LOW, "poll_sec": config.HALL_POLL_SEC},
-        daemon=True,
-    ).start()
-    threading.Thread(target=dht_loop, args=(config.DHT_SAMPLE_SEC, dht_read_once, set_dht), daemon=True).start()
-    threading.Thread(
-        target=flame_loop,
-        args=(config.FLAME_PIN, set_flame),
-        kwargs={"active_low": config.FLAME_ACTIVE_LOW, "poll_sec": config.FLAME_POLL_SEC},
-        daemon=True,
-    ).start()
-
-    def safety_laser_loop() -> None:
-        baseline = None
-        last_beam_ok = False
-        last_crossing = False
-
-        while True:
-            try:
-                with state.lock:
-                    enabled = bool(state.safety_laser_enabled)
-
-                if not enabled:
-                    if baseline is not None:
-                        baseline = None
-                    if last_beam_ok:
-                        last_beam_ok = False
-                    if last_crossing:
-                        last_crossing = False
-
-                    with state.lock:
-                        state.laser_beam_ok = False
-                        state.crossing_detected = False
-
-                    time.sleep(0.1)
-                    continue
-
-                # Keep forcing the emitter on while enabled.
-                with state.lock:
-                    if not state.laser_on:
-                        laser.set(True)
-                        state.laser_on = True
-
-                if baseline is None:
-                    # Calibration phase: don't report crossing yet.
-                    with state.lock:
-                        state.laser_beam_ok = False
-                        state.crossing_detected = False
-
-                    samples = []
-                    for _ in range(max(1, int(config.LDR_CALIB_SAMPLES))):
-                        samples.append(adc.read_channel(config.LDR_CHANNEL))
-                        time.sleep(max(0.001, float(config.LDR_POLL_SEC)))
-                    baseline = sum(samples) / max(1, len(samples))
-                    last_beam_ok = False
-
-                reading = adc.read_channel(config.LDR_CHANNEL)
-                # Hysteresis avoids flicker and prevents 'beam ok forever' due to
-                # a low threshold ratio.
-                ratio = float(config.LDR_THRESHOLD_RATIO)
-                hysteresis = 0.05
-
-                if config.LDR_BEAM_HIGH:
-                    thr_on = float(baseline) * ratio
-                    thr_off = float(baseline) * max(0.0, ratio - hysteresis)
-                    if last_beam_ok:
-                        beam_ok = reading >= thr_off
-                    else:
-                        beam_ok = reading >= thr_on
-                else:
-                    thr_on = float(baseline) * ratio
-                    thr_off = float(baseline) * (ratio + hysteresis)
-                    if last_beam_ok:
-                        beam_ok = reading <= thr_off
-                    else:
-                        beam_ok = reading <= thr_on
-
-                crossing = enabled and (not beam_ok)
-                if crossing != last_crossing:
-                    if crossing:
-                        print("[SECURITY] Someone is crossing (laser beam interrupted)")
-                    else:
-                        print("[SECURITY] Beam restored")
-                    last_crossing = crossing
-                last_beam_ok = bool(beam_ok)
+        if not enabled:
+            if beam_armed:
+                beam.disarm()
+                beam_armed = False
+            with state.lock:
+                state.laser_beam_ok = False
+                if state.crossing_detected:
+                    state.crossing_detected = False
+                    send_event("CROSSING", False, laser_beam_ok=False)
+            return
 
-                with state.lock:
-                    state.laser_beam_ok = bool(beam_ok)
-                    state.crossing_detected = bool(crossing)
+        # Keep forcing the emitter on while enabled.
+        with state.lock:
+            if not state.laser_on:
+                laser.set(True)
+                state.laser_on = True
 
-                time.sleep(max(0.01, float(config.LDR_POLL_SEC)))
-            except Exception as e:
-                print(f"[SECURITY] Safety laser loop error: {e}")
-                time.sleep(0.2)
+        if not beam_armed:
+            # Recalibrates; crossings are reported once the baseline is known.
+            beam.arm()
+            beam_armed = True
 
-    def lcd_loop() -> None:
-        while True:
-            with state.lock:
-                t = state.temperature_c
-                h = state.humidity_pct
-                occ = "Occ" if state.motion else "Emp"
-                led = "LON" if state.master_led_on else "LOF"
-                dor = "DCL" if state.door_closed else "DOP"
-                las = "LAS" if state.laser_on else "---"
-                alarm = "ALRT" if state.alarm else ""
-
-            t_str = f"T:{t:.1f}C" if t is not None else "T:--.-C"
-            h_str = f"H:{h:.0f}%" if h is not None else "H:--%"
-            lcd.write_line(f"{t_str} {h_str}", I2cLcd.LCD_LINE_1)
-            lcd.write_line(f"{occ} {led} {dor} {las} {alarm}", I2cLcd.LCD_LINE_2)
-            time.sleep(config.LCD_UPDATE_SEC)
-
-    def state_tx_loop() -> None:
-        period = 1.0 / max(0.5, config.STATE_HZ)
-        while True:
-            with state.lock:
-                msg = {
-                    "t": "STATE",
-                    "ts": now_ms(),
-                    "temperature_c": state.temperature_c,
-                    "humidity_pct": state.humidity_pct,
-                    "motion": state.motion,
-                    "flame_detected": state.flame_detected,
-                    "laser_beam_ok": state.laser_beam_ok,
-                    "crossing_detected": state.crossing_detected,
-                    "door_closed": state.door_closed,
-                    "door_locked": state.door_locked,
-                    "laser_on": state.laser_on,
-                    "safety_laser_enabled": state.safety_laser_enabled,
-                    "alarm": state.alarm,
-                }
-            link.send(msg)
-            time.sleep(period)
-
-    threading.Thread(target=lcd_loop, daemon=True).start()
-    threading.Thread(target=state_tx_loop, daemon=True).start()
-    threading.Thread(target=safety_laser_loop, daemon=True).start()
+    def lcd_tick() -> None:
+        with state.lock:
+            t = state.temperature_c
+            h = state.humidity_pct
+            occ = "Occ" if state.motion else "Emp"
+            led = "LON" if state.master_led_on else "LOF"
+            dor = "DCL" if state.door_closed else "DOP"
+            las = "LAS" if state.laser_on else "---"
+            alarm = "ALRT" if state.alarm else ""
+
+        t_str = f"T:{t:.1f}C" if t is not None else "T:--.-C"
+        h_str = f"H:{h:.0f}%" if h is not None else "H:--%"
+        lcd.write_line(f"{t_str} {h_str}", I2cLcd.LCD_LINE_1)
+        lcd.write_line(f"{occ} {led} {dor} {las} {alarm}", I2cLcd.LCD_LINE_2)
+
+    def metrics_tx_tick() -> None:
+        # The master relays this snapshot to the web server's /metrics.
+        send_metrics(link, config.METRICS_FRAME_BYTES)
+
+    # Everything periodic runs on the scheduler: beam sampling, input resyncs and
+    # STATE in the fast lane, anything that can block for long in the slow lane.
+    adc_sampler.start()
+    sched = Scheduler()
+    sched.every("SAFETY_LASER", max(0.01, float(config.LDR_POLL_SEC)), safety_laser_tick, priority=PRIO_SAFETY)
+    # Door, flame and motion report transitions only, from GPIO edge interrupts.
+    inputs = list(
+        make_inputs(
+            config,
+            sched,
+            on_motion=reporter.set_motion,
+            on_flame=reporter.set_flame,
+            on_door_closed=reporter.set_door_closed,
+        ).values()
+    )
+    for edge_input in inputs:
+        edge_input.start()
+    sched.every("STATE_TX", state_rate.active_sec, reporter.tick, priority=PRIO_REPORT)
+    # Ticks at the retry interval; DhtSampler decides when a read is due.
+    sched.every("DHT", min(config.DHT_RETRY_SEC, config.DHT_SAMPLE_SEC), dht, lane="slow")
+    sched.every("LCD", config.LCD_UPDATE_SEC, lcd_tick, priority=PRIO_DISPLAY, lane="slow")
+    sched.every(
+        "METRICS_TX",
+        config.METRICS_TX_SEC,
+        metrics_tx_tick,
+        priority=PRIO_REPORT,
+        lane="slow",
+        delay=config.METRICS_TX_SEC,
+    )
+    sched.start()
 
     if args.mode != "quiet":
         print("[PERIPHERAL] Running.")
@@ -301,6 +303,13 @@ def main() -> None:
     except KeyboardInterrupt:
         pass
     finally:
+        for edge_input in inputs:
+            edge_input.stop()
+        sched.stop()
+        adc_sampler.stop()
+        adc.close()
+        if profiler is not None:
+            profiler.stop()
         link.stop()
         GPIO.cleanup()
         print("[PERIPHERAL] Stopped.")
@@ -0,0 +1,159 @@
+# peripheral_pi/reporting.py
+
+import threading
+import time
+from typing import Callable, Dict
+
+from utils.metrics import compact_snapshot, registry, split_compact
+
+_INTERVAL = registry.gauge("state_tx_interval_seconds", "Current STATE snapshot interval.")
+_BOOSTS = registry.counter("state_tx_boosts_total", "STATE rate boosts requested by the master.")
+
+
+class AdaptiveRate:
+    """STATE snapshot interval that follows activity.
+
+    Runs at `active_hz` while something is happening and for `hold_sec`
+    after the last activity, then the interval doubles every `decay_sec`
+    until it reaches the `idle_hz` heartbeat. The master can hold the active
+    rate for a while with boost(), e.g. while someone watches the dashboard.
+    """
+
+    def __init__(
+        self,
+        active_hz: float,
+        idle_hz: float,
+        *,
+        hold_sec: float = 10.0,
+        decay_sec: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.active_sec = 1.0 / max(0.01, float(active_hz))
+        self.idle_sec = max(self.active_sec, 1.0 / max(0.001, float(idle_hz)))
+        self._hold_sec = float(hold_sec)
+        self._decay_sec = max(0.001, float(decay_sec))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_activity = clock()
+        self._boost_until = 0.0
+
+    def mark_activity(self) -> None:
+        with self._lock:
+            self._last_activity = self._clock()
+
+    def boost(self, seconds: float) -> None:
+        _BOOSTS.inc()
+        with self._lock:
+            self._boost_until = max(self._boost_until, self._clock() + max(0.0, float(seconds)))
+
+    def interval(self, busy: bool = False) -> float:
+        """Seconds until the next snapshot is due; `busy` means activity is ongoing right now."""
+        now = self._clock()
+        with self._lock:
+            if busy:
+                self._last_activity = now
+            if now < self._boost_until:
+                sec = self.active_sec
+            else:
+                quiet = now - self._last_activity - self._hold_sec
+                if quiet <= 0:
+                    sec = self.active_sec
+                else:
+                    sec = min(self.idle_sec, self.active_sec * 2.0 ** (quiet / self._decay_sec))
+        _INTERVAL.set(sec)
+        return sec
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def send_metrics(link, max_frame_bytes: int) -> int:
+    """Queue the metrics snapshot for the master as low-priority METRICS frames; returns the frame count.
+
+    The snapshot is compacted and cut into frames of about `max_frame_bytes`,
+    which the link only sends while no STATE or EVENT is waiting.
+    """
+    ts = now_ms()
+    parts = split_compact(compact_snapshot(registry.snapshot()), max_frame_bytes)
+    for part in parts:
+        link.send({"t": "METRICS", "ts": ts, "m": part}, bulk=True)
+    return len(parts)
+
+
+class StateReporter:
+    """Reports peripheral state to the master over `link`.
+
+    Safety-relevant transitions go out at once as EVENTs; full STATE
+    snapshots are a heartbeat sent by tick() at the AdaptiveRate. EVENTs and
+    snapshots are sent while holding state.lock, so they are queued in the
+    order the state actually changed.
+    """
+
+    def __init__(self, state, link, rate: AdaptiveRate):
+        self._state = state
+        self._link = link
+        self.rate = rate
+        self._last_state_tx = 0.0
+
+    def send_event(self, name: str, value, **extra) -> None:
+        """Callers hold state.lock."""
+        self._link.send({"t": "EVENT", "name": name, "value": value, "ts": now_ms(), **extra})
+        self.rate.mark_activity()
+
+    def set_motion(self, motion: bool) -> None:
+        with self._state.lock:
+            if self._state.motion != motion:
+                self._state.motion = motion
+                self.send_event("MOTION", motion)
+
+    def set_flame(self, flame: bool) -> None:
+        flame = bool(flame)
+        with self._state.lock:
+            if self._state.flame_detected != flame:
+                self._state.flame_detected = flame
+                self.send_event("FLAME", flame)
+
+    def set_door_closed(self, closed: bool) -> None:
+        closed = bool(closed)
+        with self._state.lock:
+            if self._state.door_closed != closed:
+                self._state.door_closed = closed
+                self.send_event("DOOR_CLOSED", closed)
+            if not closed and self._state.door_locked:
+                self._state.door_locked = False
+                self.send_event("DOOR_LOCKED", False)
+
+    def snapshot(self, now: float) -> Dict:
+        """STATE message for the current state; callers hold state.lock."""
+        s = self._state
+        return {
+            "t": "STATE",
+            "ts": now_ms(),
+            "temperature_c": s.temperature_c,
+            "humidity_pct": s.humidity_pct,
+            # Seconds since the newest good DHT read behind those values.
+            "dht_age_sec": round(now - s.dht_read_at, 1) if s.dht_read_at is not None else None,
+            "motion": s.motion,
+            "flame_detected": s.flame_detected,
+            "laser_beam_ok": s.laser_beam_ok,
+            "crossing_detected": s.crossing_detected,
+            "door_closed": s.door_closed,
+            "door_locked": s.door_locked,
+            "laser_on": s.laser_on,
+            "safety_laser_enabled": s.safety_laser_enabled,
+            "alarm": s.alarm,
+        }
+
+    def tick(self) -> None:
+        """Schedule every rate.active_sec; sends a snapshot once the adaptive interval has passed."""
+        with self._state.lock:
+            busy = self._state.motion or self._state.crossing_detected
+        # Half a tick early is fine, so scheduling jitter doesn't skip one.
+        now = time.monotonic()
+        if now - self._last_state_tx < self.rate.interval(busy) - self.rate.active_sec / 2:
+            return
+        self._last_state_tx = now
+        with self._state.lock:
+            # Under the lock, so it can't overtake an EVENT for a newer change.
+            self._link.send(self.snapshot(now))
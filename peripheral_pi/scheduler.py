@@ -0,0 +1,169 @@
+# peripheral_pi/scheduler.py
+
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.metrics import LoopTimer, registry
+
+# One deadline-ordered scheduler for every periodic task on the peripheral,
+# instead of a sleeping thread per sensor.
+#
+# Tasks live in a heap keyed by their next deadline. When several are due at
+# once the highest priority runs first, so the safety beam is sampled before
+# the LCD is redrawn. Tasks that may block for long (DHT bit-banging, I2C LCD
+# writes, the metrics dump) go in the "slow" lane, which has its own thread
+# and heap, so they can never hold up the "fast" lane's GPIO and ADC reads.
+#
+# Each periodic task has a LoopTimer of the same name, so wakeup lag shows up
+# in loop_lag_seconds and in the --profile report like the old loops did.
+
+_RUN_SECONDS = registry.histogram(
+    "scheduler_task_seconds",
+    "Run time of scheduled tasks.",
+    ["task"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+_OVERRUNS = registry.counter("scheduler_overruns_total", "Task runs that took longer than their period.", ["task"])
+_ERRORS = registry.counter("scheduler_task_errors_total", "Scheduled task runs that raised.", ["task"])
+
+# Priorities (higher runs first when deadlines collide)
+PRIO_SAFETY = 30
+PRIO_SENSOR = 20
+PRIO_REPORT = 10
+PRIO_DISPLAY = 0
+
+LANES = ("fast", "slow")
+
+
+@dataclass
+class Task:
+    name: str
+    fn: Callable[[], None]
+    period: Optional[float]  # None = one-shot
+    priority: int = PRIO_SENSOR
+    deadline: float = 0.0
+    cancelled: bool = False
+    timer: Optional[LoopTimer] = field(default=None, repr=False)
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class _Lane:
+    def __init__(self, name: str, logger: Callable[[str], None]):
+        self.name = name
+        self._log = logger
+        self._heap: List[Tuple[float, int, Task]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    def push(self, task: Task) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, (task.deadline, next(self._seq), task))
+            if self._heap[0][2] is task:
+                self._cond.notify()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name=f"SCHED_{self.name.upper()}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+
+    def _next_due(self) -> Optional[Task]:
+        """Wait for the earliest deadline; of everything due by then, pop the highest priority."""
+        with self._cond:
+            while not self._stop:
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                delay = self._heap[0][0] - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                now = time.monotonic()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap))
+                due.sort(key=lambda e: (-e[2].priority, e[0], e[1]))
+                for entry in due[1:]:
+                    heapq.heappush(self._heap, entry)
+                return due[0][2]
+        return None
+
+    def _run(self) -> None:
+        while True:
+            task = self._next_due()
+            if task is None:
+                return
+            if task.cancelled:
+                continue
+
+            started = time.monotonic()
+            lag = max(0.0, started - task.deadline)
+            try:
+                task.fn()
+            except Exception as e:
+                _ERRORS.labels(task.name).inc()
+                self._log(f"[SCHED] Task {task.name} failed: {e}")
+            ran = time.monotonic() - started
+            _RUN_SECONDS.labels(task.name).observe(ran)
+
+            if task.period is None:
+                continue
+            behind = task.timer.record(lag, task.period) if task.timer is not None else False
+            if ran > task.period:
+                _OVERRUNS.labels(task.name).inc()
+                behind = True
+            # Stay on the fixed grid; after an overrun re-anchor instead of bursting to catch up.
+            task.deadline = time.monotonic() + task.period if behind else task.deadline + task.period
+            self.push(task)
+
+
+class Scheduler:
+    def __init__(self, *, logger: Callable[[str], None] = print):
+        self._lanes: Dict[str, _Lane] = {name: _Lane(name, logger) for name in LANES}
+
+    def every(
+        self,
+        name: str,
+        period: float,
+        fn: Callable[[], None],
+        *,
+        priority: int = PRIO_SENSOR,
+        lane: str = "fast",
+        delay: float = 0.0,
+    ) -> Task:
+        """Run `fn` every `period` seconds, first after `delay`."""
+        task = Task(name, fn, float(period), priority, time.monotonic() + delay, timer=LoopTimer(name, period))
+        self._lanes[lane].push(task)
+        return task
+
+    def call_later(
+        self, delay: float, fn: Callable[[], None], *, name: str = "once", priority: int = PRIO_SENSOR, lane: str = "fast"
+    ) -> Task:
+        """Run `fn` once after `delay` seconds. Safe to call from any thread."""
+        task = Task(name, fn, None, priority, time.monotonic() + max(0.0, delay))
+        self._lanes[lane].push(task)
+        return task
+
+    def start(self) -> None:
+        for lane in self._lanes.values():
+            lane.start()
+
+    def stop(self) -> None:
+        for lane in self._lanes.values():
+            lane.stop()
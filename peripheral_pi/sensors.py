@@ -1,37 +1,178 @@
 # peripheral_pi/sensors.py
 
+import statistics
+import threading
 import time
-from typing import Callable, Optional, Tuple
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
 
 import RPi.GPIO as GPIO
 
+from adc import SpiBurst
+from utils.metrics import registry
 
-def pir_loop(pin: int, on_motion: Callable[[bool], None]) -> None:
-    GPIO.setup(pin, GPIO.IN)
-    while True:
-        motion = GPIO.input(pin) == 1
-        on_motion(motion)
-        time.sleep(0.1)
+_SAMPLES = registry.counter("sensor_samples_total", "Sensor reads, by sensor.", ["sensor"])
+_READ_FAILURES = registry.counter("sensor_read_failures_total", "Sensor reads that returned nothing.", ["sensor"])
+_FAILURE_RATIO = registry.gauge("sensor_failure_ratio", "Share of recent reads that failed, by sensor.", ["sensor"])
 
 
-def flame_loop(pin: int, on_flame: Callable[[bool], None], *, active_low: bool = True, poll_sec: float = 0.1) -> None:
-    pud = GPIO.PUD_UP if active_low else GPIO.PUD_DOWN
-    GPIO.setup(pin, GPIO.IN, pull_up_down=pud)
-    while True:
-        val = GPIO.input(pin)
-        flame = (val == 0) if active_low else (val == 1)
-        on_flame(flame)
-        time.sleep(poll_sec)
+_EDGES = registry.counter("sensor_edges_total", "GPIO edge interrupts received, by sensor.", ["sensor"])
 
 
-def hall_loop(pin: int, on_closed, *, active_low: bool = True, poll_sec: float = 0.05) -> None:
-    pud = GPIO.PUD_UP if active_low else GPIO.PUD_DOWN
-    GPIO.setup(pin, GPIO.IN, pull_up_down=pud)
-    while True:
-        val = GPIO.input(pin)
-        closed = (val == 0) if active_low else (val == 1)
-        on_closed(bool(closed))
-        time.sleep(poll_sec)
+class EdgeInput:
+    """Digital input that calls `on_change(value)` only on real transitions.
+
+    Uses add_event_detect on both edges: the first edge after a quiet period
+    is reported at once, further edges are ignored for `debounce_sec`, and the
+    level is read again when that window closes, so contact bounce never
+    produces extra callbacks and the final level is never missed. While on
+    interrupts the level is also re-read every `resync_sec` in case an edge
+    was lost. If edge detection is unavailable (or disabled) the pin is
+    polled every `poll_sec` on the scheduler instead, like DoubleClapDetector.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        pin: int,
+        on_change: Callable[[bool], None],
+        scheduler,
+        *,
+        active_low: bool = False,
+        pull_up_down: Optional[int] = None,
+        debounce_sec: float = 0.02,
+        poll_sec: float = 0.05,
+        resync_sec: float = 1.0,
+        edge_detect: bool = True,
+    ):
+        self.name = name
+        self._pin = pin
+        self._on_change = on_change
+        self._scheduler = scheduler
+        self._active_low = active_low
+        self._pull_up_down = pull_up_down
+        self._debounce_sec = float(debounce_sec)
+        self._poll_sec = float(poll_sec)
+        self._resync_sec = float(resync_sec)
+        self._edge_detect = edge_detect
+
+        self._lock = threading.Lock()
+        self._settling = False
+        self.value: Optional[bool] = None
+        self.using_edge_detect = False
+        self._samples = _SAMPLES.labels(name.lower())
+        self._edges = _EDGES.labels(name.lower())
+
+    def start(self) -> None:
+        # A previous process may have left edge detection armed on this pin.
+        try:
+            GPIO.remove_event_detect(self._pin)
+        except Exception:
+            pass
+        if self._pull_up_down is None:
+            GPIO.setup(self._pin, GPIO.IN)
+        else:
+            GPIO.setup(self._pin, GPIO.IN, pull_up_down=self._pull_up_down)
+
+        # Report the initial level
+        self._check()
+
+        if self._edge_detect:
+            try:
+                GPIO.add_event_detect(self._pin, GPIO.BOTH, callback=self._handle_edge)
+                self.using_edge_detect = True
+            except RuntimeError as e:
+                print(f"[SENSORS] {self.name}: edge detection unavailable ({e}); polling instead")
+
+        period = self._resync_sec if self.using_edge_detect else self._poll_sec
+        self._scheduler.every(self.name, period, self._check)
+
+    def stop(self) -> None:
+        try:
+            GPIO.remove_event_detect(self._pin)
+        except Exception:
+            pass
+
+    def _read(self) -> bool:
+        val = GPIO.input(self._pin)
+        self._samples.inc()
+        return (val == 0) if self._active_low else (val == 1)
+
+    def _check(self) -> None:
+        with self._lock:
+            value = self._read()
+            if value == self.value:
+                return
+            self.value = value
+            # Called under the lock so reports from the GPIO and scheduler threads stay in order.
+            self._on_change(value)
+
+    def _handle_edge(self, _channel: int) -> None:
+        self._edges.inc()
+        if self._debounce_sec <= 0:
+            self._check()
+            return
+        with self._lock:
+            if self._settling:
+                return
+            self._settling = True
+        self._check()
+        self._scheduler.call_later(self._debounce_sec, self._settle, name=f"{self.name}_DEBOUNCE")
+
+    def _settle(self) -> None:
+        with self._lock:
+            self._settling = False
+        self._check()
+
+
+def make_inputs(
+    cfg,
+    scheduler,
+    *,
+    on_motion: Callable[[bool], None],
+    on_flame: Callable[[bool], None],
+    on_door_closed: Callable[[bool], None],
+    edge_detect: Optional[bool] = None,
+) -> Dict[str, EdgeInput]:
+    """The hall (door), flame and PIR EdgeInputs as wired in `cfg` (peripheral_pi/config.py), not started yet."""
+    if edge_detect is None:
+        edge_detect = cfg.GPIO_EDGE_DETECT
+    return {
+        "HALL": EdgeInput(
+            "HALL",
+            cfg.HALL_PIN,
+            on_door_closed,
+            scheduler,
+            active_low=cfg.HALL_ACTIVE_LOW,
+            pull_up_down=GPIO.PUD_UP if cfg.HALL_ACTIVE_LOW else GPIO.PUD_DOWN,
+            debounce_sec=cfg.HALL_DEBOUNCE_SEC,
+            poll_sec=cfg.HALL_POLL_SEC,
+            resync_sec=cfg.GPIO_RESYNC_SEC,
+            edge_detect=edge_detect,
+        ),
+        "FLAME": EdgeInput(
+            "FLAME",
+            cfg.FLAME_PIN,
+            on_flame,
+            scheduler,
+            active_low=cfg.FLAME_ACTIVE_LOW,
+            pull_up_down=GPIO.PUD_UP if cfg.FLAME_ACTIVE_LOW else GPIO.PUD_DOWN,
+            debounce_sec=cfg.FLAME_DEBOUNCE_SEC,
+            poll_sec=cfg.FLAME_POLL_SEC,
+            resync_sec=cfg.GPIO_RESYNC_SEC,
+            edge_detect=edge_detect,
+        ),
+        "PIR": EdgeInput(
+            "PIR",
+            cfg.PIR_PIN,
+            on_motion,
+            scheduler,
+            debounce_sec=cfg.PIR_DEBOUNCE_SEC,
+            poll_sec=cfg.PIR_POLL_SEC,
+            resync_sec=cfg.GPIO_RESYNC_SEC,
+            edge_detect=edge_detect,
+        ),
+    }
 
 
 class Mcp3008:
@@ -45,21 +186,62 @@ class Mcp3008:
         self._spi = spidev.SpiDev()
         self._spi.open(bus, device)
         self._spi.max_speed_hz = max_speed_hz
+        self.speed_hz = max_speed_hz
         if self._cs_pin is not None:
             self._spi.no_cs = True
+        self._lock = threading.Lock()
+        self._bursts: Dict[Tuple[Tuple[int, ...], int], SpiBurst] = {}
+        self._burst_failed = False
+
+    @property
+    def burst_supported(self) -> bool:
+        """True when read_many() can batch conversions into one kernel SPI burst.
+
+        A GPIO chip select can't be toggled from inside a burst, so with
+        `cs_pin` set every conversion is still its own transfer.
+        """
+        return self._cs_pin is None and not self._burst_failed
 
     def read_channel(self, channel: int) -> int:
         if channel < 0 or channel > 7:
             raise ValueError("MCP3008 channel must be 0..7")
 
-        if self._cs_pin is not None:
-            GPIO.output(self._cs_pin, GPIO.LOW)
-        try:
-            adc = self._spi.xfer2([1, (8 + channel) << 4, 0])
-            return ((adc[1] & 3) << 8) + adc[2]
-        finally:
+        with self._lock:
             if self._cs_pin is not None:
-                GPIO.output(self._cs_pin, GPIO.HIGH)
+                GPIO.output(self._cs_pin, GPIO.LOW)
+            try:
+                adc = self._spi.xfer2([1, (8 + channel) << 4, 0])
+                return ((adc[1] & 3) << 8) + adc[2]
+            finally:
+                if self._cs_pin is not None:
+                    GPIO.output(self._cs_pin, GPIO.HIGH)
+
+    def read_many(self, channels: Sequence[int], *, spacing_us: int = 0) -> List[int]:
+        """One conversion per entry of `channels`, in order.
+
+        With kernel chip select these go out as SPI bursts of up to
+        SpiBurst.MAX_TRANSFERS conversions spaced `spacing_us` apart;
+        otherwise (or if the burst ioctl fails) they are read one by one.
+        """
+        for ch in channels:
+            if ch < 0 or ch > 7:
+                raise ValueError("MCP3008 channel must be 0..7")
+        if self.burst_supported:
+            out: List[int] = []
+            try:
+                for i in range(0, len(channels), SpiBurst.MAX_TRANSFERS):
+                    chunk = tuple(channels[i : i + SpiBurst.MAX_TRANSFERS])
+                    key = (chunk, int(spacing_us))
+                    burst = self._bursts.get(key)
+                    if burst is None:
+                        burst = self._bursts[key] = SpiBurst(chunk, self.speed_hz, spacing_us)
+                    with self._lock:
+                        out.extend(burst.run(self._spi.fileno()))
+                return out
+            except OSError as e:
+                print(f"[SENSORS] MCP3008 burst transfer failed ({e}); reading one conversion at a time")
+                self._burst_failed = True
+        return [self.read_channel(ch) for ch in channels]
 
     def close(self) -> None:
         try:
@@ -88,8 +270,82 @@ def make_dht_reader(model: str, board_pin: str):
     return read_once
 
 
-def dht_loop(sample_sec: float, read_once: Callable[[], Tuple[Optional[float], Optional[float]]], on_read: Callable[[Optional[float], Optional[float]], None]) -> None:
-    while True:
-        t, h = read_once()
-        on_read(t, h)
-        time.sleep(sample_sec)
+class DhtSampler:
+    """Reads a DHT sensor when due and reports the median of recent good readings.
+
+    Schedule it every `retry_sec`; it only bit-bangs the sensor when a read
+    is due. After a good read the next one is due in `period_sec`. After a
+    failed one it is due in `retry_sec`, doubling with every consecutive
+    failure up to `max_backoff_sec`, so an unplugged sensor costs one read
+    per max_backoff_sec instead of one per tick. Readings outside the
+    sensor's range count as failures.
+
+    on_read(t, h, read_at) gets the median of the last `window` good
+    readings, so a single glitch never gets through, and the monotonic
+    time of the newest one. Nothing is reported on failure: the last good
+    value stands and its age keeps growing.
+    """
+
+    def __init__(
+        self,
+        read_once: Callable[[], Tuple[Optional[float], Optional[float]]],
+        on_read: Callable[[float, float, float], None],
+        *,
+        period_sec: float = 2.0,
+        retry_sec: float = 1.0,
+        max_backoff_sec: float = 30.0,
+        window: int = 5,
+        temp_range: Tuple[float, float] = (-40.0, 80.0),
+        name: str = "dht",
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._read_once = read_once
+        self._on_read = on_read
+        self._period_sec = float(period_sec)
+        self._retry_sec = float(retry_sec)
+        self._max_backoff_sec = max(self._retry_sec, float(max_backoff_sec))
+        self._temp_range = temp_range
+        self._clock = clock
+        self._temps: Deque[float] = deque(maxlen=max(1, int(window)))
+        self._hums: Deque[float] = deque(maxlen=max(1, int(window)))
+        self._outcomes: Deque[bool] = deque(maxlen=20)
+        self._next_read = 0.0
+        self.consecutive_failures = 0
+        self._samples = _SAMPLES.labels(name)
+        self._failures = _READ_FAILURES.labels(name)
+        self._failure_ratio = _FAILURE_RATIO.labels(name)
+
+    @property
+    def failure_ratio(self) -> float:
+        """Share of the last 20 reads that failed."""
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def _valid(self, t: Optional[float], h: Optional[float]) -> bool:
+        if t is None or h is None:
+            return False
+        return self._temp_range[0] <= t <= self._temp_range[1] and 0.0 <= h <= 100.0
+
+    def __call__(self) -> None:
+        now = self._clock()
+        if now < self._next_read:
+            return
+        t, h = self._read_once()
+        self._samples.inc()
+        ok = self._valid(t, h)
+        self._outcomes.append(ok)
+        self._failure_ratio.set(self.failure_ratio)
+
+        if not ok:
+            self._failures.inc()
+            self.consecutive_failures += 1
+            backoff = self._retry_sec * 2.0 ** (self.consecutive_failures - 1)
+            self._next_read = now + min(self._max_backoff_sec, backoff)
+            return
+
+        self.consecutive_failures = 0
+        self._next_read = now + self._period_sec
+        self._temps.append(t)
+        self._hums.append(h)
+        self._on_read(statistics.median(self._temps), statistics.median(self._hums), now)
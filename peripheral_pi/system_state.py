@@ -10,6 +10,7 @@ class PeripheralState:
     # Sensors
     temperature_c: Optional[float] = None
     humidity_pct: Optional[float] = None
+    dht_read_at: Optional[float] = None  # time.monotonic() of the newest good DHT read
     motion: bool = False
     flame_detected: bool = False
     laser_beam_ok: bool = False
@@ -0,0 +1,15 @@
+# tests/conftest.py
+#
+# The peripheral modules import their neighbours flat (`from adc import Block`)
+# because peripheral_pi/main.py runs from that directory, so it goes on the
+# path after the repository root. benchmarks/ is added for the hardware
+# stand-ins in benchmarks/sim.py.
+
+import os
+import sys
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for _path in (_ROOT, os.path.join(_ROOT, "peripheral_pi"), os.path.join(_ROOT, "benchmarks")):
+    if _path not in sys.path:
+        sys.path.append(_path)
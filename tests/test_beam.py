@@ -0,0 +1,135 @@
+# tests/test_beam.py
+
+import time
+
+import pytest
+
+from adc import Block
+from beam import BeamDetector
+
+CH = 2
+DT = 0.001  # 1 kHz, like ADC_SAMPLE_HZ
+
+
+class _Feed:
+    """Feeds an armed detector blocks of samples on its own monotonic timeline."""
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.t = time.monotonic()
+
+    def hold(self, value, seconds):
+        n = int(round(seconds / DT))
+        self.samples([value] * n)
+
+    def samples(self, values):
+        ts = [self.t + i * DT for i in range(len(values))]
+        self.t += len(values) * DT
+        # Interleaved with a second channel the detector must ignore.
+        interleaved = [x for v in values for x in (v, 0)]
+        self.detector.on_block(Block(ts, (CH, 0), interleaved))
+
+
+@pytest.fixture
+def beam():
+    def make(**kwargs):
+        changes = []
+        det = BeamDetector(CH, changes.append, **kwargs)
+        det.arm()
+        feed = _Feed(det)
+        # settle 0.2 s + calibrate 1 s around 800 with +-2 counts of noise
+        feed.samples([798, 802] * 600 + [800, 800])
+        return det, feed, changes
+
+    return make
+
+
+def test_calibration_learns_baseline_and_noise(beam):
+    det, feed, changes = beam()
+
+    assert changes == [True]
+    assert det.beam_ok
+    assert det.baseline == pytest.approx(800, abs=0.5)
+    assert det.noise_floor == pytest.approx(2.0, abs=0.2)
+
+
+def test_nothing_is_reported_before_calibration_ends():
+    changes = []
+    det = BeamDetector(CH, changes.append)
+    det.arm()
+    feed = _Feed(det)
+    feed.hold(800, 1.1)
+
+    assert changes == []
+    assert det.baseline is None
+
+
+def test_short_dip_is_a_glitch_and_a_long_one_a_break(beam):
+    det, feed, changes = beam(min_break_sec=0.02, min_clear_sec=0.05)
+
+    feed.hold(400, 0.005)
+    feed.hold(800, 0.05)
+    assert changes == [True]
+
+    feed.hold(400, 0.019)
+    assert changes == [True]
+    feed.hold(400, 0.005)
+    assert changes == [True, False]
+
+    feed.hold(800, 0.04)
+    assert changes == [True, False]
+    feed.hold(800, 0.02)
+    assert changes == [True, False, True]
+
+
+def test_baseline_is_frozen_while_the_beam_is_broken(beam):
+    det, feed, changes = beam(baseline_tau_sec=0.1)
+    before = det.baseline
+
+    feed.hold(400, 0.5)
+    assert changes == [True, False]
+    assert det.baseline == before
+
+
+def test_baseline_follows_slow_drift(beam):
+    det, feed, changes = beam(baseline_tau_sec=0.5)
+
+    # Ambient light rises slowly; the beam stays intact throughout.
+    for level in range(800, 881, 5):
+        feed.hold(level, 0.2)
+    feed.hold(880, 2.0)
+    assert changes == [True]
+    assert det.baseline == pytest.approx(880, abs=2)
+
+    # 780 would still be intact against the calibrated 800, but not against 880.
+    feed.hold(780, 0.05)
+    assert changes == [True, False]
+
+
+def test_hysteresis_between_break_and_restore(beam):
+    det, feed, changes = beam(threshold_ratio=0.95, hysteresis=0.05)
+
+    feed.hold(744, 0.1)  # 0.93 of baseline: above the 0.90 break level
+    assert changes == [True]
+    feed.hold(700, 0.1)
+    assert changes == [True, False]
+    feed.hold(744, 0.2)  # not yet back above 0.95
+    assert changes == [True, False]
+    feed.hold(800, 0.1)
+    assert changes == [True, False, True]
+
+
+def test_beam_low_sensor(beam):
+    det, feed, changes = beam(beam_high=False)
+
+    feed.hold(1000, 0.1)
+    assert changes == [True, False]
+
+
+def test_disarmed_detector_ignores_samples(beam):
+    det, feed, changes = beam()
+    det.disarm()
+
+    feed.hold(400, 0.1)
+    assert changes == [True]
+    assert det.beam_ok is None
@@ -0,0 +1,127 @@
+# tests/test_decision_cache.py
+
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+import pytest
+
+from master_pi.ai.decision_cache import DecisionCache, frame_hash
+
+
+@dataclass
+class _Decision:
+    authorized: bool
+    name: str = "Unknown"
+
+
+def _scene(seed):
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 255, (6, 8), dtype=np.uint8)
+    return cv2.resize(blocks, (640, 480), interpolation=cv2.INTER_CUBIC)
+
+
+def _jpeg(img, quality=90):
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def _distance(a, b):
+    return bin(frame_hash(a) ^ frame_hash(b)).count("1")
+
+
+@pytest.fixture
+def frames():
+    """A scene, a re-encoded copy of it (different bytes, same picture) and another scene."""
+    scene = _scene(1)
+    noisy = np.clip(scene.astype(np.int16) + np.random.default_rng(2).integers(-3, 4, scene.shape), 0, 255)
+    a, similar, other = _jpeg(scene), _jpeg(noisy.astype(np.uint8), 80), _jpeg(_scene(3))
+    assert a != similar
+    assert _distance(a, similar) <= DecisionCache.MAX_DISTANCE
+    assert _distance(a, other) > DecisionCache.MAX_DISTANCE
+    return a, similar, other
+
+
+def test_key_is_none_for_undecodable_or_empty_submissions(frames):
+    assert DecisionCache.key([]) is None
+    assert DecisionCache.key([b"not a jpeg"]) is None
+    assert DecisionCache.key([frames[0], b""]) is None
+
+
+def test_identical_frames_hit(frames):
+    cache = DecisionCache(ttl_sec=60)
+    denial = _Decision(False)
+    cache.put(DecisionCache.key([frames[0]]), 1, denial)
+
+    assert cache.get(DecisionCache.key([frames[0]]), 1) is denial
+    assert cache.stats()["hits"] == 1
+
+
+def test_similar_frames_share_a_denial_but_not_a_grant(frames):
+    a, similar, _ = frames
+    cache = DecisionCache(ttl_sec=60)
+    cache.put(DecisionCache.key([a]), 1, _Decision(False))
+    assert cache.get(DecisionCache.key([similar]), 1) is not None
+
+    cache = DecisionCache(ttl_sec=60)
+    grant = _Decision(True, "Alice")
+    cache.put(DecisionCache.key([a]), 1, grant)
+    assert cache.get(DecisionCache.key([similar]), 1) is None
+    assert cache.get(DecisionCache.key([a]), 1) is grant
+
+
+def test_different_scene_or_frame_count_misses(frames):
+    a, _, other = frames
+    cache = DecisionCache(ttl_sec=60)
+    cache.put(DecisionCache.key([a]), 1, _Decision(False))
+
+    assert cache.get(DecisionCache.key([other]), 1) is None
+    assert cache.get(DecisionCache.key([a, a]), 1) is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_new_model_version_invalidates_entries(frames):
+    cache = DecisionCache(ttl_sec=60)
+    key = DecisionCache.key([frames[0]])
+    cache.put(key, 1, _Decision(False))
+
+    assert cache.get(key, 2) is None
+    assert cache.stats()["entries"] == 0
+    assert cache.get(key, 1) is None
+
+
+def test_entries_expire_after_ttl(frames):
+    cache = DecisionCache(ttl_sec=0)
+    key = DecisionCache.key([frames[0]])
+    cache.put(key, 1, _Decision(False))
+
+    assert cache.get(key, 1) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(frames):
+    a, _, other = frames
+    third = _jpeg(_scene(4))
+    cache = DecisionCache(ttl_sec=60, max_entries=2)
+    ka, kb, kc = (DecisionCache.key([f]) for f in (a, other, third))
+    cache.put(ka, 1, _Decision(False, "a"))
+    cache.put(kb, 1, _Decision(False, "b"))
+    assert cache.get(ka, 1).name == "a"  # a is now the most recent
+
+    cache.put(kc, 1, _Decision(False, "c"))
+    assert cache.get(kb, 1) is None
+    assert cache.get(ka, 1).name == "a"
+    assert cache.get(kc, 1).name == "c"
+
+
+def test_stats_hit_rate(frames):
+    cache = DecisionCache(ttl_sec=60)
+    key = DecisionCache.key([frames[0]])
+    assert cache.stats()["hit_rate"] == 0.0
+    cache.get(key, 1)
+    cache.put(key, 1, _Decision(False))
+    cache.get(key, 1)
+    cache.get(key, 1)
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 1, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
@@ -0,0 +1,147 @@
+# tests/test_histogram_store.py
+
+import json
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+
+from master_pi.ai.histogram_store import (
+    HistogramStore,
+    append_histograms,
+    compute_histograms,
+    export_recognizer,
+    lbp_histogram,
+    read_meta,
+    store_exists,
+    store_paths,
+)
+
+
+def _faces(seed, n):
+    rng = np.random.default_rng(seed)
+    return [cv2.GaussianBlur(rng.integers(0, 255, (200, 200), dtype=np.uint8), (5, 5), 0) for _ in range(n)]
+
+
+@pytest.fixture(scope="module")
+def trained(tmp_path_factory):
+    """A small LBPH model (the trainer's parameters) exported next to its model.yml."""
+    images = _faces(0, 6)
+    ids = np.array([0, 0, 1, 1, 2, 2], dtype=np.int32)
+    recognizer = cv2.face.LBPHFaceRecognizer_create(radius=2, neighbors=8, grid_x=8, grid_y=8)
+    recognizer.train(images, ids)
+    base = str(tmp_path_factory.mktemp("model") / "model")
+    export_recognizer(recognizer, base)
+    return recognizer, base, images, ids
+
+
+def _copy_store(base, dest):
+    copy = str(dest / "model")
+    for src, dst in zip(store_paths(base), store_paths(copy)):
+        shutil.copy(src, dst)
+    return copy
+
+
+def _chisqr_alt(matrix, query):
+    a, b = np.asarray(matrix, dtype=np.float64), np.asarray(query, dtype=np.float64).reshape(1, -1)
+    num, den = (a - b) ** 2, a + b
+    return 2.0 * np.where(den > 0, num / np.where(den > 0, den, 1.0), 0.0).sum(axis=1)
+
+
+def test_lbp_histogram_is_bit_identical_to_opencv(trained):
+    recognizer, _, images, _ = trained
+    for image, expected in zip(images, recognizer.getHistograms()):
+        ours = lbp_histogram(image, 2, 8, 8, 8)
+        assert ours.dtype == np.float32
+        assert np.array_equal(ours, expected.reshape(-1))
+
+
+def test_export_and_load_round_trip(trained):
+    recognizer, base, _, ids = trained
+    assert store_exists(base)
+    store = HistogramStore.load(base)
+
+    assert len(store) == len(ids)
+    assert store.ids.tolist() == ids.tolist()
+    assert store.meta["dim"] == 8 * 8 * 256
+    assert np.array_equal(np.asarray(store.histograms), np.vstack([h.reshape(1, -1) for h in recognizer.getHistograms()]))
+
+
+@pytest.mark.parametrize("chunk_bytes", [HistogramStore.CHUNK_BYTES, 8 * 8 * 256 * 4])
+def test_distances_match_chi_square_alt(trained, chunk_bytes, monkeypatch):
+    _, base, _, _ = trained
+    monkeypatch.setattr(HistogramStore, "CHUNK_BYTES", chunk_bytes)  # second case: one row per pass
+    store = HistogramStore.load(base)
+    query = store.features(_faces(1, 1)[0])
+
+    dist = store.distances(query)
+    assert dist.dtype == np.float64
+    np.testing.assert_allclose(dist, _chisqr_alt(store.histograms, query), rtol=1e-5)
+
+
+def test_nearest_agrees_with_lbph_predict(trained):
+    recognizer, base, images, _ = trained
+    store = HistogramStore.load(base, mmap=False)
+    for probe in _faces(2, 3) + images[:2]:
+        label, distance = store.nearest(store.features(probe))
+        expected_label, expected_distance = recognizer.predict(probe)
+        assert label == expected_label
+        assert distance == pytest.approx(expected_distance, rel=1e-5)
+
+
+def test_nearest_on_empty_store():
+    store = HistogramStore(np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.int32), {})
+    assert store.nearest(np.zeros(4, dtype=np.float32)) == (-1, float("inf"))
+
+
+def test_load_rejects_unknown_format(trained, tmp_path):
+    copy = _copy_store(trained[1], tmp_path)
+    with open(copy + ".meta.json") as f:
+        meta = json.load(f)
+    meta["format"] = 99
+    with open(copy + ".meta.json", "w") as f:
+        json.dump(meta, f)
+
+    with pytest.raises(ValueError):
+        HistogramStore.load(copy)
+
+
+def test_append_histograms_matches_lbph_update(trained, tmp_path):
+    recognizer, base, images, ids = trained
+    copy = _copy_store(base, tmp_path)
+    new_images = _faces(3, 2)
+    new_ids = [3, 3]
+
+    append_histograms(copy, compute_histograms(read_meta(copy), new_images), new_ids)
+    store = HistogramStore.load(copy)
+
+    assert len(store) == len(ids) + 2
+    assert store.meta["samples"] == len(store)
+    assert store.ids.tolist() == ids.tolist() + new_ids
+    # Old rows copied unchanged, new rows exactly what LBPH update() would add.
+    updated = cv2.face.LBPHFaceRecognizer_create(radius=2, neighbors=8, grid_x=8, grid_y=8)
+    updated.train(images, ids)
+    updated.update(new_images, np.array(new_ids, dtype=np.int32))
+    assert np.array_equal(np.asarray(store.histograms), np.vstack([h.reshape(1, -1) for h in updated.getHistograms()]))
+    assert store.nearest(store.features(new_images[0])) == (3, 0.0)
+
+
+def test_append_histograms_in_several_copy_blocks(trained, tmp_path, monkeypatch):
+    _, base, _, ids = trained
+    monkeypatch.setattr(HistogramStore, "CHUNK_BYTES", 2 * 8 * 8 * 256 * 4)  # two old rows per block
+    copy = _copy_store(base, tmp_path)
+    before = np.array(HistogramStore.load(copy).histograms)
+
+    append_histograms(copy, compute_histograms(read_meta(copy), _faces(4, 1)), [5])
+    store = HistogramStore.load(copy)
+    assert np.array_equal(np.asarray(store.histograms[: len(ids)]), before)
+
+
+def test_append_histograms_rejects_other_dimensions(trained, tmp_path):
+    _, base, _, ids = trained
+    copy = _copy_store(base, tmp_path)
+
+    with pytest.raises(ValueError):
+        append_histograms(copy, np.zeros((1, 10), dtype=np.float32), [4])
+    assert len(HistogramStore.load(copy)) == len(ids)
@@ -0,0 +1,100 @@
+# tests/test_matcher.py
+
+import math
+
+import numpy as np
+import pytest
+
+from master_pi.ai.matcher import IdentityMatcher
+
+LABELS = {0: "Alice", 1: "Bob", 2: "Carol", 3: "Dave"}
+
+
+def test_reduce_takes_the_closest_sample_per_identity():
+    ids = [2, 0, 1, 0, 2, 1, 3]
+    distances = [50.0, 40.0, 90.0, 30.0, 20.0, 95.0, 70.0]
+    uniq, best = IdentityMatcher(LABELS, ids).reduce(distances)
+
+    assert uniq.tolist() == [0, 1, 2, 3]
+    assert best.tolist() == [30.0, 90.0, 20.0, 70.0]
+
+
+def test_reduce_matches_brute_force_on_random_data():
+    rng = np.random.default_rng(0)
+    ids = rng.integers(0, 12, 500)
+    distances = rng.uniform(0, 200, 500)
+    uniq, best = IdentityMatcher({}, ids).reduce(distances)
+
+    assert uniq.tolist() == sorted(set(ids.tolist()))
+    for label_id, d in zip(uniq, best):
+        assert d == distances[ids == label_id].min()
+
+
+def test_reduce_with_per_call_ids_and_without_any():
+    matcher = IdentityMatcher(LABELS)
+    uniq, best = matcher.reduce([5.0, 3.0], ids=[1, 1])
+    assert uniq.tolist() == [1] and best.tolist() == [3.0]
+
+    with pytest.raises(ValueError):
+        matcher.reduce([5.0, 3.0])
+    uniq, best = matcher.reduce([])
+    assert uniq.size == 0 and best.size == 0
+
+
+def test_rank_orders_top_k_and_reports_margin():
+    matcher = IdentityMatcher(LABELS, top_k=2, ambiguity_margin=5.0)
+    result = matcher.rank_identities(np.array([0, 1, 2, 3]), np.array([60.0, 40.0, 80.0, 45.0]))
+
+    assert [c.name for c in result.candidates] == ["Bob", "Dave"]
+    assert result.best.distance == 40.0
+    assert result.margin == 5.0
+    assert not result.ambiguous
+    assert result.accepted
+
+
+def test_close_runner_up_is_ambiguous():
+    matcher = IdentityMatcher(LABELS, ambiguity_margin=5.0)
+    result = matcher.rank_identities(np.array([0, 1]), np.array([40.0, 43.0]))
+
+    assert result.margin == 3.0
+    assert result.ambiguous
+
+
+def test_single_identity_has_infinite_margin():
+    result = IdentityMatcher(LABELS).rank_identities(np.array([2]), np.array([30.0]))
+
+    assert result.best.name == "Carol"
+    assert math.isinf(result.margin)
+    assert not result.ambiguous
+
+
+def test_per_user_thresholds():
+    matcher = IdentityMatcher(LABELS, thresholds={"Alice": 50.0}, default_threshold=110.0)
+
+    alice = matcher.rank_identities(np.array([0]), np.array([60.0]))
+    assert alice.best.threshold == 50.0
+    assert not alice.accepted
+
+    bob = matcher.rank_identities(np.array([1]), np.array([60.0]))
+    assert bob.best.threshold == 110.0
+    assert bob.accepted
+
+
+def test_unknown_label_and_empty_ranking():
+    matcher = IdentityMatcher(LABELS)
+    result = matcher.rank_identities(np.array([9]), np.array([10.0]))
+    assert result.best.name == "Unknown"
+
+    empty = matcher.rank_identities(np.empty(0, dtype=np.int32), np.empty(0))
+    assert empty.best is None
+    assert not empty.accepted
+
+
+def test_rank_is_reduce_then_rank_identities():
+    ids = [0, 0, 1, 2, 2]
+    distances = [70.0, 35.0, 36.0, 90.0, 88.0]
+    matcher = IdentityMatcher(LABELS, ids, ambiguity_margin=2.0)
+    result = matcher.rank(distances)
+
+    assert [(c.name, c.distance) for c in result.candidates] == [("Alice", 35.0), ("Bob", 36.0), ("Carol", 88.0)]
+    assert result.ambiguous
@@ -0,0 +1,65 @@
+# tests/test_metrics.py
+
+import json
+
+import pytest
+
+from utils.metrics import Registry, compact_snapshot, expand_snapshot, split_compact
+
+
+@pytest.fixture
+def snapshot():
+    reg = Registry()
+    reg.counter("uart_frames_total", "Frames.", ["dir", "type"]).labels("tx", "STATE").inc(3)
+    reg.counter("uart_frames_total_unused", "Never incremented.", ["dir"])
+    reg.gauge("state_tx_interval_seconds", "Interval.").set(0.2)
+    lat = reg.histogram("beam_latency_seconds", "Latency.", ["sensor"], buckets=(0.01, 0.1))
+    lat.labels("ldr").observe(0.005)
+    lat.labels("ldr").observe(0.05)
+    return reg.snapshot()
+
+
+def test_compact_round_trip_keeps_every_sample(snapshot):
+    expanded = expand_snapshot(json.loads(json.dumps(compact_snapshot(snapshot))))
+
+    families = {name for name, fam in snapshot.items() if fam["samples"]}
+    assert set(expanded) == families
+    for name in families:
+        assert expanded[name]["type"] == snapshot[name]["type"]
+        assert expanded[name]["help"] == ""
+        # Values here are exact in 6 significant digits.
+        assert expanded[name]["samples"] == snapshot[name]["samples"]
+
+
+def test_compact_drops_help_and_empty_families(snapshot):
+    compact = compact_snapshot(snapshot)
+
+    assert "uart_frames_total_unused" not in compact
+    assert "Frames." not in json.dumps(compact)
+    assert len(json.dumps(compact)) < len(json.dumps(snapshot))
+
+
+def test_expand_skips_malformed_families(snapshot):
+    compact = compact_snapshot(snapshot)
+    compact["broken"] = ["c"]
+
+    expanded = expand_snapshot(compact)
+    assert "broken" not in expanded
+    assert "uart_frames_total" in expanded
+
+
+def test_split_keeps_parts_near_the_limit_and_loses_nothing(snapshot):
+    compact = compact_snapshot(snapshot)
+    parts = split_compact(compact, 80)
+
+    assert len(parts) > 1
+    merged = {}
+    for part in parts:
+        assert not set(part) & set(merged)
+        merged.update(part)
+        if len(part) > 1:
+            assert len(json.dumps(part, separators=(",", ":"))) <= 80
+    assert merged == compact
+
+    assert split_compact(compact, 10_000) == [compact]
+    assert split_compact({}, 80) == []
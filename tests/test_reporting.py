@@ -0,0 +1,106 @@
+# tests/test_reporting.py
+
+import pytest
+
+from reporting import AdaptiveRate, StateReporter
+from system_state import PeripheralState
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Link:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg, bulk=False):
+        self.sent.append(msg)
+
+
+@pytest.fixture
+def rate():
+    clock = _Clock()
+    # 5 Hz while active, 0.2 Hz heartbeat; hold 10 s, then double every 10 s.
+    r = AdaptiveRate(5.0, 0.2, hold_sec=10.0, decay_sec=10.0, clock=clock)
+    r.clock = clock
+    return r
+
+
+def test_active_rate_is_held_after_activity(rate):
+    assert rate.interval() == pytest.approx(0.2)
+    rate.clock.now += 10.0
+    assert rate.interval() == pytest.approx(0.2)
+
+
+def test_interval_doubles_every_decay_period_up_to_idle(rate):
+    rate.clock.now += 20.0
+    assert rate.interval() == pytest.approx(0.4)
+    rate.clock.now += 10.0
+    assert rate.interval() == pytest.approx(0.8)
+    rate.clock.now += 1000.0
+    assert rate.interval() == pytest.approx(5.0)
+
+
+def test_activity_and_busy_restore_the_active_rate(rate):
+    rate.clock.now += 1000.0
+    rate.mark_activity()
+    assert rate.interval() == pytest.approx(0.2)
+
+    rate.clock.now += 1000.0
+    assert rate.interval(busy=True) == pytest.approx(0.2)
+    rate.clock.now += 5.0
+    assert rate.interval() == pytest.approx(0.2)  # busy counted as activity
+
+
+def test_boost_holds_the_active_rate_until_it_runs_out(rate):
+    rate.clock.now += 1000.0
+    rate.boost(30.0)
+    rate.boost(5.0)  # a shorter boost never cuts a longer one
+    rate.clock.now += 29.0
+    assert rate.interval() == pytest.approx(0.2)
+    rate.clock.now += 2.0
+    assert rate.interval() == pytest.approx(5.0)
+
+
+def test_idle_interval_is_never_shorter_than_active():
+    r = AdaptiveRate(2.0, 10.0, clock=_Clock())
+    assert r.idle_sec == r.active_sec == pytest.approx(0.5)
+
+
+def test_events_only_on_transitions_and_mark_activity(rate):
+    link = _Link()
+    reporter = StateReporter(PeripheralState(), link, rate)
+    rate.clock.now += 1000.0
+
+    reporter.set_motion(False)
+    assert link.sent == []
+    reporter.set_motion(True)
+    reporter.set_motion(True)
+    assert [(m["name"], m["value"]) for m in link.sent] == [("MOTION", True)]
+    assert rate.interval() == pytest.approx(0.2)
+
+
+def test_opening_the_door_releases_the_lock(rate):
+    state = PeripheralState(door_closed=True, door_locked=True)
+    link = _Link()
+    StateReporter(state, link, rate).set_door_closed(False)
+
+    assert [(m["name"], m["value"]) for m in link.sent] == [("DOOR_CLOSED", False), ("DOOR_LOCKED", False)]
+    assert not state.door_locked
+
+
+def test_tick_sends_a_snapshot_only_when_due():
+    clock = _Clock()
+    link = _Link()
+    reporter = StateReporter(PeripheralState(temperature_c=21.5), link, AdaptiveRate(5.0, 0.2, clock=clock))
+
+    reporter.tick()
+    reporter.tick()  # within the same interval
+    assert [m["t"] for m in link.sent] == ["STATE"]
+    assert link.sent[0]["temperature_c"] == 21.5
+    assert link.sent[0]["dht_age_sec"] is None
@@ -0,0 +1,127 @@
+# tests/test_scheduler.py
+
+import threading
+import time
+
+import pytest
+
+from scheduler import PRIO_DISPLAY, PRIO_SAFETY, PRIO_SENSOR, Scheduler
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.005)
+    return predicate()
+
+
+@pytest.fixture
+def sched():
+    logs = []
+    s = Scheduler(logger=logs.append)
+    s.logs = logs
+    yield s
+    s.stop()
+
+
+def test_collided_deadlines_run_highest_priority_first(sched):
+    ran = []
+    sched.call_later(0.0, lambda: ran.append("display"), name="display", priority=PRIO_DISPLAY)
+    sched.call_later(0.0, lambda: ran.append("sensor"), name="sensor", priority=PRIO_SENSOR)
+    sched.call_later(0.0, lambda: ran.append("safety"), name="safety", priority=PRIO_SAFETY)
+    time.sleep(0.01)  # all three due before the lane starts
+    sched.start()
+
+    assert _wait_for(lambda: len(ran) == 3)
+    assert ran == ["safety", "sensor", "display"]
+
+
+def test_earlier_deadline_runs_first_regardless_of_priority(sched):
+    ran = []
+    sched.call_later(0.05, lambda: ran.append("safety"), priority=PRIO_SAFETY)
+    sched.call_later(0.0, lambda: ran.append("display"), priority=PRIO_DISPLAY)
+    sched.start()
+
+    assert _wait_for(lambda: len(ran) == 2)
+    assert ran == ["display", "safety"]
+
+
+def test_one_shot_runs_once_after_delay(sched):
+    ran = []
+    sched.start()
+    t0 = time.monotonic()
+    sched.call_later(0.05, lambda: ran.append(time.monotonic() - t0))
+
+    assert _wait_for(lambda: ran)
+    time.sleep(0.1)
+    assert len(ran) == 1
+    assert ran[0] >= 0.05
+
+
+def test_periodic_task_stays_on_its_period(sched):
+    ran = []
+    sched.every("tick", 0.02, lambda: ran.append(time.monotonic()))
+    sched.start()
+    time.sleep(0.25)
+    sched.stop()
+
+    # ~12 runs; allow for a loaded test machine but not a busy loop.
+    assert 6 <= len(ran) <= 14
+    # Fixed grid: a late run does not push the later ones back, and none runs early.
+    for i, t in enumerate(ran):
+        assert t >= ran[0] + i * 0.02 - 0.001
+
+
+def test_cancelled_task_does_not_run(sched):
+    ran = []
+    task = sched.call_later(0.05, lambda: ran.append("late"))
+    sched.call_later(0.1, lambda: ran.append("marker"))
+    task.cancel()
+    sched.start()
+
+    assert _wait_for(lambda: "marker" in ran)
+    assert ran == ["marker"]
+
+
+def test_failing_task_is_logged_and_keeps_its_schedule(sched):
+    calls = []
+
+    def boom():
+        calls.append(1)
+        raise RuntimeError("sensor gone")
+
+    sched.every("flaky", 0.02, boom)
+    sched.start()
+
+    assert _wait_for(lambda: len(calls) >= 3)
+    assert any("flaky" in line and "sensor gone" in line for line in sched.logs)
+
+
+def test_slow_lane_does_not_hold_up_fast_lane(sched):
+    fast = []
+    slow_started = threading.Event()
+
+    def slow():
+        slow_started.set()
+        time.sleep(0.3)
+
+    sched.every("slow", 1.0, slow, lane="slow")
+    sched.every("fast", 0.01, lambda: fast.append(time.monotonic()))
+    sched.start()
+
+    assert slow_started.wait(1.0)
+    during = len(fast)
+    time.sleep(0.2)  # the slow task is still sleeping
+    assert len(fast) - during >= 5
+
+
+def test_periodic_task_first_runs_after_delay(sched):
+    ran = []
+    t0 = time.monotonic()
+    sched.every("delayed", 1.0, lambda: ran.append(time.monotonic() - t0), delay=0.05)
+    sched.start()
+
+    assert _wait_for(lambda: ran)
+    assert ran[0] >= 0.05
@@ -0,0 +1,225 @@
+# tests/test_sensors.py
+
+import sys
+import types
+
+import pytest
+
+import sim
+
+# sensors.py imports RPi.GPIO at load time; drive it through the benchmarks' stand-in.
+GPIO = sim.SimGpio()
+_rpi = types.ModuleType("RPi")
+_rpi.GPIO = GPIO
+sys.modules["RPi"] = _rpi
+sys.modules["RPi.GPIO"] = GPIO
+
+import sensors  # noqa: E402
+
+PIN = 17
+
+
+class _Scheduler:
+    """Records what EdgeInput schedules; the test decides when it runs."""
+
+    def __init__(self):
+        self.periodic = {}
+        self.later = []
+
+    def every(self, name, period, fn, **_kw):
+        self.periodic[name] = (period, fn)
+
+    def call_later(self, delay, fn, *, name="once", **_kw):
+        self.later.append((delay, fn, name))
+
+    def run_later(self):
+        pending, self.later = self.later, []
+        for _delay, fn, _name in pending:
+            fn()
+
+
+@pytest.fixture
+def edge_input():
+    def make(level, **kwargs):
+        GPIO.output(PIN, level)
+        changes = []
+        sched = _Scheduler()
+        inp = sensors.EdgeInput("TEST", PIN, changes.append, sched, **kwargs)
+        inp.start()
+        made.append(inp)
+        return inp, sched, changes
+
+    made = []
+    yield make
+    for inp in made:
+        inp.stop()
+
+
+def _edge(inp, level):
+    """Set the pin and deliver the edge callback, as RPi.GPIO's event thread would."""
+    GPIO.output(PIN, level)
+    inp._handle_edge(PIN)
+
+
+def test_initial_level_is_reported_and_resync_scheduled(edge_input):
+    inp, sched, changes = edge_input(1, resync_sec=1.0)
+
+    assert changes == [True]
+    assert inp.using_edge_detect
+    assert sched.periodic["TEST"][0] == 1.0
+
+
+def test_bounce_is_reported_once_and_final_level_after_the_window(edge_input):
+    inp, sched, changes = edge_input(0, debounce_sec=0.02)
+
+    _edge(inp, 1)
+    assert changes == [False, True]
+    assert [(d, name) for d, _, name in sched.later] == [(0.02, "TEST_DEBOUNCE")]
+
+    # Contact bounce inside the window: ignored, no further settle scheduled.
+    _edge(inp, 0)
+    _edge(inp, 1)
+    _edge(inp, 0)
+    assert changes == [False, True]
+    assert len(sched.later) == 1
+
+    # The window closes on a different level than was reported: it is read again.
+    sched.run_later()
+    assert changes == [False, True, False]
+
+    # The next edge after the window is reported at once again.
+    _edge(inp, 1)
+    assert changes == [False, True, False, True]
+
+
+def test_settle_on_the_reported_level_reports_nothing(edge_input):
+    inp, sched, changes = edge_input(0)
+
+    _edge(inp, 1)
+    _edge(inp, 0)
+    _edge(inp, 1)
+    sched.run_later()
+    assert changes == [False, True]
+
+
+def test_resync_recovers_a_lost_edge(edge_input):
+    inp, sched, changes = edge_input(0)
+    resync = sched.periodic["TEST"][1]
+
+    resync()
+    assert changes == [False]
+    GPIO.output(PIN, 1)  # the edge interrupt never arrived
+    resync()
+    assert changes == [False, True]
+
+
+def test_zero_debounce_checks_every_edge(edge_input):
+    inp, sched, changes = edge_input(0, debounce_sec=0)
+
+    _edge(inp, 1)
+    _edge(inp, 0)
+    assert changes == [False, True, False]
+    assert sched.later == []
+
+
+def test_active_low(edge_input):
+    inp, _, changes = edge_input(0, active_low=True)
+    _edge(inp, 1)
+
+    assert changes == [True, False]
+
+
+def test_polls_when_edge_detection_is_disabled(edge_input):
+    inp, sched, changes = edge_input(0, edge_detect=False, poll_sec=0.05)
+
+    assert not inp.using_edge_detect
+    period, check = sched.periodic["TEST"]
+    assert period == 0.05
+    GPIO.output(PIN, 1)
+    check()
+    assert changes == [False, True]
+
+
+def test_polls_when_edge_detection_is_unavailable(edge_input, monkeypatch):
+    def unavailable(*_args, **_kwargs):
+        raise RuntimeError("Failed to add edge detection")
+
+    monkeypatch.setattr(GPIO, "add_event_detect", unavailable)
+    inp, sched, _ = edge_input(0, poll_sec=0.05)
+
+    assert not inp.using_edge_detect
+    assert sched.periodic["TEST"][0] == 0.05
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def dht():
+    def make(readings, **kwargs):
+        clock = _Clock()
+        script = iter(readings)
+        reported = []
+        reads = []
+
+        def read_once():
+            reads.append(clock.now)
+            return next(script)
+
+        sampler = sensors.DhtSampler(read_once, lambda t, h, at: reported.append((t, h, at)), clock=clock, **kwargs)
+        return sampler, clock, reported, reads
+
+    return make
+
+
+def test_dht_reports_the_median_of_recent_good_reads(dht):
+    sampler, clock, reported, _ = dht([(20.0, 50.0), (21.0, 51.0), (35.0, 49.0), (22.0, 52.0)], window=3, period_sec=2.0)
+
+    for t in (0.0, 2.0, 4.0, 6.0):
+        clock.now = t
+        sampler()
+
+    assert [(t, h) for t, h, _ in reported] == [(20.0, 50.0), (20.5, 50.5), (21.0, 50.0), (22.0, 51.0)]
+    assert reported[-1][2] == 6.0
+
+
+def test_dht_reads_only_when_due(dht):
+    sampler, clock, _, reads = dht([(20.0, 50.0), (20.0, 50.0)], period_sec=2.0)
+
+    for t in (0.0, 1.0, 1.9, 2.0):
+        clock.now = t
+        sampler()
+    assert reads == [0.0, 2.0]
+
+
+def test_dht_failures_back_off_exponentially_up_to_the_cap(dht):
+    sampler, clock, reported, reads = dht(
+        [(None, None)] * 4 + [(20.0, 50.0)], period_sec=2.0, retry_sec=1.0, max_backoff_sec=5.0
+    )
+
+    # Ticking every 0.5 s like the scheduler does: reads at 0, +1, +2, +4, then capped at +5.
+    for step in range(30):
+        clock.now = step * 0.5
+        sampler()
+        if reported:
+            break
+    assert reads == [0.0, 1.0, 3.0, 7.0, 12.0]
+    assert sampler.consecutive_failures == 0
+    assert reported == [(20.0, 50.0, 12.0)]
+
+
+def test_dht_out_of_range_reads_are_failures_and_keep_the_last_value(dht):
+    sampler, clock, reported, _ = dht([(20.0, 50.0), (200.0, 50.0), (20.0, 120.0)], period_sec=2.0, retry_sec=1.0)
+
+    for t in (0.0, 2.0, 3.0):
+        clock.now = t
+        sampler()
+
+    assert reported == [(20.0, 50.0, 0.0)]
+    assert sampler.consecutive_failures == 2
+    assert sampler.failure_ratio == pytest.approx(2 / 3)
@@ -0,0 +1,413 @@
+# utils/metrics.py
+#
+# Tiny in-process metrics registry (counters, gauges, histograms) with a
+# Prometheus text renderer. Each process owns one `registry`; the master and
+# peripheral ship `registry.snapshot()` over MQTT/UART and the web server
+# renders everything on /metrics with a `process` label. Over the UART the
+# snapshot goes as compact_snapshot(), cut into small frames by split_compact().
+
+import bisect
+import json
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "_value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def value(self):
+        return self._value
+
+
+class _GaugeChild:
+    __slots__ = ("_lock", "_value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        # Single attribute store; atomic under the GIL.
+        self._value = float(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value -= amount
+
+    def value(self):
+        return self._value
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_bounds", "_counts", "_sum", "_count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+    def value(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, n = self._sum, self._count
+        cumulative = []
+        acc = 0
+        for c in counts[:-1]:
+            acc += c
+            cumulative.append(acc)
+        return {"b": list(self._bounds), "c": cumulative, "s": total, "n": n}
+
+
+class _Timer:
+    __slots__ = ("_child", "_t0")
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+        self._t0 = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self._child.observe(time.perf_counter() - self._t0)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def samples(self) -> List[list]:
+        with self._lock:
+            items = list(self._children.items())
+        return [[dict(zip(self.labelnames, k)), c.value()] for k, c in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default.dec(amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self._bounds = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self._bounds)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def time(self) -> _Timer:
+        return self._default.time()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"metric {metric.name} already registered with a different shape")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(
+        self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, dict]:
+        """JSON-serialisable copy of every metric, suitable for shipping to another process."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: {"type": m.kind, "help": m.help, "samples": m.samples()} for m in metrics}
+
+
+_KIND_CODES = {"counter": "c", "gauge": "g", "histogram": "h"}
+_KIND_NAMES = {code: kind for kind, code in _KIND_CODES.items()}
+
+
+def _compact_number(v: float):
+    v = float(v)
+    if v.is_integer():
+        return int(v)
+    return float(f"{v:.6g}")
+
+
+def compact_snapshot(snapshot: Dict[str, dict]) -> Dict[str, list]:
+    """`snapshot` without help texts or repeated keys, for the UART.
+
+    Each family becomes [kind, labelnames, rows], plus the bucket bounds for
+    histograms. A row is the label values followed by the value; a histogram
+    value is [cumulative counts, sum, count]. Families without samples are left
+    out. expand_snapshot() turns it back into a snapshot (with empty help).
+    """
+    out: Dict[str, list] = {}
+    for name, fam in snapshot.items():
+        samples = fam.get("samples") or []
+        if not samples:
+            continue
+        kind = fam.get("type", "")
+        labelnames = list(samples[0][0])
+        rows = []
+        for labels, value in samples:
+            if kind == "histogram":
+                value = [value["c"], _compact_number(value["s"]), value["n"]]
+            else:
+                value = _compact_number(value)
+            rows.append([labels.get(k, "") for k in labelnames] + [value])
+        family = [_KIND_CODES.get(kind, kind), labelnames, rows]
+        if kind == "histogram":
+            family.append(samples[0][1]["b"])
+        out[name] = family
+    return out
+
+
+def expand_snapshot(compact: Dict[str, list]) -> Dict[str, dict]:
+    """Inverse of compact_snapshot(); malformed families are skipped."""
+    out: Dict[str, dict] = {}
+    for name, family in compact.items():
+        try:
+            kind = _KIND_NAMES.get(family[0], family[0])
+            labelnames, rows = family[1], family[2]
+            samples = []
+            for row in rows:
+                labels = dict(zip(labelnames, row[:-1]))
+                value = row[-1]
+                if kind == "histogram":
+                    value = {"b": family[3], "c": value[0], "s": value[1], "n": value[2]}
+                samples.append([labels, value])
+        except (IndexError, KeyError, TypeError):
+            continue
+        out[name] = {"type": kind, "help": "", "samples": samples}
+    return out
+
+
+def split_compact(compact: Dict[str, list], max_bytes: int) -> List[Dict[str, list]]:
+    """Group the families of a compact snapshot into parts of about `max_bytes` of JSON each.
+
+    A family larger than `max_bytes` gets a part of its own.
+    """
+    parts: List[Dict[str, list]] = []
+    part: Dict[str, list] = {}
+    size = 0
+    for name, family in compact.items():
+        n = len(name) + len(json.dumps(family, separators=(",", ":"))) + 4
+        if part and size + n > max_bytes:
+            parts.append(part)
+            part, size = {}, 0
+        part[name] = family
+        size += n
+    if part:
+        parts.append(part)
+    return parts
+
+
+def _fmt_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels.items():
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+def render_text(snapshots: Dict[str, Dict[str, dict]]) -> str:
+    """Render {process: snapshot} as Prometheus text exposition format."""
+    families: Dict[str, dict] = {}
+    for process, snap in snapshots.items():
+        for name, fam in (snap or {}).items():
+            merged = families.setdefault(name, {"type": fam.get("type", "untyped"), "help": fam.get("help", ""), "rows": []})
+            for labels, value in fam.get("samples", []):
+                merged["rows"].append(({"process": process, **labels}, value))
+
+    lines: List[str] = []
+    for name in sorted(families):
+        fam = families[name]
+        if fam["help"]:
+            lines.append(f"# HELP {name} {fam['help']}")
+        lines.append(f"# TYPE {name} {fam['type']}")
+        for labels, value in fam["rows"]:
+            if fam["type"] == "histogram":
+                for bound, count in zip(value["b"] + [float("inf")], value["c"] + [value["n"]]):
+                    le = _fmt_labels({**labels, "le": _fmt_value(bound)})
+                    lines.append(f"{name}_bucket{le} {count}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_value(value['s'])}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {value['n']}")
+            else:
+                lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+_LOOP_LAG = registry.histogram(
+    "loop_lag_seconds",
+    "Scheduling lag of periodic loops (actual minus intended wakeup).",
+    ["loop"],
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+_timers_lock = threading.Lock()
+_timers: List["LoopTimer"] = []
+
+
+def loop_timers() -> List["LoopTimer"]:
+    with _timers_lock:
+        return list(_timers)
+
+
+class LoopTimer:
+    """Deadline-based pacing for a periodic loop that records wakeup lag.
+
+    Replaces a trailing `time.sleep(period)`: the loop wakes on a fixed grid,
+    so time spent in the loop body no longer stretches the period.
+    """
+
+    def __init__(self, name: str, period: float):
+        self.name = name
+        self.period = float(period)
+        self._next: Optional[float] = None
+        self._lag = _LOOP_LAG.labels(name)
+        # Window stats for the profiler's periodic report; see take_window().
+        self._win_n = 0
+        self._win_sum = 0.0
+        self._win_max = 0.0
+        self._win_overruns = 0
+        with _timers_lock:
+            _timers.append(self)
+
+    def take_window(self) -> Tuple[int, float, float, int]:
+        """Return (wakeups, mean lag, max lag, overruns) since the last call and reset."""
+        n, total, worst, overruns = self._win_n, self._win_sum, self._win_max, self._win_overruns
+        self._win_n, self._win_sum, self._win_max, self._win_overruns = 0, 0.0, 0.0, 0
+        return n, (total / n if n else 0.0), worst, overruns
+
+    def reset(self) -> None:
+        """Forget the grid, e.g. after a deliberate long pause such as calibration."""
+        self._next = None
+
+    def sleep(self, period: Optional[float] = None) -> None:
+        p = self.period if period is None else float(period)
+        now = time.monotonic()
+        if self._next is None:
+            self._next = now
+        self._next += p
+        delay = self._next - now
+        if delay > 0:
+            time.sleep(delay)
+        woke = time.monotonic()
+        lag = max(0.0, woke - self._next)
+        if self.record(lag, p):
+            # Fell a whole period behind: re-anchor instead of bursting to catch up.
+            self._next = woke
+
+    def record(self, lag: float, period: Optional[float] = None) -> bool:
+        """Account one wakeup `lag` seconds late, for loops paced elsewhere (e.g. by a scheduler).
+
+        Returns True if the wakeup was an overrun (more than a period late).
+        """
+        p = self.period if period is None else float(period)
+        self._lag.observe(lag)
+        self._win_n += 1
+        self._win_sum += lag
+        if lag > self._win_max:
+            self._win_max = lag
+        if lag > p:
+            self._win_overruns += 1
+            return True
+        return False
@@ -0,0 +1,155 @@
+# utils/profiler.py
+#
+# Opt-in runtime profiler for the daemon processes (--profile or
+# SMARTHOME_PROFILE=1). Every report interval it prints per-thread CPU use
+# (from /proc/self/task) and the scheduling lag of every LoopTimer. If a
+# stacks file is given it also samples all Python stacks and writes them in
+# the collapsed "frame;frame;frame count" format read by flamegraph.pl and
+# speedscope.
+
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from typing import Callable, Dict, Optional
+
+from utils.metrics import loop_timers, registry
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+_THREAD_CPU = registry.gauge("thread_cpu_percent", "CPU use per thread over the last profiler window.", ["thread"])
+
+
+def read_thread_cpu() -> Dict[int, float]:
+    """CPU seconds (user + system) consumed so far by each thread of this process."""
+    out: Dict[int, float] = {}
+    try:
+        tids = os.listdir("/proc/self/task")
+    except OSError:
+        return out
+    for tid in tids:
+        try:
+            with open(f"/proc/self/task/{tid}/stat") as f:
+                data = f.read()
+        except OSError:
+            continue
+        # comm (field 2) may contain spaces; everything after the last ')' is fixed.
+        fields = data[data.rindex(")") + 2 :].split()
+        out[int(tid)] = (int(fields[11]) + int(fields[12])) / _CLK_TCK
+    return out
+
+
+def _native_thread_name(tid: int) -> str:
+    try:
+        with open(f"/proc/self/task/{tid}/comm") as f:
+            return f.read().strip()
+    except OSError:
+        return str(tid)
+
+
+class Profiler:
+    def __init__(
+        self,
+        *,
+        report_sec: float = 30.0,
+        stacks_path: Optional[str] = None,
+        stack_hz: float = 25.0,
+        logger: Callable[[str], None] = print,
+    ):
+        self._report_sec = float(report_sec)
+        self._stacks_path = stacks_path
+        self._stack_interval = 1.0 / max(1.0, float(stack_hz))
+        self._log = logger
+
+        self._stacks: "_Tally[str]" = _Tally()
+        self._last_cpu: Dict[int, float] = {}
+        self._last_report = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._last_cpu = read_thread_cpu()
+        self._last_report = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="PROFILER", daemon=True)
+        self._thread.start()
+        where = f", stacks -> {self._stacks_path}" if self._stacks_path else ""
+        self._log(f"[PROFILE] Enabled: report every {self._report_sec:.0f}s{where}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=1.0)
+        self._write_stacks()
+
+    def _run(self) -> None:
+        interval = self._stack_interval if self._stacks_path else self._report_sec
+        own_ident = threading.get_ident()
+        while not self._stop.wait(interval):
+            if self._stacks_path:
+                self._sample_stacks(own_ident)
+            if time.monotonic() - self._last_report >= self._report_sec:
+                self._report()
+                self._write_stacks()
+
+    def _sample_stacks(self, own_ident: int) -> None:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            parts = []
+            while frame is not None:
+                code = frame.f_code
+                parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            parts.append(names.get(ident, str(ident)))
+            self._stacks[";".join(reversed(parts))] += 1
+
+    def _write_stacks(self) -> None:
+        if not self._stacks_path or not self._stacks:
+            return
+        tmp = f"{self._stacks_path}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            os.replace(tmp, self._stacks_path)
+        except OSError as e:
+            self._log(f"[PROFILE] Cannot write stacks file: {e}")
+
+    def _report(self) -> None:
+        now = time.monotonic()
+        window = max(1e-6, now - self._last_report)
+        self._last_report = now
+
+        cpu = read_thread_cpu()
+        names = {t.native_id: t.name for t in threading.enumerate() if t.native_id is not None}
+        usage = []
+        for tid, total in cpu.items():
+            delta = total - self._last_cpu.get(tid, 0.0)
+            name = names.get(tid) or _native_thread_name(tid)
+            pct = 100.0 * delta / window
+            usage.append((pct, name))
+            _THREAD_CPU.labels(name).set(pct)
+        self._last_cpu = cpu
+        usage.sort(reverse=True)
+        process_pct = sum(p for p, _ in usage)
+        top = " | ".join(f"{name} {pct:.1f}%" for pct, name in usage if pct >= 0.05) or "idle"
+        self._log(f"[PROFILE] cpu {process_pct:.1f}% over {window:.0f}s: {top}")
+
+        rows = []
+        for timer in loop_timers():
+            n, mean, worst, overruns = timer.take_window()
+            if n == 0:
+                continue
+            flag = f" OVERRUN x{overruns}" if overruns else ""
+            rows.append(f"{timer.name} {mean * 1000:.1f}/{worst * 1000:.1f}ms{flag}")
+        if rows:
+            self._log(f"[PROFILE] loop lag mean/max: {' | '.join(rows)}")
+
+
+def profiling_requested(flag: bool) -> bool:
+    return bool(flag) or os.getenv("SMARTHOME_PROFILE", "").strip().lower() in {"1", "true", "on", "yes"}
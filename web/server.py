@@ -1,12 +1,18 @@
  # web/server.py
+import base64
+import binascii
+import importlib
 import json
 import os
+import socket
 import sys
 import threading
-from typing import Any, Dict, Optional
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 import paho.mqtt.client as mqtt
 from flask import Flask, Response, jsonify, render_template, request
+from werkzeug.exceptions import RequestEntityTooLarge
 
 _PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if _PROJECT_ROOT not in sys.path:
@@ -17,6 +23,10 @@ try:
 except Exception:
     master_config = None
 
+from master_pi.ai.face_pool import FacePoolBusy
+from master_pi.ai.model_watch import ModelWatcher
+from utils.metrics import registry, render_text
+
 app = Flask(__name__, template_folder="templates", static_folder="static")
 
 _MQTT_HOST = os.getenv("SMARTHOME_MQTT_HOST", getattr(master_config, "MQTT_HOST", "localhost"))
@@ -37,6 +47,27 @@ _mqtt_started = False
 _mqtt_lock = threading.Lock()
 _mqtt_client: Optional[mqtt.Client] = None
 
+# Metrics bridged from the master (which also relays the peripheral's).
+_REMOTE_METRICS_MAX_AGE_SEC = 120.0
+_remote_metrics_lock = threading.Lock()
+_remote_metrics: Dict[str, Tuple[float, Dict[str, dict]]] = {}
+
+_HTTP_REQUESTS = registry.counter("web_http_requests_total", "HTTP requests by endpoint.", ["endpoint"])
+_SSE_CLIENTS = registry.gauge("web_sse_clients", "Connected /api/stream clients.")
+_STATE_UPDATES = registry.counter("web_state_updates_total", "State messages received from MQTT.")
+
+# While at least one dashboard is streaming, ask the peripheral to keep its
+# STATE snapshots at the active rate (re-requested every half period; 0 = off).
+_SSE_BOOST_SEC = float(os.getenv("SMARTHOME_SSE_BOOST_SEC", "30"))
+_sse_lock = threading.Lock()
+_sse_clients = 0
+_sse_booster_running = False
+
+
+@app.before_request
+def _count_request():
+    _HTTP_REQUESTS.labels(request.endpoint or "unknown").inc()
+
 
 @app.route("/")
 def dashboard():
@@ -71,50 +102,97 @@ def api_state():
     return jsonify(data)
 
 
+def _sse_boost_loop() -> None:
+    global _sse_booster_running
+    while True:
+        with _sse_lock:
+            if _sse_clients == 0:
+                _sse_booster_running = False
+                return
+        try:
+            _mqtt_publish_cmd("peripheral/state_boost", {"seconds": _SSE_BOOST_SEC})
+        except Exception as e:
+            print(f"[WEB] STATE boost request failed: {e}")
+        time.sleep(_SSE_BOOST_SEC / 2)
+
+
+def _sse_client_joined() -> None:
+    global _sse_clients, _sse_booster_running
+    _SSE_CLIENTS.inc()
+    with _sse_lock:
+        _sse_clients += 1
+        if _SSE_BOOST_SEC <= 0 or _sse_booster_running:
+            return
+        _sse_booster_running = True
+    threading.Thread(target=_sse_boost_loop, name="SSE_BOOST", daemon=True).start()
+
+
+def _sse_client_left() -> None:
+    global _sse_clients
+    _SSE_CLIENTS.dec()
+    with _sse_lock:
+        _sse_clients -= 1
+
+
 @app.route("/api/stream")
 def api_stream():
     _ensure_mqtt_started()
 
     def gen():
         last_ver = -1
-        while True:
-            with _state_changed:
-                if _state_version == last_ver:
-                    _state_changed.wait(timeout=15.0)
-                if _state_version != last_ver:
-                    payload = dict(_latest_state)
-                    last_ver = _state_version
-                else:
-                    payload = None
-
-            if payload is None:
-                yield ":keepalive\n\n"
-                continue
-
-            data = {
-                "temperature": payload.get("temperature_c"),
-                "humidity": payload.get("humidity_pct"),
-                "motion": bool(payload.get("motion", False)),
-                "flame_detected": bool(payload.get("flame_detected", False)),
-                "laser_beam_ok": bool(payload.get("laser_beam_ok", False)),
-                "crossing_detected": bool(payload.get("crossing_detected", False)),
-                "safety_laser_enabled": bool(payload.get("safety_laser_enabled", False)),
-                "door_closed": bool(payload.get("door_closed", False)),
-                "door_locked": bool(payload.get("door_locked", False)),
-                "sound_detected": bool(payload.get("sound_detected", False)),
-                "led_on": bool(payload.get("led_on", False)),
-                "buzzer_on": bool(payload.get("buzzer_on", False)),
-                "laser_on": bool(payload.get("laser_on", False)),
-                "alarm_active": bool(payload.get("alarm_active", False)),
-                "clap_toggle_enabled": bool(payload.get("clap_toggle_enabled", True)),
-                "sound_led_mode_enabled": bool(payload.get("sound_led_mode_enabled", False)),
-                "motion_led_mode_enabled": bool(payload.get("motion_led_mode_enabled", False)),
-            }
-            yield f"event: state\ndata: {json.dumps(data)}\n\n"
+        _sse_client_joined()
+        try:
+            while True:
+                with _state_changed:
+                    if _state_version == last_ver:
+                        _state_changed.wait(timeout=15.0)
+                    if _state_version != last_ver:
+                        payload = dict(_latest_state)
+                        last_ver = _state_version
+                    else:
+                        payload = None
+
+                if payload is None:
+                    yield ":keepalive\n\n"
+                    continue
+
+                data = {
+                    "temperature": payload.get("temperature_c"),
+                    "humidity": payload.get("humidity_pct"),
+                    "motion": bool(payload.get("motion", False)),
+                    "flame_detected": bool(payload.get("flame_detected", False)),
+                    "laser_beam_ok": bool(payload.get("laser_beam_ok", False)),
+                    "crossing_detected": bool(payload.get("crossing_detected", False)),
+                    "safety_laser_enabled": bool(payload.get("safety_laser_enabled", False)),
+                    "door_closed": bool(payload.get("door_closed", False)),
+                    "door_locked": bool(payload.get("door_locked", False)),
+                    "sound_detected": bool(payload.get("sound_detected", False)),
+                    "led_on": bool(payload.get("led_on", False)),
+                    "buzzer_on": bool(payload.get("buzzer_on", False)),
+                    "laser_on": bool(payload.get("laser_on", False)),
+                    "alarm_active": bool(payload.get("alarm_active", False)),
+                    "clap_toggle_enabled": bool(payload.get("clap_toggle_enabled", True)),
+                    "sound_led_mode_enabled": bool(payload.get("sound_led_mode_enabled", False)),
+                    "motion_led_mode_enabled": bool(payload.get("motion_led_mode_enabled", False)),
+                }
+                yield f"event: state\ndata: {json.dumps(data)}\n\n"
+        finally:
+            _sse_client_left()
 
     return Response(gen(), mimetype="text/event-stream")
 
 
+@app.route("/metrics")
+def metrics():
+    now = time.time()
+    snapshots = {"web": registry.snapshot()}
+    with _remote_metrics_lock:
+        for process, (received_at, snap) in _remote_metrics.items():
+            if now - received_at <= _REMOTE_METRICS_MAX_AGE_SEC:
+                snapshots[process] = snap
+    return Response(render_text(snapshots), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/api/toggle_led", methods=["POST"])
 def api_toggle_led():
     try:
@@ -239,10 +317,26 @@ def _on_mqtt_connect(_client, _userdata, _flags, rc, _properties=None):
         print(f"[WEB][MQTT] Connect failed rc={rc}")
         return
     _client.subscribe(_mqtt_topic("state"))
+    _client.subscribe(_mqtt_topic("metrics/+"))
+
+
+def _on_remote_metrics(process: str, payload: bytes) -> None:
+    try:
+        snap = json.loads(payload.decode("utf-8", errors="ignore"))
+    except Exception:
+        return
+    if not isinstance(snap, dict):
+        return
+    with _remote_metrics_lock:
+        _remote_metrics[process] = (time.time(), snap)
 
 
 def _on_mqtt_message(_client, _userdata, msg):
     global _state_version
+    metrics_prefix = _mqtt_topic("metrics/")
+    if msg.topic.startswith(metrics_prefix):
+        _on_remote_metrics(msg.topic[len(metrics_prefix) :], msg.payload)
+        return
     if msg.topic != _mqtt_topic("state"):
         return
 
@@ -254,6 +348,7 @@ def _on_mqtt_message(_client, _userdata, msg):
     except Exception:
         return
 
+    _STATE_UPDATES.inc()
     with _state_changed:
         _latest_state.clear()
         _latest_state.update(data)
@@ -279,64 +374,306 @@ def _ensure_mqtt_started() -> None:
         _mqtt_started = True
 
 
+# The face engine pulls in OpenCV, two Haar cascades and the LBPH model, which
+# takes seconds. It is loaded by a background thread once Flask is listening;
+# until then /api/face_check answers "warming up" instead of blocking.
+_FACE_WARMUP_RETRY_SEC = 1
+# Verification runs in this many worker processes (0 = in the Flask thread).
+_FACE_WORKERS = int(os.getenv("SMARTHOME_FACE_WORKERS", "2"))
+# Frames allowed to wait for a free worker before new ones are turned away.
+_FACE_QUEUE = int(os.getenv("SMARTHOME_FACE_QUEUE", "2"))
+_FACE_TIMEOUT_SEC = float(os.getenv("SMARTHOME_FACE_TIMEOUT_SEC", "5"))
+_FACE_BURST_MAX_FRAMES = 5
+# Poll interval for new model files from train_faces.py (0 = only via /api/face/reload).
+_FACE_WATCH_SEC = float(os.getenv("SMARTHOME_FACE_WATCH_SEC", "5"))
+_FACE_MAX_UPLOAD_BYTES = 4 * 1024 * 1024
+# Enforced by Werkzeug while the body is read, so chunked uploads without a
+# Content-Length are refused too (see _read_body); nothing else here takes large bodies.
+app.config["MAX_CONTENT_LENGTH"] = _FACE_MAX_UPLOAD_BYTES
+# Repeated presses with near-identical frames reuse the decision for this long (0 = off).
+_FACE_CACHE_TTL_SEC = float(os.getenv("SMARTHOME_FACE_CACHE_TTL_SEC", "2"))
+# Outcomes that say nothing about the face (engine not ready, bad upload, worker
+# failure); the next press must try again rather than get them from the cache.
+_FACE_UNCACHED_REASONS = frozenset({"model_not_loaded", "decode_error", "error"})
+_FACE_LOAD_SECONDS = registry.gauge("face_engine_load_seconds", "Time to import and build the face engine.")
+
+_face_lock = threading.Lock()
+_face_status = "cold"  # cold -> warming -> ready | error
+_face_engine = None
+_face_engine_import_error: Optional[str] = None
+_face_load_seconds: Optional[float] = None
+_face_cache = None
 
-import base64
 
-_face_engine_import_error: Optional[str] = None
+def _wait_for_listener(timeout_sec: float = 10.0) -> None:
+    host = "127.0.0.1" if _WEB_HOST in ("0.0.0.0", "") else _WEB_HOST
+    deadline = time.monotonic() + timeout_sec
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, _WEB_PORT), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+
+
+def _face_warmup(wait_for_listener: bool) -> None:
+    global _face_status, _face_engine, _face_engine_import_error, _face_load_seconds, _face_cache
+    if wait_for_listener:
+        _wait_for_listener()
+
+    t0 = time.perf_counter()
+    try:
+        if _FACE_WORKERS > 0:
+            module = importlib.import_module("master_pi.ai.face_pool")
+            t_import = time.perf_counter() - t0
+            engine = module.FacePool(
+                workers=_FACE_WORKERS,
+                max_queue=_FACE_QUEUE,
+                timeout_sec=_FACE_TIMEOUT_SEC,
+                retry_after=_FACE_WARMUP_RETRY_SEC,
+            )
+            engine.start()
+        else:
+            module = importlib.import_module("master_pi.ai.face_engine")
+            t_import = time.perf_counter() - t0
+            engine = module.get_engine()
+        if _FACE_CACHE_TTL_SEC > 0:
+            _face_cache = importlib.import_module("master_pi.ai.decision_cache").DecisionCache(
+                ttl_sec=_FACE_CACHE_TTL_SEC
+            )
+    except ImportError as e:
+        print(f"[WEB] Warning: Could not import face_engine. Face unlock will not work. Error: {e}")
+        with _face_lock:
+            _face_status, _face_engine_import_error = "error", str(e)
+        return
+    except Exception as e:
+        print(f"[WEB] Warning: Unexpected error loading face_engine: {e}")
+        with _face_lock:
+            _face_status, _face_engine_import_error = "error", str(e)
+        return
+
+    elapsed = time.perf_counter() - t0
+    _FACE_LOAD_SECONDS.set(elapsed)
+    where = f"{_FACE_WORKERS} worker process(es)" if _FACE_WORKERS > 0 else "in-process"
+    print(f"[WEB] Face engine ready in {elapsed:.2f}s, {where} (import {t_import:.2f}s, model {elapsed - t_import:.2f}s)")
+    with _face_lock:
+        _face_engine, _face_load_seconds, _face_status = engine, elapsed, "ready"
+
+    if _FACE_WATCH_SEC > 0:
+        ModelWatcher(engine.reload, poll_sec=_FACE_WATCH_SEC).start()
+
+
+def _start_face_warmup(wait_for_listener: bool = False) -> None:
+    global _face_status
+    with _face_lock:
+        if _face_status != "cold":
+            return
+        _face_status = "warming"
+    threading.Thread(target=_face_warmup, args=(wait_for_listener,), name="FACE_WARMUP", daemon=True).start()
+
+
+def _face_retry_later(status: str, error: str, retry_after: int):
+    resp = jsonify({"authorized": False, "status": status, "error": error, "retry_after": retry_after})
+    resp.headers["Retry-After"] = str(retry_after)
+    return resp, 503
+
+
+@app.route("/api/face_status")
+def api_face_status():
+    _start_face_warmup()
+    with _face_lock:
+        version = _face_engine.version if _face_engine is not None else None
+        return jsonify(
+            {
+                "status": _face_status,
+                "load_seconds": _face_load_seconds,
+                "model_version": version,
+                "decision_cache": _face_cache.stats() if _face_cache is not None else None,
+                "error": _face_engine_import_error,
+            }
+        )
+
+
+@app.route("/api/face/reload", methods=["POST"])
+def api_face_reload():
+    """Load the face model files again in the background and swap them in when ready."""
+    with _face_lock:
+        face_engine = _face_engine
+    if face_engine is None:
+        return jsonify({"ok": False, "error": "Face engine not ready"}), 503
+
+    threading.Thread(target=face_engine.reload, name="FACE_RELOAD", daemon=True).start()
+    return jsonify({"ok": True, "status": "reloading", "model_version": face_engine.version}), 202
+
+
+def _ready_face_engine():
+    """(engine, None) when face checks can run, else (None, error response)."""
+    # Covers servers that import this module without running __main__.
+    _start_face_warmup()
+    with _face_lock:
+        status, face_engine = _face_status, _face_engine
+
+    if status == "error":
+        detail = _face_engine_import_error or "Face engine not available"
+        return None, (jsonify({"authorized": False, "error": "Face engine not available", "detail": detail}), 503)
+
+    if face_engine is None:
+        return None, _face_retry_later("warming_up", "Face engine warming up", _FACE_WARMUP_RETRY_SEC)
+    return face_engine, None
+
+
+def _decode_data_url(image_data: str) -> bytes:
+    # format: "data:image/jpeg;base64,..."
+    if not isinstance(image_data, str):
+        raise ValueError("image must be a base64 data URL string")
+    if "," in image_data:
+        _header, encoded = image_data.split(",", 1)
+    else:
+        encoded = image_data
+    return base64.b64decode(encoded)
+
+
+def _read_body() -> bytes:
+    """Request body, raising RequestEntityTooLarge past MAX_CONTENT_LENGTH."""
+    stream = request.stream
+    data = stream.read()
+    # A chunked body is silently cut at the limit; reading on is what raises.
+    if len(data) >= _FACE_MAX_UPLOAD_BYTES:
+        stream.read(1)
+    return data
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def _upload_too_large(_e):
+    return jsonify({"authorized": False, "error": "Upload too large"}), 413
+
+
+def _request_frames(field: str) -> List[bytes]:
+    """
+    Encoded frames from a face check request. Accepts a raw image body
+    (Content-Type: image/jpeg), multipart form files under `field`, or the
+    original JSON body with base64 data URLs.
+    """
+    mimetype = request.mimetype or ""
+    if mimetype.startswith("image/") or mimetype == "application/octet-stream":
+        data = _read_body()
+        return [data] if data else []
+    if mimetype == "multipart/form-data":
+        return [f.read() for f in request.files.getlist(field)]
+    if not request.is_json:
+        return []
+
+    try:
+        body = json.loads(_read_body())
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        return []
+    images = body.get(field)
+    if isinstance(images, str):
+        images = [images]
+    if not isinstance(images, list):
+        return []
+    return [_decode_data_url(image_data) for image_data in images if image_data]
+
+
+def _verify_cached(face_engine, frames: List[bytes], verify):
+    """Run `verify()` unless the same frames (or, for denials, near-identical ones) were just decided.
+
+    Only grants and denials are remembered, never _FACE_UNCACHED_REASONS.
+    """
+    cache = _face_cache
+    key = cache.key(frames) if cache is not None else None
+    if key is None:
+        return verify()
+    version = face_engine.version
+    result = cache.get(key, version)
+    if result is None:
+        result = verify()
+        if result.reason not in _FACE_UNCACHED_REASONS:
+            cache.put(key, version, result)
+    return result
+
+
+def _face_decision(result):
+    if result.authorized:
+        print(f"[WEB] Face authorized: {result.name}. Unlocking door.")
+        _ensure_mqtt_started()
+        _mqtt_publish_cmd("peripheral/door_lock", {"action": "UNLOCK"})
+        return jsonify({"authorized": True, "name": result.name, "frames": result.frames})
+
+    detail = result.detail
+    print(f"[WEB] Face verification failed ({result.reason}{', ' + detail if detail else ''}).")
+    # 200 OK but denied; `reason` lets the dashboard say why (blurry, too_dark, no_face, ...)
+    body = {"authorized": False, "error": "Access Denied", "reason": result.reason, "frames": result.frames}
+    if detail:
+        body["detail"] = detail  # the failing quality measure, e.g. "brightness 31 < 40"
+    return jsonify(body), 200
 
-try:
-    from master_pi.ai.face_engine import engine as face_engine
-except ImportError as e:
-    print(f"[WEB] Warning: Could not import face_engine. Face unlock will not work. Error: {e}")
-    face_engine = None
-    _face_engine_import_error = str(e)
-except Exception as e:
-    print(f"[WEB] Warning: Unexpected error importing face_engine: {e}")
-    face_engine = None
-    _face_engine_import_error = str(e)
 
 @app.route("/api/face_check", methods=["POST"])
 def api_face_check():
     """
-    Receives a captured frame (base64 encoded JPEG), verifies identity,
-    and opens the door if authorized.
+    Receives a captured frame (raw JPEG, multipart or base64 JSON), verifies
+    identity, and opens the door if authorized.
     """
-    if face_engine is None:
-        detail = _face_engine_import_error or "Face engine not available"
-        return jsonify({"authorized": False, "error": "Face engine not available", "detail": detail}), 503
+    face_engine, error = _ready_face_engine()
+    if error is not None:
+        return error
 
+    # Bodies over MAX_CONTENT_LENGTH raise RequestEntityTooLarge while read here (413).
     try:
-        body = request.get_json(silent=True) or {}
-        image_data = body.get("image") # format: "data:image/jpeg;base64,..."
+        frames = _request_frames("image")
+    except (binascii.Error, ValueError) as e:
+        return jsonify({"authorized": False, "error": "Invalid image data", "detail": str(e)}), 400
+    if not frames:
+        return jsonify({"authorized": False, "error": "No image data"}), 400
 
-        if not image_data:
-            return jsonify({"authorized": False, "error": "No image data"}), 400
+    image_bytes = frames[0]
 
-        # Parse base64
-        if "," in image_data:
-            header, encoded = image_data.split(",", 1)
-        else:
-            encoded = image_data
+    # Verify Face
+    try:
+        result = _verify_cached(face_engine, [image_bytes], lambda: face_engine.verify_face_detailed(image_bytes))
+        return _face_decision(result)
+    except FacePoolBusy as e:
+        # Worker pool overloaded or past the deadline: tell the client when to retry.
+        return _face_retry_later("busy", str(e), e.retry_after)
+    except Exception as e:
+        print(f"[WEB] Error in /api/face_check: {e}")
+        return jsonify({"authorized": False, "error": str(e)}), 500
 
-        image_bytes = base64.b64decode(encoded)
 
-        # Verify Face
-        authorized, name = face_engine.verify_face(image_bytes)
+@app.route("/api/face_check_burst", methods=["POST"])
+def api_face_check_burst():
+    """
+    Like /api/face_check, but for a short burst of frames (multipart files
+    or JSON data URLs, both under "images").
+    The face is detected once and tracked, and the frames vote on the identity.
+    """
+    face_engine, error = _ready_face_engine()
+    if error is not None:
+        return error
 
-        if authorized:
-            print(f"[WEB] Face authorized: {name}. Unlocking door.")
-            _ensure_mqtt_started()
-            _mqtt_publish_cmd("peripheral/door_lock", {"action": "UNLOCK"})
-            return jsonify({"authorized": True, "name": name})
-        
-        else:
-            print("[WEB] Face verification failed.")
-            return jsonify({"authorized": False, "error": "Access Denied"}), 200 # 200 OK but denied
+    # Bodies over MAX_CONTENT_LENGTH raise RequestEntityTooLarge while read here (413).
+    try:
+        frames = _request_frames("images")
+    except (binascii.Error, ValueError) as e:
+        return jsonify({"authorized": False, "error": "Invalid image data", "detail": str(e)}), 400
+    if not frames:
+        return jsonify({"authorized": False, "error": "No image data"}), 400
+    if len(frames) > _FACE_BURST_MAX_FRAMES:
+        return jsonify({"authorized": False, "error": f"At most {_FACE_BURST_MAX_FRAMES} frames"}), 400
 
+    try:
+        result = _verify_cached(face_engine, frames, lambda: face_engine.verify_burst(frames))
+        return _face_decision(result)
+    except FacePoolBusy as e:
+        return _face_retry_later("busy", str(e), e.retry_after)
     except Exception as e:
-        print(f"[WEB] Error in /api/face_check: {e}")
+        print(f"[WEB] Error in /api/face_check_burst: {e}")
         return jsonify({"authorized": False, "error": str(e)}), 500
 
 if __name__ == "__main__":
     _ensure_mqtt_started()
+    _start_face_warmup(wait_for_listener=True)
     app.run(host=_WEB_HOST, port=_WEB_PORT, debug=False)
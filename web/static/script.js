@@ -21,6 +21,20 @@ async function apiPost(url, body = null) {
   return data;
 }
 
+async function apiPostForm(url, form) {
+  const res = await fetch(url, { method: "POST", body: form });
+  let data = null;
+  try {
+    data = await res.json();
+  } catch (e) {
+    data = {};
+  }
+  if (!res.ok) {
+    return { ...data, _http_status: res.status };
+  }
+  return data;
+}
+
 let lastFlameDetected = false;
 let lastFireModalAtMs = 0;
 
@@ -308,6 +322,16 @@ function setupControls() {
 }
 
 
+const FACE_BURST_FRAMES = 3;
+const FACE_BURST_GAP_MS = 120;
+const FACE_REASON_TEXT = {
+  too_dark: "too dark, turn on a light",
+  too_bright: "too bright, avoid backlight",
+  low_contrast: "image is washed out",
+  blurry: "image is blurry, hold still",
+  no_face: "no face found, look at the camera",
+};
+
 function setupFaceUnlock() {
   const video = document.getElementById('video-feed');
   const canvas = document.getElementById('capture-canvas');
@@ -347,23 +371,37 @@ function setupFaceUnlock() {
       return;
     }
 
-    // Capture frame
-    const context = canvas.getContext('2d');
-    context.drawImage(video, 0, 0, 320, 240);
-    const dataUrl = canvas.toDataURL('image/jpeg');
-    
     statusText.innerText = "Verifying...";
     statusText.style.color = "#888"; // reset color
+
+    // Capture a short burst; the server tracks the face and lets the frames vote
+    // Frames go up as binary JPEG parts, not base64 inside JSON
+    const context = canvas.getContext('2d');
+    const form = new FormData();
+    for (let i = 0; i < FACE_BURST_FRAMES; i++) {
+      if (i > 0) await new Promise(r => setTimeout(r, FACE_BURST_GAP_MS));
+      context.drawImage(video, 0, 0, 320, 240);
+      const blob = await new Promise(r => canvas.toBlob(r, 'image/jpeg', 0.9));
+      form.append('images', blob, `frame${i}.jpg`);
+    }
     
     try {
-      const result = await apiPost('/api/face_check', { image: dataUrl });
+      const result = await apiPostForm('/api/face_check_burst', form);
       
       if (result.authorized) {
         statusText.innerText = `Access GRANTED: ${result.name}`;
         statusText.style.color = "green";
+      } else if (result.status === "warming_up") {
+        statusText.innerText = "Face engine is starting, try again in a moment.";
+        statusText.style.color = "#888";
+      } else if (result.status === "busy") {
+        statusText.innerText = `Face check is busy, try again in ${result.retry_after || 1}s.`;
+        statusText.style.color = "#888";
       } else {
         const extra = result && result._http_status === 503 && result.detail ? ` (${result.detail})` : "";
-        statusText.innerText = `Access DENIED: ${result.error || "Unknown"}${extra}`;
+        const hint = FACE_REASON_TEXT[result.reason];
+        const measure = hint && result.detail ? ` (${result.detail})` : "";
+        statusText.innerText = hint ? `Access DENIED: ${hint}${measure}` : `Access DENIED: ${result.error || "Unknown"}${extra}`;
         statusText.style.color = "red";
       }
     } catch (e) {